@@ -1,21 +1,28 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from starlette import status
 from tortoise.exceptions import IntegrityError
-
-from application.api.auth import get_current_user
-from application.db.app_models import (Assignment, Enrollment, Submission,
-                                       User, UserRole)
+from tortoise.transactions import in_transaction
+
+from application.api.auth import get_token_user
+from application.cache import response_cache
+from application.db.app_models import (Assignment, Course, Enrollment,
+                                       Submission, UserRole)
+from application.db.checks import submission_check
+from application.db.routing import PRIMARY
+from application.jobs import enqueue
 from application.pydantic import (AssignmentCreate, AssignmentCreateResponse,
-                                  CustomAssignment_Pydantic, SubmissionCreate)
+                                  CustomAssignment_Pydantic, SubmissionCreate,
+                                  TokenUser)
+from application.tasks import notify_submission_received
 
 router = APIRouter()
 
 
 @router.post("/create-assignment/", response_model=AssignmentCreateResponse, status_code=status.HTTP_201_CREATED)
 async def create_assignment(assignment: AssignmentCreate,
-                            current_user: User = Depends(get_current_user)) -> AssignmentCreateResponse:
+                            current_user: TokenUser = Depends(get_token_user)) -> AssignmentCreateResponse:
     if current_user.role != UserRole.TEACHER:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only teachers can create courses")
 
@@ -35,26 +42,35 @@ async def create_assignment(assignment: AssignmentCreate,
     except IntegrityError:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database Integrity error")
 
+    # drop the cached assignment listings that now miss this assignment
+    await response_cache.invalidate("course-assignments", new_assignment.course_id)
+    teacher_id = await Course.filter(id=new_assignment.course_id).first().values_list("teacher_id", flat=True)
+    await response_cache.invalidate("teacher-assignments", teacher_id)
+
     return AssignmentCreateResponse(message=f"Assignment created successfully, title: {new_assignment.title}")
 
 
 @router.get("/teacher/assignments", response_model=List[CustomAssignment_Pydantic], status_code=status.HTTP_200_OK)
-async def get_teacher_assignments(current_user: User = Depends(get_current_user)) -> List[AssignmentCreate]:
+async def get_teacher_assignments(request: Request, current_user: TokenUser = Depends(get_token_user)) -> List[AssignmentCreate]:
     if current_user.role != UserRole.TEACHER:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
 
-    # Fetch assignments taught by current teacher
-    assignments = await Assignment.filter(course__teacher_id=current_user.id).all()
+    async def build() -> List[CustomAssignment_Pydantic]:
+        # Fetch assignments taught by current teacher
+        assignments = await Assignment.filter(course__teacher_id=current_user.id).all()
+
+        if not assignments:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No assignments found")
 
-    if not assignments:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No assignments found")
+        return [CustomAssignment_Pydantic.from_orm(assignment) for assignment in assignments]
 
-    return [CustomAssignment_Pydantic.from_orm(assignment) for assignment in assignments]
+    return await response_cache.respond(request, "teacher-assignments", current_user.id, build)
 
 
 @router.get("/student/assignments/{course_id}", response_model=List[CustomAssignment_Pydantic],
             status_code=status.HTTP_200_OK)
-async def get_student_assignments_for_a_course(course_id: int, current_user: User = Depends(get_current_user)) -> List[CustomAssignment_Pydantic]:
+async def get_student_assignments_for_a_course(course_id: int, request: Request,
+                                               current_user: TokenUser = Depends(get_token_user)) -> List[CustomAssignment_Pydantic]:
     # check for a student role
     if current_user.role != UserRole.STUDENT:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
@@ -62,35 +78,39 @@ async def get_student_assignments_for_a_course(course_id: int, current_user: Use
     # Check if the student is actually enrolled in the course
     await Enrollment.filter(student_id=current_user.id, course_id=course_id).exists()
 
-    # Fetch assignments for the course
-    assignments = await Assignment.filter(course__id=course_id).all()
-    if not assignments:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No assignments found for this course")
+    async def build() -> List[CustomAssignment_Pydantic]:
+        # Fetch assignments for the course
+        assignments = await Assignment.filter(course__id=course_id).all()
+        if not assignments:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No assignments found for this course")
 
-    return [CustomAssignment_Pydantic.from_orm(assignment) for assignment in assignments]
+        return [CustomAssignment_Pydantic.from_orm(assignment) for assignment in assignments]
+
+    # the listing is the same for every student of the course, so it is cached per course
+    return await response_cache.respond(request, "course-assignments", course_id, build)
 
 
 @router.post("/student/submit-assignment/", status_code=status.HTTP_201_CREATED)
-async def submit_assignment(submission_data: SubmissionCreate, current_user: User = Depends(get_current_user)):
+async def submit_assignment(submission_data: SubmissionCreate, current_user: TokenUser = Depends(get_token_user)):
     if current_user.role != UserRole.STUDENT:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
 
-    # validate if the assignment exists
-    assignment = await Assignment.get_or_none(id=submission_data.assignment_id)
-
-    if not assignment:
+    # assignment exists and the student is enrolled in its course, checked in one query
+    check = await submission_check(submission_data.assignment_id, current_user.id)
+    if not check:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Assignment not found")
 
-    # validate if a student is enrolled in the course of th assignment
-    is_enrolled = await Enrollment.filter(student_id=current_user.id, course_id=assignment.course_id).exists()
-    if not is_enrolled:
+    if not check["enrolled"]:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enrolled in this course")
 
-    # Create the submission
-    new_submission = await Submission.create(
-        student_id=current_user.id,
-        assignment_id=submission_data.assignment_id,
-        file_path=submission_data.file_path
-    )
+    # Create the submission, the teacher is messaged by a job after the response
+    async with in_transaction(PRIMARY) as connection:
+        new_submission = await Submission.create(
+            student_id=current_user.id,
+            assignment_id=submission_data.assignment_id,
+            file_path=submission_data.file_path,
+            using_db=connection
+        )
+        await enqueue(notify_submission_received, {"submission_id": new_submission.id}, connection)
 
     return {"message": f"Successfully, submitted assignment {new_submission.id}"}
@@ -6,10 +6,11 @@ import jwt
 from fastapi import APIRouter, HTTPException, Request, Response
 from starlette import status
 
+from application.cache import TTLCache
 from application.db.app_models import User, UserRole
 from application.pydantic import (Login, LoginResponse, PasswordChange,
-                                  PasswordChangeResponse, UserCreate,
-                                  UserCreateResponse)
+                                  PasswordChangeResponse, TokenUser,
+                                  UserCreate, UserCreateResponse)
 from application.utils import async_hash_password, verify_password
 
 router = APIRouter()
@@ -17,6 +18,18 @@ router = APIRouter()
 SECRET_KEY = os.environ.get("SECRET_KEY")
 ALGORITHM = "HS256"
 
+# users resolved from a token, keyed by user id, so protected endpoints don't hit the database on every request
+user_cache = TTLCache(maxsize=int(os.environ.get("USER_CACHE_SIZE", 1024)), ttl=int(os.environ.get("USER_CACHE_TTL", 60)))
+
+
+def invalidate_user(user_id: int) -> None:
+    """ Drop a cached user, call after anything that changes the user row """
+    user_cache.pop(user_id)
+
+
+def user_claims(user: User) -> dict:
+    return {"username": user.username, "user_id": user.id, "role": user.role.value}
+
 
 def create_access_token(data: dict, expires_delta: timedelta = timedelta(minutes=40)) -> str:
     to_encode = data.copy()
@@ -57,8 +70,10 @@ async def login(response: Response, user_data: Login) -> LoginResponse:
     user = await User.filter(username=user_data.username).first()
     if not user or not await verify_password(user_data.password, user.password_hash):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid username or password")
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User account is deactivated")
 
-    access_token = create_access_token(data={"username": user.username})
+    access_token = create_access_token(data=user_claims(user))
 
     response.set_cookie(key="access_token", value=access_token, httponly=True, secure=True)
     return LoginResponse(message="Login successful")
@@ -69,14 +84,17 @@ async def change_password(user_data: PasswordChange) -> PasswordChangeResponse:
     user = await User.filter(username=user_data.username).first()
     if not user or not await verify_password(user_data.password, user.password_hash):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid username or old password")
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User account is deactivated")
 
     new_hashed_password = await async_hash_password(user_data.new_password)
     user.password_hash = new_hashed_password
     await user.save()
+    invalidate_user(user.id)
     return PasswordChangeResponse(message="Password changed successfully")
 
 
-async def get_current_user(request: Request) -> User:
+def get_token_payload(request: Request) -> dict:
     token = request.cookies.get("access_token")
     if not token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not authenticated")
@@ -85,9 +103,35 @@ async def get_current_user(request: Request) -> User:
     if payload is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not authenticated")
 
-    username = payload.get("username")
-    user = await User.filter(username=username).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User is not registered on this app")
+    return payload
+
+
+async def get_current_user(request: Request) -> User:
+    payload = get_token_payload(request)
+
+    user_id = payload.get("user_id")
+    user = user_cache.get(user_id) if user_id is not None else None
+    if user is None:
+        # tokens issued before user_id was added to the claims only carry the username
+        if user_id is not None:
+            user = await User.filter(id=user_id).first()
+        else:
+            user = await User.filter(username=payload.get("username")).first()
+        if not user:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User is not registered on this app")
+        user_cache.set(user.id, user)
+
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User account is deactivated")
 
     return user
+
+
+async def get_token_user(request: Request) -> TokenUser:
+    """ Identity taken from the token claims only, for endpoints that just need the id and role """
+    payload = get_token_payload(request)
+    if "user_id" in payload and "role" in payload:
+        return TokenUser(id=payload["user_id"], username=payload["username"], role=payload["role"])
+
+    user = await get_current_user(request)
+    return TokenUser(id=user.id, username=user.username, role=user.role)
@@ -1,18 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
 from starlette import status
 from tortoise.exceptions import IntegrityError
 
-from application.api.auth import get_current_user
-from application.db.app_models import Course, Enrollment, User, UserRole
+from application.api.auth import get_token_user
+from application.db.app_models import Course, Enrollment, UserRole
 from application.pydantic import (CreateCourse, CreateCourseResponse,
-                                  EnrollCourse, EnrollCourseResponse)
+                                  EnrollCourse, EnrollCourseResponse,
+                                  RosterImportResponse, TokenUser)
+from application.roster import import_roster, read_roster_csv
+from application.utils import hashing_pool
 
 router = APIRouter()
 
 
 @router.post("/create-course/", response_model=CreateCourseResponse, status_code=status.HTTP_201_CREATED)
 async def create_course(course_data: CreateCourse,
-                        current_user: User = Depends(get_current_user)) -> CreateCourseResponse:
+                        current_user: TokenUser = Depends(get_token_user)) -> CreateCourseResponse:
     if current_user.role != UserRole.TEACHER:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only teachers can create courses")
 
@@ -25,7 +28,7 @@ async def create_course(course_data: CreateCourse,
             course_code=course_data.course_code,
             title=course_data.title,
             description=course_data.description,
-            teacher=current_user
+            teacher_id=current_user.id
         )
     except IntegrityError:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database integrity error")
@@ -35,7 +38,7 @@ async def create_course(course_data: CreateCourse,
 
 @router.post("/enroll-course/", response_model=EnrollCourseResponse, status_code=status.HTTP_201_CREATED)
 async def enroll_course(enrollment_data: EnrollCourse,
-                        current_user: User = Depends(get_current_user)) -> EnrollCourseResponse:
+                        current_user: TokenUser = Depends(get_token_user)) -> EnrollCourseResponse:
     if current_user.role != UserRole.STUDENT:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only students can enroll")
 
@@ -49,6 +52,22 @@ async def enroll_course(enrollment_data: EnrollCourse,
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Already enrolled in this course")
 
     # Enroll the student
-    await Enrollment.create(student=current_user, course=course)
+    await Enrollment.create(student_id=current_user.id, course=course)
 
     return EnrollCourseResponse(message=f"Successfully enrolled in {course.title}")
+
+
+@router.post("/import-roster/", response_model=RosterImportResponse, status_code=status.HTTP_200_OK)
+async def import_course_roster(roster: UploadFile = File(...),
+                               current_user: TokenUser = Depends(get_token_user)) -> RosterImportResponse:
+    """ Register students and enroll them in your courses from a CSV, see application.roster for the columns """
+    if current_user.role != UserRole.TEACHER:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only teachers can import rosters")
+
+    try:
+        content = (await roster.read()).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Roster must be a UTF-8 encoded CSV")
+
+    # the shared pool, so imports queue behind the same bound as logins and are turned away with 503 when it is full
+    return await import_roster(read_roster_csv(content), current_user.id, hashing_pool)
@@ -0,0 +1,116 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Dict, Tuple, Type
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from starlette import status
+from tortoise import Model
+
+from application.api.auth import get_token_user
+from application.db.app_models import (Course, Enrollment, Marks, Submission,
+                                       UserRole)
+from application.db.routing import use_replica
+from application.pydantic import ExportDataset, ExportFormat, TokenUser
+
+router = APIRouter()
+
+# rows fetched per query, only one chunk is held in memory at a time
+CHUNK_SIZE = 1000
+
+# dataset -> (model, filter on the course id, {output column: queryset field})
+DATASETS: Dict[ExportDataset, Tuple[Type[Model], str, Dict[str, str]]] = {
+    ExportDataset.ROSTER: (Enrollment, "course_id", {
+        "enrollment_id": "id",
+        "student_id": "student_id",
+        "username": "student__username",
+        "first_name": "student__first_name",
+        "last_name": "student__last_name",
+        "email": "student__email",
+        "date_enrolled": "date_enrolled",
+    }),
+    ExportDataset.SUBMISSIONS: (Submission, "assignment__course_id", {
+        "submission_id": "id",
+        "student_id": "student_id",
+        "username": "student__username",
+        "assignment_id": "assignment_id",
+        "assignment_title": "assignment__title",
+        "file_path": "file_path",
+        "submitted_at": "submitted_at",
+    }),
+    ExportDataset.MARKS: (Marks, "assignment__course_id", {
+        "mark_id": "id",
+        "student_id": "student_id",
+        "username": "student__username",
+        "assignment_id": "assignment_id",
+        "assignment_title": "assignment__title",
+        "score": "score",
+        "comments": "comments",
+        "created_at": "created_at",
+        "updated_at": "updated_at",
+    }),
+}
+
+MEDIA_TYPES = {ExportFormat.CSV: "text/csv", ExportFormat.NDJSON: "application/x-ndjson"}
+
+
+async def iter_rows(dataset: ExportDataset, course_id: int) -> AsyncIterator[dict]:
+    """ Keyset paginate over the primary key so every chunk is an index range scan, not a growing offset """
+    model, course_filter, columns = DATASETS[dataset]
+    last_id = 0
+    while True:
+        chunk = await model.filter(**{course_filter: course_id, "id__gt": last_id}).order_by("id").limit(CHUNK_SIZE).values(pk="id", **columns)
+        for row in chunk:
+            # the cursor is selected on its own, whatever the output columns are
+            last_id = row.pop("pk")
+            yield row
+        if len(chunk) < CHUNK_SIZE:
+            return
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+async def stream_csv(dataset: ExportDataset, course_id: int) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(DATASETS[dataset][2]))
+    writer.writeheader()
+    async for row in iter_rows(dataset, course_id):
+        writer.writerow(row)
+        # flush whenever the buffer gets big, so the response is sent in reasonably sized pieces
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+async def stream_ndjson(dataset: ExportDataset, course_id: int) -> AsyncIterator[str]:
+    async for row in iter_rows(dataset, course_id):
+        yield json.dumps(row, default=_json_default) + "\n"
+
+
+@router.get("/courses/{course_id}/{dataset}", dependencies=[Depends(use_replica)])
+async def export_course_data(course_id: int,
+                             dataset: ExportDataset,
+                             export_format: ExportFormat = Query(ExportFormat.CSV, alias="format"),
+                             current_user: TokenUser = Depends(get_token_user)) -> StreamingResponse:
+    """ Stream the roster, submissions or marks of a course as CSV or newline delimited JSON """
+    """ http://localhost:8000/exports/courses/1/marks?format=ndjson """
+    if current_user.role != UserRole.TEACHER:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
+
+    if not await Course.filter(id=course_id, teacher_id=current_user.id).exists():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Course not found")
+
+    stream = stream_csv if export_format == ExportFormat.CSV else stream_ndjson
+    return StreamingResponse(
+        stream(dataset, course_id),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="course-{course_id}-{dataset.value}.{export_format.value}"'},
+    )
@@ -0,0 +1,180 @@
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from starlette import status
+from starlette.responses import Response
+from tortoise.transactions import in_transaction
+
+from application.api.auth import get_token_user
+from application.cache import response_cache
+from application.config import Settings, get_settings
+from application.db.app_models import (Assignment, Enrollment, StoredFile,
+                                       Submission, UserRole)
+from application.db.checks import mark_check
+from application.db.routing import PRIMARY, use_replica
+from application.jobs import enqueue
+from application.pydantic import StoredFileRead, SubmissionFileRead, TokenUser
+from application.responses import StoredFileResponse
+from application.storage import StorageBackend, get_storage, new_key, store
+from application.tasks import notify_submission_received
+from application.uploads import MultipartFile
+
+router = APIRouter()
+
+
+async def receive_file(request: Request, storage: StorageBackend, settings: Settings, prefix: str, user_id: int) -> StoredFile:
+    """ Stream the "file" field of the form into storage, the returned row is not saved yet """
+    upload = await MultipartFile(request).open()
+    key = new_key(prefix)
+    size, sha256 = await store(storage, key, upload.chunks(), settings.max_upload_bytes)
+    return StoredFile(key=key, filename=upload.filename, content_type=upload.content_type, size=size, sha256=sha256, uploaded_by_id=user_id)
+
+
+def byte_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """ (first, last) byte of a single range Range header, None to send the whole file """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        # several ranges may be answered with the whole file
+        return None
+    first, _, last = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            first, last = int(first), int(last) if last else size - 1
+        else:
+            # bytes=-500 is the last 500 bytes
+            first, last = size - int(last), size - 1
+    except ValueError:
+        return None
+    if first >= size or last < max(first, 0):
+        raise HTTPException(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, detail="Range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return max(first, 0), min(last, size - 1)
+
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def file_response(request: Request, storage: StorageBackend, stored: StoredFile) -> Response:
+    etag = f'"{stored.sha256}"'
+    headers = {"Accept-Ranges": "bytes", "ETag": etag, "Content-Disposition": content_disposition(stored.filename)}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if not stored.size:
+        return Response(b"", headers=headers, media_type=stored.content_type)
+
+    # a range of an older version of the file is answered with the whole current file
+    requested = byte_range(request.headers.get("range"), stored.size) if request.headers.get("if-range", etag) == etag else None
+    first, last = requested or (0, stored.size - 1)
+    if requested:
+        headers["Content-Range"] = f"bytes {first}-{last}/{stored.size}"
+    headers["Content-Length"] = str(last - first + 1)
+    return StoredFileResponse(storage.open(stored.key, first, last), storage.path(stored.key), first, last - first + 1,
+                              status_code=status.HTTP_206_PARTIAL_CONTENT if requested else status.HTTP_200_OK,
+                              headers=headers, media_type=stored.content_type)
+
+
+async def get_stored_file(key: Optional[str]) -> StoredFile:
+    # file_path may also hold a path from before uploads were stored here
+    stored = await StoredFile.get_or_none(key=key) if key else None
+    if not stored:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    return stored
+
+
+@router.post("/assignment/{assignment_id}", response_model=StoredFileRead, status_code=status.HTTP_201_CREATED)
+async def upload_assignment_file(assignment_id: int, request: Request,
+                                 current_user: TokenUser = Depends(get_token_user),
+                                 storage: StorageBackend = Depends(get_storage),
+                                 settings: Settings = Depends(get_settings)) -> StoredFileRead:
+    """ multipart/form-data with the file in a "file" field, replaces the assignment's current file """
+    if current_user.role != UserRole.TEACHER:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only teachers can upload assignment files")
+
+    assignment = await Assignment.filter(id=assignment_id, course__teacher_id=current_user.id).first()
+    if not assignment:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Assignment not found")
+
+    stored = await receive_file(request, storage, settings, f"assignments/{assignment_id}", current_user.id)
+    previous = assignment.file_path
+    try:
+        async with in_transaction(PRIMARY) as connection:
+            await stored.save(using_db=connection)
+            assignment.file_path = stored.key
+            await assignment.save(update_fields=["file_path"], using_db=connection)
+    except Exception:
+        await storage.delete(stored.key)
+        raise
+
+    replaced = await StoredFile.filter(key=previous).first() if previous else None
+    if replaced:
+        await replaced.delete()
+        await storage.delete(replaced.key)
+
+    # the cached assignment listings include file_path
+    await response_cache.invalidate("course-assignments", assignment.course_id)
+    await response_cache.invalidate("teacher-assignments", current_user.id)
+    return StoredFileRead.model_validate(stored)
+
+
+@router.post("/submission/{assignment_id}", response_model=SubmissionFileRead, status_code=status.HTTP_201_CREATED)
+async def upload_submission(assignment_id: int, request: Request,
+                            current_user: TokenUser = Depends(get_token_user),
+                            storage: StorageBackend = Depends(get_storage),
+                            settings: Settings = Depends(get_settings)) -> SubmissionFileRead:
+    """ Submit an assignment with a file, multipart/form-data with the file in a "file" field """
+    if current_user.role != UserRole.STUDENT:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
+
+    # assignment, enrollment and an earlier submission checked in one query, before any of the body is read
+    check = await mark_check(assignment_id, current_user.id)
+    if not check:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Assignment not found")
+    if not check["enrolled"]:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enrolled in this course")
+    if check["submitted"]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Assignment already submitted")
+
+    stored = await receive_file(request, storage, settings, f"submissions/{assignment_id}", current_user.id)
+    try:
+        async with in_transaction(PRIMARY) as connection:
+            await stored.save(using_db=connection)
+            submission = await Submission.create(student_id=current_user.id, assignment_id=assignment_id, file_path=stored.key,
+                                                 using_db=connection)
+            await enqueue(notify_submission_received, {"submission_id": submission.id}, connection)
+    except Exception:
+        await storage.delete(stored.key)
+        raise
+
+    return SubmissionFileRead(**StoredFileRead.model_validate(stored).model_dump(), submission_id=submission.id)
+
+
+@router.get("/assignment/{assignment_id}", dependencies=[Depends(use_replica)])
+async def download_assignment_file(assignment_id: int, request: Request,
+                                   current_user: TokenUser = Depends(get_token_user),
+                                   storage: StorageBackend = Depends(get_storage)) -> Response:
+    """ The assignment's file for its teacher and enrolled students, supports Range requests """
+    assignment = await Assignment.filter(id=assignment_id).first().values("file_path", "course_id", "course__teacher_id")
+    if not assignment:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Assignment not found")
+
+    if assignment["course__teacher_id"] != current_user.id and \
+            not await Enrollment.filter(student_id=current_user.id, course_id=assignment["course_id"]).exists():
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enrolled in or teaching this course")
+
+    return file_response(request, storage, await get_stored_file(assignment["file_path"]))
+
+
+@router.get("/submission/{submission_id}", dependencies=[Depends(use_replica)])
+async def download_submission_file(submission_id: int, request: Request,
+                                   current_user: TokenUser = Depends(get_token_user),
+                                   storage: StorageBackend = Depends(get_storage)) -> Response:
+    """ A submitted file for the student who submitted it and the course teacher, supports Range requests """
+    submission = await Submission.filter(id=submission_id).first().values("file_path", "student_id", "assignment__course__teacher_id")
+    if not submission or current_user.id not in (submission["student_id"], submission["assignment__course__teacher_id"]):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Submission not found")
+
+    return file_response(request, storage, await get_stored_file(submission["file_path"]))
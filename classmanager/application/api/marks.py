@@ -1,58 +1,137 @@
-from typing import List
+from typing import List, Optional, Set
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException
 from starlette import status
+from tortoise import connections
+from tortoise.transactions import in_transaction
 
-from application.api.auth import get_current_user
-from application.db.app_models import (Assignment, Enrollment, Marks,
+from application.api.auth import get_token_user
+from application.config import Settings, get_settings
+from application.db.app_models import (Assignment, Course, Enrollment, Marks,
                                        Marks_Pydantic, Submission, User,
                                        UserRole)
-from application.pydantic import CreateMark, MarkCreateResponse, UpdateMark
+from application.db.checks import mark_check
+from application.db.gradebook import (assignment_statistics, student_totals,
+                                      summary_statistics)
+from application.db.routing import PRIMARY, use_replica
+from application.jobs import enqueue, enqueue_many
+from application.pydantic import (AssignmentStatistics, BulkMarkEntry,
+                                  BulkMarkResponse, BulkMarkResult, CreateMark,
+                                  Gradebook, MarkCreateResponse, TokenUser,
+                                  UpdateMark)
+from application.responses import ModelResponse
+from application.tasks import notify_mark_posted, refresh_gradebook
+from application.utils import get_limit, get_skip
 
 router = APIRouter()
 
+# columns of Marks_Pydantic, selected with .values() so listings are one query without building model instances
+MARK_FIELDS = tuple(Marks_Pydantic.model_fields)
+
 
 @router.post("/create-mark/", response_model=MarkCreateResponse, status_code=status.HTTP_201_CREATED)
 async def create_mark(mark: CreateMark, assignment_id: int, student_id: int,
-                      current_user: User = Depends(get_current_user)) -> Marks_Pydantic:
+                      current_user: TokenUser = Depends(get_token_user),
+                      settings: Settings = Depends(get_settings)) -> Marks_Pydantic:
     if current_user.role != UserRole.TEACHER:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Only teachers can add marks")
 
-    # check if assignment exists
-    assignment = await Assignment.get_or_none(id=assignment_id)
-    if not assignment:
+    # assignment and its teacher, student role, enrollment, submission and an earlier mark checked in one query
+    check = await mark_check(assignment_id, student_id)
+    # another teacher's assignment is as good as missing
+    if not check or check["teacher_id"] != current_user.id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Assignment not found")
 
-    # Check if a student exists and is enrolled in the course
-    student = await User.get_or_none(id=student_id)
-    if not student or UserRole.STUDENT not in student.role:
+    if check["student_role"] != UserRole.STUDENT.value:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Student not found or not a student role")
 
-    is_enrolled = await Enrollment.filter(student_id=student_id, course_id=assignment.course_id).exists()
-    if not is_enrolled:
+    if not check["enrolled"]:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Student not enrolled in the course")
-    has_submitted = await Submission.filter(student_id=student_id, assignment_id=assignment_id).exists()
-    if not has_submitted:
+    if not check["submitted"]:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Student has not submitted the assignment")
-
-    # create new mark
-    new_mark = await Marks.create(
-        score=mark.score,
-        comments=mark.comments,
-        assignment_id=assignment_id,
-        student_id=student_id
-    )
+    if check["marked"]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Student already has a mark for this assignment")
+
+    # create new mark, the student is messaged and the summary refreshed by a job after the response
+    async with in_transaction(PRIMARY) as connection:
+        new_mark = await Marks.create(
+            score=mark.score,
+            comments=mark.comments,
+            assignment_id=assignment_id,
+            student_id=student_id,
+            using_db=connection
+        )
+        await enqueue(notify_mark_posted, {"assignment_id": assignment_id, "student_id": student_id}, connection)
+        if settings.gradebook_summary:
+            await enqueue(refresh_gradebook, {"assignment_ids": [assignment_id]}, connection)
 
     mark_data = await Marks_Pydantic.from_tortoise_orm(new_mark)
 
     return MarkCreateResponse(message="Mark successfully Created", mark=mark_data)
 
 
+def _bulk_mark_error(student_id: int, seen: Set[int], students: Set[int], enrolled: Set[int], submitted: Set[int],
+                     marked: Set[int]) -> Optional[str]:
+    """ Why a row of a bulk request is skipped, in the order create_mark checks, None when it is created """
+    if student_id in seen:
+        return "Student appears more than once in this request"
+    if student_id not in students:
+        return "Student not found or not a student role"
+    if student_id not in enrolled:
+        return "Student not enrolled in the course"
+    if student_id not in submitted:
+        return "Student has not submitted the assignment"
+    if student_id in marked:
+        return "Student already has a mark for this assignment"
+    return None
+
+
+@router.post("/bulk-create-marks/", response_model=BulkMarkResponse, status_code=status.HTTP_201_CREATED)
+async def bulk_create_marks(assignment_id: int,
+                            marks: List[BulkMarkEntry] = Body(..., min_length=1, max_length=1000),
+                            current_user: TokenUser = Depends(get_token_user),
+                            settings: Settings = Depends(get_settings)) -> BulkMarkResponse:
+    """ Grade many students for one assignment, rows that fail validation are reported and skipped """
+    if current_user.role != UserRole.TEACHER:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Only teachers can add marks")
+
+    assignment = await Assignment.get_or_none(id=assignment_id, course__teacher_id=current_user.id)
+    if not assignment:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Assignment not found")
+
+    # one query per check for the whole batch instead of one per student
+    student_ids = {entry.student_id for entry in marks}
+    students = set(await User.filter(id__in=student_ids, role=UserRole.STUDENT).values_list("id", flat=True))
+    enrolled = set(await Enrollment.filter(course_id=assignment.course_id, student_id__in=students).values_list("student_id", flat=True))
+    submitted = set(await Submission.filter(assignment_id=assignment_id, student_id__in=enrolled).values_list("student_id", flat=True))
+    # a retried batch must not mark the same students twice
+    marked = set(await Marks.filter(assignment_id=assignment_id, student_id__in=submitted).values_list("student_id", flat=True))
+
+    results, new_marks, seen = [], [], set()
+    for entry in marks:
+        detail = _bulk_mark_error(entry.student_id, seen, students, enrolled, submitted, marked)
+        if detail is None:
+            new_marks.append(Marks(score=entry.score, comments=entry.comments, assignment_id=assignment_id, student_id=entry.student_id))
+        seen.add(entry.student_id)
+        results.append(BulkMarkResult(student_id=entry.student_id, created=detail is None, detail=detail))
+
+    if new_marks:
+        async with in_transaction(PRIMARY) as connection:
+            await Marks.bulk_create(new_marks, using_db=connection)
+            await enqueue_many(notify_mark_posted, [{"assignment_id": assignment_id, "student_id": new_mark.student_id} for new_mark in new_marks],
+                               connection)
+            if settings.gradebook_summary:
+                await enqueue(refresh_gradebook, {"assignment_ids": [assignment_id]}, connection)
+
+    return BulkMarkResponse(message=f"{len(new_marks)} of {len(marks)} marks created", results=results)
+
+
 @router.patch("/edit-mark/{mark_id}/", response_model=MarkCreateResponse, status_code=status.HTTP_200_OK)
 async def edit_mark(
         mark_id: int,
         updated_mark: UpdateMark,
-        current_user: User = Depends(get_current_user)) -> MarkCreateResponse:
+        current_user: TokenUser = Depends(get_token_user),
+        settings: Settings = Depends(get_settings)) -> MarkCreateResponse:
     if current_user.role != UserRole.TEACHER:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Only teachers can edit marks")
 
@@ -62,7 +141,10 @@ async def edit_mark(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Mark not found")
 
     # update the mark
-    await Marks.filter(id=mark_id).update(**updated_mark.dict(exclude_unset=True))
+    async with in_transaction(PRIMARY) as connection:
+        await Marks.filter(id=mark_id).using_db(connection).update(**updated_mark.dict(exclude_unset=True))
+        if settings.gradebook_summary:
+            await enqueue(refresh_gradebook, {"assignment_ids": [mark.assignment_id]}, connection)
 
     # Fetch updated mark data
     updated_mark_data = await Marks_Pydantic.from_queryset_single(Marks.get(id=mark_id))
@@ -70,28 +152,65 @@ async def edit_mark(
     return MarkCreateResponse(message="Mark successfully updated", mark=updated_mark_data)
 
 
-@router.get("/view-student-marks/", response_model=List[Marks_Pydantic], status_code=status.HTTP_200_OK)
-async def view_student_marks(current_user: User = Depends(get_current_user)) -> List[Marks_Pydantic]:
+@router.get("/view-student-marks/", response_model=List[Marks_Pydantic], status_code=status.HTTP_200_OK, dependencies=[Depends(use_replica)])
+async def view_student_marks(skip: int = Depends(get_skip),
+                             limit: int = Depends(get_limit),
+                             current_user: TokenUser = Depends(get_token_user)) -> List[Marks_Pydantic]:
     if current_user.role != UserRole.STUDENT:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
 
     # Fetch marks for the current student
-    student_marks = await Marks.filter(student_id=current_user.id).all()
+    student_marks = await Marks.filter(student_id=current_user.id).order_by("id").offset(skip).limit(limit).values(*MARK_FIELDS)
 
     if not student_marks:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No Marks Found")
 
-    return [await Marks_Pydantic.from_tortoise_orm(mark) for mark in student_marks]
+    return ModelResponse([Marks_Pydantic(**mark) for mark in student_marks])
 
 
-@router.get("/teacher/marks/{student_id}/", response_model=List[Marks_Pydantic], status_code=status.HTTP_200_OK)
-async def get_student_marks_by_teacher(student_id: int, current_user: User = Depends(get_current_user)) -> List[Marks_Pydantic]:
+@router.get("/teacher/marks/{student_id}/", response_model=List[Marks_Pydantic], status_code=status.HTTP_200_OK, dependencies=[Depends(use_replica)])
+async def get_student_marks_by_teacher(student_id: int,
+                                       skip: int = Depends(get_skip),
+                                       limit: int = Depends(get_limit),
+                                       current_user: TokenUser = Depends(get_token_user)) -> List[Marks_Pydantic]:
     if current_user.role != UserRole.TEACHER:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
 
     # Fetch marks given by the teacher to the specified student
-    marks = await Marks.filter(student_id=student_id).all()
+    marks = await Marks.filter(student_id=student_id).order_by("id").offset(skip).limit(limit).values(*MARK_FIELDS)
     if not marks:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No marks found")
 
-    return [await Marks_Pydantic.from_tortoise_orm(mark) for mark in marks]
+    return ModelResponse([Marks_Pydantic(**mark) for mark in marks])
+
+
+@router.get("/gradebook/{course_id}/", response_model=Gradebook, status_code=status.HTTP_200_OK, dependencies=[Depends(use_replica)])
+async def get_course_gradebook(course_id: int,
+                               current_user: TokenUser = Depends(get_token_user),
+                               settings: Settings = Depends(get_settings)) -> Gradebook:
+    """ Per assignment statistics and per student totals for a course, aggregated by the database """
+    if current_user.role != UserRole.TEACHER:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
+
+    if not await Course.filter(id=course_id, teacher_id=current_user.id).exists():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Course not found")
+
+    assignments = await Assignment.filter(course_id=course_id).order_by("id").values("id", "title")
+
+    if settings.gradebook_summary:
+        stats, missing = await summary_statistics(course_id, [assignment["id"] for assignment in assignments])
+        if missing:
+            # the one write of this read, queued on the primary
+            await enqueue(refresh_gradebook, {"assignment_ids": missing}, connections.get(PRIMARY))
+    else:
+        stats = await assignment_statistics(course_id)
+    stats = {row["assignment_id"]: row for row in stats}
+
+    return ModelResponse(Gradebook(
+        course_id=course_id,
+        assignments=[
+            AssignmentStatistics(**{**stats.get(assignment["id"], {}), "assignment_id": assignment["id"], "title": assignment["title"]})
+            for assignment in assignments
+        ],
+        students=await student_totals(course_id),
+    ))
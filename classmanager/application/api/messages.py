@@ -0,0 +1,120 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from starlette import status
+from tortoise import BaseDBAsyncClient
+from tortoise.expressions import F, Q
+from tortoise.queryset import QuerySet
+from tortoise.transactions import in_transaction
+
+from application.api.auth import get_token_user
+from application.db.app_models import Message, MessageCounter, User
+from application.db.routing import PRIMARY, use_replica
+from application.pydantic import (MarkMessagesRead, MarkMessagesReadResponse,
+                                  MessageCreate, MessagePage, MessageRead,
+                                  TokenUser)
+from application.responses import ModelResponse
+from application.utils import decode_cursor, encode_cursor, get_limit
+
+router = APIRouter()
+
+
+async def unread_count(user_id: int, connection: Optional[BaseDBAsyncClient] = None) -> int:
+    unread = await MessageCounter.filter(user_id=user_id).using_db(connection).first().values_list("unread", flat=True)
+    return unread or 0
+
+
+async def add_unread(user_id: int, amount: int, connection: BaseDBAsyncClient) -> None:
+    """ Change a user's unread counter in the caller's transaction, creating the row on the first message """
+    if await MessageCounter.filter(user_id=user_id).using_db(connection).update(unread=F("unread") + amount):
+        return
+    # a concurrent first message may insert the row too, one of the inserts is ignored and both updates apply
+    await MessageCounter.bulk_create([MessageCounter(user_id=user_id)], ignore_conflicts=True, using_db=connection)
+    await MessageCounter.filter(user_id=user_id).using_db(connection).update(unread=F("unread") + amount)
+
+
+async def message_page(query: QuerySet[Message], cursor: Optional[str], limit: int) -> Tuple[List[MessageRead], Optional[str]]:
+    """ Newest first, keyset paginated on (date_sent, id) so every page is an index range scan """
+    if cursor:
+        date_sent, last_id = decode_cursor(cursor, datetime.fromisoformat, int)
+        query = query.filter(Q(date_sent__lt=date_sent) | Q(date_sent=date_sent, id__lt=last_id))
+
+    # one extra row tells us whether there is a next page
+    messages = await query.order_by("-date_sent", "-id").limit(limit + 1)
+
+    next_cursor = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        next_cursor = encode_cursor(messages[-1].date_sent.isoformat(), messages[-1].id)
+    return [MessageRead.model_validate(message) for message in messages], next_cursor
+
+
+@router.post("/", response_model=MessageRead, status_code=status.HTTP_201_CREATED)
+async def send_message(message_data: MessageCreate, current_user: TokenUser = Depends(get_token_user)) -> MessageRead:
+    if message_data.receiver_id == current_user.id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot send a message to yourself")
+
+    if not await User.filter(id=message_data.receiver_id, is_active=True).exists():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Receiver not found")
+
+    async with in_transaction(PRIMARY) as connection:
+        message = await Message.create(sender_id=current_user.id, receiver_id=message_data.receiver_id, content=message_data.content,
+                                       using_db=connection)
+        await add_unread(message_data.receiver_id, 1, connection)
+
+    return MessageRead.model_validate(message)
+
+
+@router.get("/inbox", response_model=MessagePage, status_code=status.HTTP_200_OK, dependencies=[Depends(use_replica)])
+async def inbox(cursor: str = Query(None),
+                unread_only: bool = False,
+                limit: int = Depends(get_limit),
+                current_user: TokenUser = Depends(get_token_user)) -> MessagePage:
+    """ Received messages, newest first. Pass next_cursor back to get the following page """
+    """ http://localhost:8000/messages/inbox?limit=20&unread_only=true """
+    query = Message.filter(receiver_id=current_user.id)
+    if unread_only:
+        query = query.filter(is_read=False)
+
+    results, next_cursor = await message_page(query, cursor, limit)
+    return ModelResponse(MessagePage(results=results, next_cursor=next_cursor, unread=await unread_count(current_user.id)))
+
+
+@router.get("/thread/{user_id}", response_model=MessagePage, status_code=status.HTTP_200_OK, dependencies=[Depends(use_replica)])
+async def thread(user_id: int,
+                 cursor: str = Query(None),
+                 limit: int = Depends(get_limit),
+                 current_user: TokenUser = Depends(get_token_user)) -> MessagePage:
+    """ Messages exchanged with one user in both directions, newest first """
+    query = Message.filter(Q(sender_id=current_user.id, receiver_id=user_id) | Q(sender_id=user_id, receiver_id=current_user.id))
+
+    results, next_cursor = await message_page(query, cursor, limit)
+    return ModelResponse(MessagePage(results=results, next_cursor=next_cursor, unread=await unread_count(current_user.id)))
+
+
+@router.get("/unread-count", status_code=status.HTTP_200_OK)
+async def get_unread_count(current_user: TokenUser = Depends(get_token_user)) -> dict:
+    return {"unread": await unread_count(current_user.id)}
+
+
+@router.post("/mark-read", response_model=MarkMessagesReadResponse, status_code=status.HTTP_200_OK)
+async def mark_read(selection: MarkMessagesRead, current_user: TokenUser = Depends(get_token_user)) -> MarkMessagesReadResponse:
+    """ Mark received messages as read by id, or every message up to an id, in one UPDATE """
+    if not selection.message_ids and selection.up_to_id is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Pass message_ids or up_to_id")
+
+    query = Message.filter(receiver_id=current_user.id, is_read=False)
+    if selection.message_ids:
+        query = query.filter(id__in=selection.message_ids)
+    if selection.up_to_id is not None:
+        query = query.filter(id__lte=selection.up_to_id)
+
+    async with in_transaction(PRIMARY) as connection:
+        # only rows still unread are counted, so concurrent requests can't decrement twice
+        marked = await query.using_db(connection).update(is_read=True)
+        if marked:
+            await add_unread(current_user.id, -marked, connection)
+        unread = await unread_count(current_user.id, connection)
+
+    return MarkMessagesReadResponse(marked=marked, unread=unread)
@@ -0,0 +1,134 @@
+import asyncio
+import os
+from typing import AsyncIterator, List
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette import status
+from starlette.responses import Response
+
+from application.api.auth import get_token_user
+from application.db.app_models import Course, Enrollment, Notice, UserRole
+from application.db.routing import use_replica
+from application.events import Subscription, notice_broker
+from application.pydantic import (NoticeCreate, NoticeRead, NoticeUpdate,
+                                  TokenUser)
+from application.responses import ModelResponse
+from application.utils import get_limit, get_skip
+
+router = APIRouter()
+
+# a comment line is sent when nothing else was, so proxies don't close idle streams
+HEARTBEAT_SECONDS = int(os.environ.get("SSE_HEARTBEAT_SECONDS", 15))
+
+
+async def subscribed_course_ids(current_user: TokenUser) -> List[int]:
+    if current_user.role == UserRole.TEACHER:
+        return await Course.filter(teacher_id=current_user.id).values_list("id", flat=True)
+    return await Enrollment.filter(student_id=current_user.id).values_list("course_id", flat=True)
+
+
+async def taught_notice(notice_id: int, current_user: TokenUser) -> Notice:
+    if current_user.role != UserRole.TEACHER:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only teachers can manage notices")
+    notice = await Notice.filter(id=notice_id, course__teacher_id=current_user.id).first()
+    if not notice:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Notice not found")
+    return notice
+
+
+def format_event(message: dict) -> str:
+    # only new notices carry an id, so Last-Event-ID of a reconnecting client is the newest notice it has seen
+    event_id = f"id: {message['id']}\n" if message["event"] == "created" else ""
+    return f"event: notice.{message['event']}\n{event_id}data: {message['data']}\n\n"
+
+
+async def event_stream(subscription: Subscription, missed: List[NoticeRead]) -> AsyncIterator[str]:
+    try:
+        # reconnect after 3 seconds when the connection drops
+        yield "retry: 3000\n\n"
+        for notice in missed:
+            yield format_event({"event": "created", "id": notice.id, "data": notice.model_dump_json()})
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if message is None:
+                # dropped for falling behind, the client reconnects with Last-Event-ID
+                return
+            yield format_event(message)
+    finally:
+        subscription.close()
+
+
+@router.post("/", response_model=NoticeRead, status_code=status.HTTP_201_CREATED)
+async def create_notice(notice_data: NoticeCreate, current_user: TokenUser = Depends(get_token_user)) -> NoticeRead:
+    if current_user.role != UserRole.TEACHER:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only teachers can post notices")
+
+    if not await Course.filter(id=notice_data.course_id, teacher_id=current_user.id).exists():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Course not found")
+
+    notice = NoticeRead.model_validate(await Notice.create(**notice_data.model_dump()))
+    await notice_broker.publish("created", notice)
+    return notice
+
+
+@router.get("/course/{course_id}", response_model=List[NoticeRead], status_code=status.HTTP_200_OK, dependencies=[Depends(use_replica)])
+async def list_course_notices(course_id: int,
+                              skip: int = Depends(get_skip),
+                              limit: int = Depends(get_limit),
+                              current_user: TokenUser = Depends(get_token_user)) -> List[NoticeRead]:
+    """ Notices of a course, newest first """
+    if course_id not in await subscribed_course_ids(current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enrolled in or teaching this course")
+
+    notices = await Notice.filter(course_id=course_id).order_by("-id").offset(skip).limit(limit)
+    return ModelResponse([NoticeRead.model_validate(notice) for notice in notices])
+
+
+@router.patch("/{notice_id}", response_model=NoticeRead, status_code=status.HTTP_200_OK)
+async def update_notice(notice_id: int, notice_data: NoticeUpdate, current_user: TokenUser = Depends(get_token_user)) -> NoticeRead:
+    notice = await taught_notice(notice_id, current_user)
+    notice.update_from_dict(notice_data.model_dump(exclude_unset=True))
+    await notice.save()
+
+    notice = NoticeRead.model_validate(notice)
+    await notice_broker.publish("updated", notice)
+    return notice
+
+
+@router.delete("/{notice_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_notice(notice_id: int, current_user: TokenUser = Depends(get_token_user)) -> Response:
+    notice = await taught_notice(notice_id, current_user)
+    await notice.delete()
+
+    await notice_broker.publish("deleted", NoticeRead.model_validate(notice))
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.get("/stream")
+async def stream_notices(request: Request, current_user: TokenUser = Depends(get_token_user)) -> StreamingResponse:
+    """ Server-sent events with the notices of every course the user is enrolled in or teaches """
+    """ new EventSource("http://localhost:8000/notices/stream", {withCredentials: true}) """
+    course_ids = await subscribed_course_ids(current_user)
+
+    # subscribe before reading what was missed, so nothing published in between is lost
+    subscription = await notice_broker.subscribe(course_ids)
+    missed = []
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit() and course_ids:
+        try:
+            notices = await Notice.filter(course_id__in=course_ids, id__gt=int(last_event_id)).order_by("id").limit(100)
+        except Exception:
+            subscription.close()
+            raise
+        missed = [NoticeRead.model_validate(notice) for notice in notices]
+
+    return StreamingResponse(
+        event_stream(subscription, missed),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,6 +1,12 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 
+from application.cache import response_cache
 from application.config import Settings, get_settings
+from application.db.database_config import pool_stats
+from application.events import notice_broker
+from application.jobs import queue_stats
+from application.ratelimit import rate_limiter
+from application.utils import hashing_pool
 
 router = APIRouter()
 
@@ -13,3 +19,40 @@ async def pong(settings: Settings = Depends(get_settings)) -> dict:
         "environment": settings.environment,
         "testing": settings.testing,
     }
+
+
+# password hashing pool saturation and latency
+@router.get("/hashing-pool")
+async def hashing_pool_stats() -> dict:
+    return hashing_pool.stats()
+
+
+# hit and miss counters of the read endpoint response cache
+@router.get("/response-cache")
+async def response_cache_stats() -> dict:
+    return response_cache.stats()
+
+
+# database connection pool of the worker answering the request, to size DB_POOL_MAX_SIZE per worker
+@router.get("/db-pool")
+async def db_pool_stats() -> dict:
+    return pool_stats()
+
+
+# open notice streams of this worker and events fanned out to them
+@router.get("/notice-streams")
+async def notice_stream_stats() -> dict:
+    return notice_broker.stats()
+
+
+# background job queue depth and lag, and the in-process job worker of this web worker
+@router.get("/jobs")
+async def job_stats(request: Request) -> dict:
+    worker = getattr(request.app.state, "job_worker", None)
+    return {**await queue_stats(), "worker": worker.stats() if worker else None}
+
+
+# requests allowed and limited per rate limit policy by this worker
+@router.get("/rate-limits")
+async def rate_limit_stats() -> dict:
+    return rate_limiter.stats()
@@ -1,36 +1,47 @@
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from fastapi import (APIRouter, Depends, HTTPException, Path, Query, Request,
+                     Response)
 from starlette import status
-from tortoise.expressions import Q
+from tortoise.expressions import Case, Q, When
+from tortoise.queryset import QuerySet
 
-from application.api.auth import get_current_user
+from application.api.auth import (create_access_token, get_current_user,
+                                  invalidate_user, user_claims)
+from application.cache import response_cache
 from application.db.app_models import User
-from application.pydantic import UserProfile, UserProfileUpdate
+from application.db.routing import use_replica
+from application.pydantic import UserProfile, UserProfileUpdate, UserSearchPage
+from application.responses import ModelResponse
+from application.utils import decode_cursor, encode_cursor, get_limit, get_skip
 
 router = APIRouter()
 
 
 @router.get("/", response_model=UserProfile, status_code=status.HTTP_200_OK)
-async def get_user_profile(current_user: User = Depends(get_current_user)) -> UserProfile:
-    user_profile = await User.filter(id=current_user.id).first()
-    if not user_profile:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    return UserProfile(
-        first_name=user_profile.first_name,
-        last_name=user_profile.last_name,
-        username=user_profile.username,
-        email=user_profile.email,
-        role=user_profile.role,
-        created_at=user_profile.created_at,
-        updated_at=user_profile.updated_at,
-        profile_picture=user_profile.profile_picture
-    )
+async def get_user_profile(request: Request, current_user: User = Depends(get_current_user)) -> UserProfile:
+    async def build() -> UserProfile:
+        user_profile = await User.filter(id=current_user.id).first()
+        if not user_profile:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+        return UserProfile(
+            first_name=user_profile.first_name,
+            last_name=user_profile.last_name,
+            username=user_profile.username,
+            email=user_profile.email,
+            role=user_profile.role,
+            created_at=user_profile.created_at,
+            updated_at=user_profile.updated_at,
+            profile_picture=user_profile.profile_picture
+        )
+
+    return await response_cache.respond(request, "user-profile", current_user.id, build)
 
 
 @router.patch("/{user_id}/profile", response_model=UserProfile, status_code=status.HTTP_200_OK)
 async def update_user_profile(user_data: UserProfileUpdate,
+                              response: Response,
                               user_id: int = Path(..., title="The ID  of the user to update"),
                               current_user: User = Depends(get_current_user)) -> UserProfile:
     if current_user.id != user_id:
@@ -55,6 +66,11 @@ async def update_user_profile(user_data: UserProfileUpdate,
 
     # Save the changes to the database
     await user.save()
+    invalidate_user(user.id)
+    await response_cache.invalidate("user-profile", user.id)
+
+    # username and role are token claims, issue a fresh token so they stay in sync
+    response.set_cookie(key="access_token", value=create_access_token(data=user_claims(user)), httponly=True, secure=True)
 
     return UserProfile(
         first_name=user.first_name,
@@ -68,17 +84,45 @@ async def update_user_profile(user_data: UserProfileUpdate,
     )
 
 
-# implementation of the search endpoint with pagination and rate limiting
+@router.patch("/{user_id}/deactivate", status_code=status.HTTP_204_NO_CONTENT)
+async def deactivate_user(response: Response,
+                          user_id: int = Path(..., title="The ID of the user to deactivate"),
+                          current_user: User = Depends(get_current_user)) -> None:
+    if current_user.id != user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
+
+    await User.filter(id=user_id).update(is_active=False, updated_at=datetime.utcnow())
+    invalidate_user(user_id)
+    await response_cache.invalidate("user-profile", user_id)
+    response.delete_cookie(key="access_token")
 
-def get_skip(skip: int = Query(0, alias="skip")) -> int:
-    return skip
 
+# implementation of the search endpoint with pagination, rate limited by the user_search policy of application.ratelimit
 
-def get_limit(limit: int = Query(10, alias="limit")) -> int:
-    return min(limit, 500)
+def search_queryset(q: str, role: Optional[str]) -> QuerySet[User]:
+    """ Matching users ordered by rank then id, username prefix matches rank first, then name prefixes """
+    query = User.filter()
+
+    if q:
+        # icontains compiles to UPPER(CAST(col AS VARCHAR)) LIKE ..., the expression the trigram indexes are built on
+        query = query.filter(
+            Q(username__icontains=q) | Q(first_name__icontains=q) | Q(last_name__icontains=q) | Q(email__icontains=q)
+        ).annotate(rank=Case(
+            When(username__istartswith=q, then=0),
+            When(Q(first_name__istartswith=q) | Q(last_name__istartswith=q), then=1),
+            default=2,
+        ))
+        ordering = ("rank", "id")
+    else:
+        ordering = ("id",)
+
+    if role:
+        query = query.filter(role=role)
 
+    return query.order_by(*ordering)
 
-@router.get("/search/", response_model=List[UserProfile], status_code=status.HTTP_200_OK)
+
+@router.get("/search/", response_model=List[UserProfile], status_code=status.HTTP_200_OK, dependencies=[Depends(use_replica)])
 async def search_users(
         q: str,
         role: str = Query(None, enum=["student", "teacher"]),
@@ -91,17 +135,38 @@ async def search_users(
     """ http://localhost:8000/search/?q=Doe&role=teacher """
     """ http://localhost:8000/search/?q=&role=student&skip=5&limit=10 """
 
-    query = User.filter()
+    users = await search_queryset(q, role).offset(skip).limit(limit)
 
-    if q:
-        query = query.filter(
-            Q(username__icontains=q) | Q(first_name__icontains=q) | Q(last_name__icontains=q) | Q(email__icontains=q)
-        )
+    return ModelResponse([UserProfile.from_orm(user) for user in users])
 
-    if role:
-        query = query.filter(role=role)
 
-    query = query.offset(skip).limit(limit)
-    users = await query
+@router.get("/search/page/", response_model=UserSearchPage, status_code=status.HTTP_200_OK, dependencies=[Depends(use_replica)])
+async def search_users_page(
+        q: str,
+        role: str = Query(None, enum=["student", "teacher"]),
+        cursor: str = Query(None),
+        limit: int = Depends(get_limit),
+        current_user: User = Depends(get_current_user)
+) -> UserSearchPage:
+    """ Same search as /search/ with keyset pagination, pass next_cursor back to get the following page """
+    """ http://localhost:8000/search/page/?q=John&limit=20 """
+
+    query = search_queryset(q, role)
+
+    if cursor:
+        rank, last_id = decode_cursor(cursor, int, int)
+        if q:
+            query = query.filter(Q(rank__gt=rank) | Q(rank=rank, id__gt=last_id))
+        else:
+            query = query.filter(id__gt=last_id)
+
+    # one extra row tells us whether there is a next page
+    users = await query.limit(limit + 1)
+
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        last = users[-1]
+        next_cursor = encode_cursor(getattr(last, "rank", 0), last.id)
 
-    return [UserProfile.from_orm(user) for user in users]
+    return ModelResponse(UserSearchPage(results=[UserProfile.from_orm(user) for user in users], next_cursor=next_cursor))
@@ -0,0 +1,156 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from starlette import status
+from starlette.requests import Request
+from starlette.responses import Response
+
+from application.responses import render_json
+
+
+class TTLCache:
+    """
+    In-process cache with a time to live per entry and least recently used eviction.
+    Not shared between workers, every uvicorn worker keeps its own copy.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            # expired entries are dropped lazily on read
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.pop(key, None)
+        return entry[1] if entry else None
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class CacheBackend:
+    """
+    Storage used by ResponseCache. Async so a backend shared between workers (redis, memcached) can be plugged in
+    by implementing these four methods.
+    """
+
+    async def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any) -> None:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def clear(self) -> None:
+        raise NotImplementedError
+
+
+class InMemoryCacheBackend(CacheBackend):
+    def __init__(self, maxsize: int = 4096, ttl: float = 300.0):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: Any) -> None:
+        self._cache.set(key, value)
+
+    async def delete(self, key: str) -> None:
+        self._cache.pop(key)
+
+    async def clear(self) -> None:
+        self._cache.clear()
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+class ResponseCache:
+    """
+    Caches rendered JSON bodies of read endpoints with their ETag. Entries are keyed by a namespace and a scope
+    (a user or course id) and are dropped explicitly by the endpoints that change the underlying rows.
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(namespace: str, scope: Hashable) -> str:
+        return f"{namespace}:{scope}"
+
+    async def respond(self, request: Request, namespace: str, scope: Hashable, build: Callable[[], Awaitable[Any]]) -> Response:
+        """ Serve the cached body for namespace/scope, or build, render and store it. Honours If-None-Match """
+        key = self.key(namespace, scope)
+        entry = await self.backend.get(key)
+        if entry is None:
+            self.misses += 1
+            body = render_json(await build())
+            entry = (f'"{hashlib.sha1(body, usedforsecurity=False).hexdigest()}"', body)
+            await self.backend.set(key, entry)
+        else:
+            self.hits += 1
+
+        etag, body = entry
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+    async def invalidate(self, namespace: str, scope: Hashable) -> None:
+        self.invalidations += 1
+        await self.backend.delete(self.key(namespace, scope))
+
+    async def clear(self) -> None:
+        await self.backend.clear()
+        self.hits = self.misses = self.invalidations = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+response_cache = ResponseCache(InMemoryCacheBackend(
+    maxsize=int(os.environ.get("RESPONSE_CACHE_SIZE", 4096)),
+    ttl=int(os.environ.get("RESPONSE_CACHE_TTL", 300)),
+))
@@ -1,5 +1,6 @@
 import logging
 from functools import lru_cache
+from typing import List, Optional
 
 from pydantic import AnyUrl
 from pydantic_settings import BaseSettings
@@ -11,7 +12,46 @@ log = logging.getLogger("uvicorn")
 class Settings(BaseSettings):
     environment: str = "dev"
     testing: bool = False
-    database_url: AnyUrl = None
+    database_url: Optional[AnyUrl] = None
+    # read replicas for the read-only endpoints, a JSON list in DATABASE_REPLICA_URLS
+    database_replica_urls: List[AnyUrl] = []
+    # connection pool of each worker, only used by the postgres backend. Query parameters on DATABASE_URL win
+    db_pool_min_size: int = 1
+    db_pool_max_size: int = 10
+    db_statement_cache_size: int = 100
+    db_connect_timeout: int = 10
+    # seconds an idle connection is kept open before it is closed and reopened on demand
+    db_pool_max_inactive_lifetime: float = 300.0
+    # queries served by one connection before it is replaced
+    db_pool_max_queries: int = 50000
+    # keep the assignment_stats summary table up to date and serve the gradebook from it
+    gradebook_summary: bool = False
+    # uploaded files, "local" keeps them under storage_root and "s3" in a bucket of an S3-compatible service
+    storage_backend: str = "local"
+    storage_root: str = "uploads"
+    storage_s3_endpoint: str = "https://s3.amazonaws.com"
+    storage_s3_bucket: str = ""
+    storage_s3_access_key: str = ""
+    storage_s3_secret_key: str = ""
+    storage_s3_region: str = "us-east-1"
+    max_upload_bytes: int = 100 * 1024 * 1024
+    # background jobs, every web worker runs a job worker too unless jobs_in_process is off
+    jobs_in_process: bool = True
+    jobs_concurrency: int = 10
+    jobs_poll_interval: float = 1.0
+    # seconds a claimed job may run before another worker claims it again
+    jobs_visibility_timeout: int = 300
+    # finished jobs are deleted after this many hours, failed ones are kept
+    jobs_retention_hours: int = 24
+    # per route latency, database and hashing time on /metrics, and per response in a Server-Timing header
+    metrics_enabled: bool = True
+    server_timing: bool = True
+    # log queries slower than slow_query_ms and statements a request repeats more than n_plus_one_threshold times
+    query_trace: bool = False
+    slow_query_ms: float = 100.0
+    n_plus_one_threshold: int = 10
+    # 429 responses for clients over the token bucket policies of application.ratelimit
+    rate_limit_enabled: bool = True
 
 
 # cache settings to avoid multiple loads
@@ -10,6 +10,13 @@ class UserRole(str, Enum):
     TEACHER = "teacher"
 
 
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
 class User(models.Model):
     id = fields.IntField(pk=True)
     first_name = fields.CharField(max_length=50)
@@ -42,7 +49,7 @@ class Course(models.Model):
     title = fields.CharField(max_length=100)
     description = fields.TextField(null=True)
 
-    teacher = fields.ForeignKeyField("models.User", related_name="courses_taught")
+    teacher = fields.ForeignKeyField("models.User", related_name="courses_taught", index=True)
 
     class Meta:
         table = "courses"
@@ -53,7 +60,7 @@ class Course(models.Model):
 
 class Assignment(models.Model):
     id = fields.IntField(pk=True)
-    course = fields.ForeignKeyField("models.Course", related_name="assignments")
+    course = fields.ForeignKeyField("models.Course", related_name="assignments", index=True)
     title = fields.CharField(max_length=100, index=True)
     description = fields.TextField()
     due_date = fields.DatetimeField()
@@ -72,21 +79,42 @@ class Marks(models.Model):
     id = fields.IntField(pk=True)
     score = fields.IntField()
     comments = fields.TextField(null=True)
-    student = fields.ForeignKeyField("models.User", related_name="marks")
+    student = fields.ForeignKeyField("models.User", related_name="marks", index=True)
     assignment = fields.ForeignKeyField("models.Assignment", related_name="marks")
     created_at = DatetimeField(auto_now_add=True)
     updated_at = DatetimeField(auto_now=True)
 
     class Meta:
         table = "marks"
+        # also serves the lookups by assignment_id alone
+        indexes = (("assignment", "student"),)
 
     def __str__(self):
         return f"{self.score} for {self.assignment}"
 
 
+class AssignmentStats(models.Model):
+    """ Materialized per assignment mark statistics, maintained when gradebook_summary is enabled """
+    id = fields.IntField(pk=True)
+    assignment = fields.OneToOneField("models.Assignment", related_name="stats")
+    marks_count = fields.IntField(default=0)
+    mean = fields.FloatField(null=True)
+    median = fields.FloatField(null=True)
+    min_score = fields.IntField(null=True)
+    max_score = fields.IntField(null=True)
+    stddev = fields.FloatField(null=True)
+    updated_at = DatetimeField(auto_now=True)
+
+    class Meta:
+        table = "assignment_stats"
+
+    def __str__(self):
+        return f"Statistics for {self.assignment}"
+
+
 class Notice(models.Model):
     id = fields.IntField(pk=True)
-    course = fields.ForeignKeyField("models.Course", related_name="notices")
+    course = fields.ForeignKeyField("models.Course", related_name="notices", index=True)
     title = fields.CharField(max_length=100, index=True)
     content = fields.TextField()
     date_posted = fields.DatetimeField(auto_now_add=True)
@@ -106,17 +134,33 @@ class Message(models.Model):
     receiver = fields.ForeignKeyField("models.User", related_name="messages_received")
     content = fields.TextField()
     date_sent = fields.DatetimeField(auto_now_add=True)
+    is_read = fields.BooleanField(default=False)
 
     class Meta:
         table = "messages"
+        # inbox keyset pagination, and threads between two users in either direction
+        indexes = (("receiver", "date_sent", "id"), ("sender", "receiver", "date_sent", "id"))
 
     def __str__(self):
         return f"From {self.sender} to {self.receiver}"
 
 
+class MessageCounter(models.Model):
+    """ Unread messages per user, changed in the same transaction as the messages so the inbox never counts rows """
+    id = fields.IntField(pk=True)
+    user = fields.OneToOneField("models.User", related_name="message_counter")
+    unread = fields.IntField(default=0)
+
+    class Meta:
+        table = "message_counters"
+
+    def __str__(self):
+        return f"{self.unread} unread for {self.user}"
+
+
 class Enrollment(models.Model):
     student = fields.ForeignKeyField("models.User", related_name="enrollments")
-    course = fields.ForeignKeyField("models.Course")
+    course = fields.ForeignKeyField("models.Course", index=True)
     date_enrolled = fields.DatetimeField(auto_now_add=True)
 
     class Meta:
@@ -129,7 +173,7 @@ class Enrollment(models.Model):
 
 class Submission(models.Model):
     student = fields.ForeignKeyField("models.User", related_name="submissions")
-    assignment = fields.ForeignKeyField("models.Assignment", related_name="submissions")
+    assignment = fields.ForeignKeyField("models.Assignment", related_name="submissions", index=True)
     file_path = fields.CharField(max_length=255, null=True)
     submitted_at = fields.DatetimeField(auto_now_add=True)
 
@@ -141,12 +185,64 @@ class Submission(models.Model):
         return f"{self.student} submitted for {self.assignment}"
 
 
-# Create Pydantic models
-User_Pydantic = pydantic_model_creator(User, name="User", exclude=("password_hash", "refresh_token"))
-Course_Pydantic = pydantic_model_creator(Course, name="Course")
-Assignment_Pydantic = pydantic_model_creator(Assignment, name="Assignment")
-Marks_Pydantic = pydantic_model_creator(Marks, name="Marks")
-Notice_Pydantic = pydantic_model_creator(Notice, name="Notice")
-Message_Pydantic = pydantic_model_creator(Message, name="Message")
-Enrollment_Pydantic = pydantic_model_creator(Enrollment, name="Enrollment")
-Submission_Pydantic = pydantic_model_creator(Submission, name="Submission")
+class StoredFile(models.Model):
+    """ An uploaded file in the storage backend, Assignment.file_path and Submission.file_path hold its key """
+    id = fields.IntField(pk=True)
+    key = fields.CharField(max_length=255, unique=True)
+    filename = fields.CharField(max_length=255)
+    content_type = fields.CharField(max_length=100)
+    size = fields.BigIntField()
+    sha256 = fields.CharField(max_length=64)
+    uploaded_by = fields.ForeignKeyField("models.User", related_name="files")
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "files"
+
+    def __str__(self):
+        return f"{self.filename} ({self.key})"
+
+
+class Job(models.Model):
+    """ A background job, queued and run by application.jobs """
+    id = fields.IntField(pk=True)
+    task = fields.CharField(max_length=100)
+    payload = fields.JSONField()
+    status = fields.CharEnumField(JobStatus, max_length=10, default=JobStatus.QUEUED)
+    attempts = fields.IntField(default=0)
+    max_attempts = fields.IntField(default=5)
+    # queued jobs run from run_at, running ones are claimed again once locked_until has passed
+    run_at = fields.DatetimeField()
+    locked_until = fields.DatetimeField(null=True)
+    last_error = fields.TextField(null=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
+    finished_at = fields.DatetimeField(null=True)
+
+    class Meta:
+        table = "jobs"
+        indexes = (("status", "run_at"),)
+
+    def __str__(self):
+        return f"{self.task} job {self.id} ({self.status})"
+
+
+# Pydantic models, each created on first import of its name as most are never used by a worker
+PYDANTIC_MODELS = {
+    "User_Pydantic": (User, {"name": "User", "exclude": ("password_hash", "refresh_token")}),
+    "Course_Pydantic": (Course, {"name": "Course"}),
+    "Assignment_Pydantic": (Assignment, {"name": "Assignment"}),
+    "Marks_Pydantic": (Marks, {"name": "Marks"}),
+    "Notice_Pydantic": (Notice, {"name": "Notice"}),
+    "Message_Pydantic": (Message, {"name": "Message"}),
+    "Enrollment_Pydantic": (Enrollment, {"name": "Enrollment"}),
+    "Submission_Pydantic": (Submission, {"name": "Submission"}),
+}
+
+
+def __getattr__(name: str):
+    if name not in PYDANTIC_MODELS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    model, options = PYDANTIC_MODELS[name]
+    # kept as a module attribute, later imports don't come back here
+    globals()[name] = pydantic_model = pydantic_model_creator(model, **options)
+    return pydantic_model
@@ -0,0 +1,56 @@
+"""
+Validation of the submit and mark flows in one round trip: the assignment row with an EXISTS subquery for every
+condition the endpoint checks, instead of one query per check. No row means the assignment does not exist.
+"""
+from typing import Optional
+
+from tortoise import connections
+
+from application.db.database_config import placeholders
+from application.db.routing import PRIMARY
+
+SUBMISSION_CHECK_SQL = """
+SELECT a.course_id,
+       EXISTS (SELECT 1 FROM enrollments e WHERE e.course_id = a.course_id AND e.student_id = {0}) AS enrolled
+FROM assignments a
+WHERE a.id = {1}
+"""
+
+MARK_CHECK_SQL = """
+SELECT a.course_id, c.teacher_id,
+       (SELECT u.role FROM users u WHERE u.id = {0}) AS student_role,
+       EXISTS (SELECT 1 FROM enrollments e WHERE e.course_id = a.course_id AND e.student_id = {1}) AS enrolled,
+       EXISTS (SELECT 1 FROM submissions s WHERE s.assignment_id = a.id AND s.student_id = {2}) AS submitted,
+       EXISTS (SELECT 1 FROM marks m WHERE m.assignment_id = a.id AND m.student_id = {3}) AS marked
+FROM assignments a
+JOIN courses c ON c.id = a.course_id
+WHERE a.id = {4}
+"""
+
+
+async def _check(sql: str, student_id: int, assignment_id: int, student_params: int) -> Optional[dict]:
+    # both flows write next, so validate against the primary
+    connection = connections.get(PRIMARY)
+    rows = await connection.execute_query_dict(
+        sql.format(*placeholders(connection, student_params + 1)), [*[student_id] * student_params, assignment_id])
+    if not rows:
+        return None
+    row = rows[0]
+    # sqlite returns EXISTS as 0/1
+    for key in ("enrolled", "submitted", "marked"):
+        if key in row:
+            row[key] = bool(row[key])
+    return row
+
+
+async def submission_check(assignment_id: int, student_id: int) -> Optional[dict]:
+    """ course_id and enrolled for the assignment, None when it does not exist """
+    return await _check(SUBMISSION_CHECK_SQL, student_id, assignment_id, 1)
+
+
+async def mark_check(assignment_id: int, student_id: int) -> Optional[dict]:
+    """
+    course_id, teacher_id of the course, student_role (None for no such user), enrolled, submitted and marked, None when
+    the assignment does not exist
+    """
+    return await _check(MARK_CHECK_SQL, student_id, assignment_id, 4)
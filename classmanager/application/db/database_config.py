@@ -1,24 +1,103 @@
 import os
+from typing import Iterable, List, Optional
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from pydantic import AnyUrl
+from tortoise import BaseDBAsyncClient, connections
+from tortoise.backends.base.config_generator import expand_db_url
 from tortoise.contrib.fastapi import register_tortoise
+from tortoise.exceptions import (ConfigurationError, DoesNotExist,
+                                 IntegrityError)
 
-TORTOISE_ORM = {
-    "connections": {"default": os.environ.get("DATABASE_URL")},
-    "apps": {
-        "models": {
-            "models": ["application.db.app_models", "aerich.models"],
-            "default_connection": "default",
-        },
-    },
+from application.config import Settings, get_settings
+from application.db.routing import PRIMARY, REPLICA_PREFIX
+
+MODELS = ["application.db.app_models"]
+
+# asyncpg.create_pool arguments taken from the settings
+POOL_OPTIONS = {
+    "minsize": "db_pool_min_size",
+    "maxsize": "db_pool_max_size",
+    "statement_cache_size": "db_statement_cache_size",
+    "timeout": "db_connect_timeout",
+    "max_inactive_connection_lifetime": "db_pool_max_inactive_lifetime",
+    "max_queries": "db_pool_max_queries",
 }
 
 
-def init_db(application: FastAPI) -> None:
+def connection_config(database_url: Optional[AnyUrl], settings: Settings) -> Optional[dict]:
+    """ Expand a database url and add the pool settings when it points at postgres """
+    if database_url is None:
+        return None
+    connection = expand_db_url(str(database_url))
+    if connection["engine"] == "tortoise.backends.asyncpg":
+        # asyncpg client that also records how long queries wait for a pooled connection
+        connection["engine"] = "application.db.pool"
+        for option, field in POOL_OPTIONS.items():
+            connection["credentials"].setdefault(option, getattr(settings, field))
+    return connection
+
+
+def tortoise_config(settings: Settings, models: Iterable[str] = MODELS) -> dict:
+    config = {
+        "connections": {PRIMARY: connection_config(settings.database_url, settings)},
+        "apps": {
+            "models": {
+                "models": list(models),
+                "default_connection": PRIMARY,
+            },
+        },
+    }
+    if settings.database_replica_urls:
+        config["connections"].update({
+            f"{REPLICA_PREFIX}{number}": connection_config(url, settings) for number, url in enumerate(settings.database_replica_urls)
+        })
+        config["routers"] = ["application.db.routing.ReplicaRouter"]
+    return config
+
+
+# used by aerich and the command line scripts
+TORTOISE_ORM = tortoise_config(get_settings(), models=[*MODELS, "aerich.models"])
+
+
+def init_db(application: FastAPI, settings: Optional[Settings] = None, generate_schemas: bool = False) -> None:
     register_tortoise(
         application,
-        db_url=os.environ.get("DATABASE_URL"),
-        modules={"models": ["application.db.app_models"]},
-        generate_schemas=False,
+        config=tortoise_config(settings or get_settings()),
+        generate_schemas=generate_schemas,
         add_exception_handlers=True,
     )
+
+
+def add_exception_handlers(application: FastAPI) -> None:
+    """ The responses register_tortoise adds for ORM errors, for apps that start Tortoise in their lifespan """
+    @application.exception_handler(DoesNotExist)
+    async def does_not_exist_handler(request: Request, exc: DoesNotExist) -> JSONResponse:
+        return JSONResponse(status_code=404, content={"detail": str(exc)})
+
+    @application.exception_handler(IntegrityError)
+    async def integrity_error_handler(request: Request, exc: IntegrityError) -> JSONResponse:
+        return JSONResponse(status_code=422, content={"detail": [{"loc": [], "msg": str(exc), "type": "IntegrityError"}]})
+
+
+def placeholders(connection: BaseDBAsyncClient, count: int) -> List[str]:
+    """ Positional parameter markers of the connection's dialect, for raw SQL """
+    if connection.capabilities.dialect == "postgres":
+        return [f"${position}" for position in range(1, count + 1)]
+    return ["?"] * count
+
+
+def pool_stats() -> dict:
+    """ Pool usage of this worker's default connection """
+    try:
+        client = connections.get(PRIMARY)
+    except ConfigurationError:
+        return {"pid": os.getpid(), "client": None, "pool": None}
+    pool = getattr(client, "_pool", None)
+    return {
+        "pid": os.getpid(),
+        "client": type(client).__name__,
+        # None until the first query opens the pool, and for backends without one (sqlite)
+        "pool": pool.stats() if hasattr(pool, "stats") else None,
+    }
@@ -0,0 +1,111 @@
+import math
+from typing import Dict, Iterable, List, Tuple
+
+from tortoise import BaseDBAsyncClient, connections
+
+from application.db.app_models import AssignmentStats
+from application.db.database_config import placeholders
+from application.db.routing import PRIMARY, read_connection
+
+# median comes from the middle row(s) of each assignment's ordered scores, variance from AVG(x^2) - AVG(x)^2,
+# both written with window functions and plain aggregates so the same SQL runs on postgres and sqlite
+ASSIGNMENT_STATS_SQL = """
+WITH scored AS (
+    SELECT m.assignment_id, m.score,
+           ROW_NUMBER() OVER (PARTITION BY m.assignment_id ORDER BY m.score) AS position,
+           COUNT(*) OVER (PARTITION BY m.assignment_id) AS marks_count
+    FROM marks m
+    JOIN assignments a ON a.id = m.assignment_id
+    WHERE {where}
+)
+SELECT assignment_id,
+       MAX(marks_count) AS marks_count,
+       AVG(score) AS mean,
+       AVG(CASE WHEN position IN ((marks_count + 1) / 2, (marks_count + 2) / 2) THEN score END) AS median,
+       MIN(score) AS min_score,
+       MAX(score) AS max_score,
+       AVG(score * score) - AVG(score) * AVG(score) AS variance
+FROM scored
+GROUP BY assignment_id
+"""
+
+STUDENT_TOTALS_SQL = """
+SELECT m.student_id, u.username, u.first_name, u.last_name,
+       COUNT(m.id) AS marks_count,
+       SUM(m.score) AS total,
+       AVG(m.score) AS mean
+FROM marks m
+JOIN assignments a ON a.id = m.assignment_id
+JOIN users u ON u.id = m.student_id
+WHERE a.course_id = {course_id}
+GROUP BY m.student_id, u.username, u.first_name, u.last_name
+ORDER BY m.student_id
+"""
+
+
+SUMMARY_FIELDS = ("assignment_id", "marks_count", "mean", "median", "min_score", "max_score", "stddev")
+
+# summary row of an assignment without marks
+EMPTY_STATS = {"marks_count": 0, "mean": None, "median": None, "min_score": None, "max_score": None, "stddev": None}
+
+
+def _with_stddev(row: dict) -> dict:
+    # sample standard deviation from the population variance returned by the query
+    count = row.pop("marks_count")
+    variance = float(row.pop("variance") or 0)
+    row["marks_count"] = count
+    row["stddev"] = math.sqrt(max(variance, 0.0) * count / (count - 1)) if count > 1 else 0.0
+    for key in ("mean", "median"):
+        row[key] = float(row[key]) if row[key] is not None else None
+    return row
+
+
+async def assignment_statistics(course_id: int) -> List[dict]:
+    connection = read_connection()
+    sql = ASSIGNMENT_STATS_SQL.format(where=f"a.course_id = {placeholders(connection, 1)[0]}")
+    return [_with_stddev(row) for row in await connection.execute_query_dict(sql, [course_id])]
+
+
+async def student_totals(course_id: int) -> List[dict]:
+    connection = read_connection()
+    rows = await connection.execute_query_dict(STUDENT_TOTALS_SQL.format(course_id=placeholders(connection, 1)[0]), [course_id])
+    for row in rows:
+        row["mean"] = float(row["mean"])
+    return rows
+
+
+async def compute_assignment_stats(assignment_ids: List[int], connection: BaseDBAsyncClient) -> Dict[int, dict]:
+    """ Summary rows of the given assignments by assignment id, computed from their marks on the given connection """
+    where = f"m.assignment_id IN ({', '.join(placeholders(connection, len(assignment_ids)))})"
+    rows = await connection.execute_query_dict(ASSIGNMENT_STATS_SQL.format(where=where), assignment_ids)
+    computed = {row.pop("assignment_id"): _with_stddev(row) for row in rows}
+    # assignments without marks get an empty row too, so reads don't take them for missing
+    return {assignment_id: computed.get(assignment_id, dict(EMPTY_STATS)) for assignment_id in assignment_ids}
+
+
+async def refresh_assignment_stats(assignment_ids: Iterable[int]) -> Dict[int, dict]:
+    """ Recompute the summary rows of the given assignments only, called after their marks change """
+    assignment_ids = list(set(assignment_ids))
+    if not assignment_ids:
+        return {}
+    computed = await compute_assignment_stats(assignment_ids, connections.get(PRIMARY))
+    for assignment_id, stats in computed.items():
+        await AssignmentStats.update_or_create(defaults=dict(stats), assignment_id=assignment_id)
+    return computed
+
+
+async def summary_statistics(course_id: int, assignment_ids: List[int]) -> Tuple[List[dict], List[int]]:
+    """
+    Same shape as assignment_statistics, read from the assignment_stats summary table, and the assignments that have
+    no summary row yet
+    """
+    rows = await AssignmentStats.filter(assignment__course_id=course_id).values(*SUMMARY_FIELDS)
+
+    # assignments marked before the summary was enabled are computed on this read's connection, which may be a
+    # replica, so nothing is written here. The caller has their rows built by the refresh_gradebook job
+    summarized = {row["assignment_id"] for row in rows}
+    missing = [assignment_id for assignment_id in assignment_ids if assignment_id not in summarized]
+    if missing:
+        computed = await compute_assignment_stats(missing, read_connection())
+        rows += [{"assignment_id": assignment_id, **stats} for assignment_id, stats in computed.items()]
+    return rows, missing
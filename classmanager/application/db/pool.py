@@ -0,0 +1,51 @@
+"""
+Tortoise engine for postgres: the asyncpg client, with a pool that records how long queries wait for a connection.
+Selected by database_config.connection_config through the "engine" key of the connection.
+"""
+import time
+from typing import Any, Optional
+
+from tortoise.backends.asyncpg.client import AsyncpgDBClient
+
+
+class TimedPool:
+    """ Wraps an asyncpg pool and times acquire(), every other attribute is passed through """
+
+    def __init__(self, pool: Any):
+        self._pool = pool
+        self.acquired = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    async def acquire(self, *, timeout: Optional[float] = None) -> Any:
+        start = time.perf_counter()
+        connection = await self._pool.acquire(timeout=timeout)
+        waited = time.perf_counter() - start
+        self.acquired += 1
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return connection
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pool, name)
+
+    def stats(self) -> dict:
+        size, idle = self._pool.get_size(), self._pool.get_idle_size()
+        return {
+            "min_size": self._pool.get_min_size(),
+            "max_size": self._pool.get_max_size(),
+            "size": size,
+            "in_use": size - idle,
+            "idle": idle,
+            "acquired": self.acquired,
+            "wait_seconds_avg": self.wait_seconds / self.acquired if self.acquired else 0.0,
+            "wait_seconds_max": self.max_wait_seconds,
+        }
+
+
+class TimedAsyncpgDBClient(AsyncpgDBClient):
+    async def create_pool(self, **kwargs) -> TimedPool:
+        return TimedPool(await super().create_pool(**kwargs))
+
+
+client_class = TimedAsyncpgDBClient
@@ -0,0 +1,79 @@
+"""
+Read replica routing. Endpoints that only read opt in with the use_replica dependency and their queries go to one of
+the replica connections. Everything else stays on the primary ("default") connection, and so does a client that
+wrote within the last READ_YOUR_WRITES_SECONDS, so it never reads rows older than its own change.
+"""
+import itertools
+import os
+from contextvars import ContextVar
+from typing import List, Optional, Type
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from tortoise import BaseDBAsyncClient, Model, connections
+
+PRIMARY = "default"
+REPLICA_PREFIX = "replica_"
+
+# set on write responses, the client reads from the primary while it is present
+PRIMARY_COOKIE = "read_primary"
+READ_YOUR_WRITES_SECONDS = int(os.environ.get("READ_YOUR_WRITES_SECONDS", 5))
+# per request override, "primary" skips the replicas
+CONSISTENCY_HEADER = "X-Read-Consistency"
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# connection the reads of the current request go to, every request runs in its own context
+read_connection_name: ContextVar[str] = ContextVar("read_connection_name", default=PRIMARY)
+
+_round_robin = itertools.count()
+
+
+def replica_names() -> List[str]:
+    return [name for name in connections.db_config if name.startswith(REPLICA_PREFIX)]
+
+
+def read_connection() -> BaseDBAsyncClient:
+    """ Connection for raw SQL reads, the replica picked for this request or the primary """
+    return connections.get(read_connection_name.get())
+
+
+class ReplicaRouter:
+    """ Tortoise router, only reads are ever sent to a replica """
+
+    def db_for_read(self, model: Type[Model]) -> Optional[str]:
+        name = read_connection_name.get()
+        return name if name != PRIMARY else None
+
+    def db_for_write(self, model: Type[Model]) -> Optional[str]:
+        return None
+
+
+async def use_replica(request: Request) -> None:
+    """ Dependency of read-only endpoints, routes their queries to a replica when it is safe to """
+    if request.headers.get(CONSISTENCY_HEADER, "").lower() == "primary" or PRIMARY_COOKIE in request.cookies:
+        return
+    replicas = replica_names()
+    if replicas:
+        read_connection_name.set(replicas[next(_round_robin) % len(replicas)])
+
+
+class ReadYourWritesMiddleware:
+    """ Marks clients that just changed something so their next reads stay on the primary """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                MutableHeaders(scope=message).append(
+                    "set-cookie", f"{PRIMARY_COOKIE}=1; Max-Age={READ_YOUR_WRITES_SECONDS}; Path=/; HttpOnly; SameSite=lax")
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -0,0 +1,127 @@
+"""
+Opt-in query tracing, turned on with QUERY_TRACE.
+
+Every query a request sends is recorded with its statement, the shape of its parameters (their types, never their
+values), its duration and the route it came from. Queries slower than SLOW_QUERY_MS are logged as they finish, and
+when a request is done every statement it sent more than N_PLUS_ONE_THRESHOLD times is logged as a likely N+1,
+one query per row of a loop where a single query for all the rows would do.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+from typing import Callable, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from application.metrics import DB_METHODS, client_classes
+
+log = logging.getLogger("uvicorn")
+
+# literals Tortoise inlines instead of binding, a loop over ids sends the same statement with a different number each time
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def normalize(sql: str) -> str:
+    return LITERALS.sub("?", " ".join(sql.split()))
+
+
+def params_shape(values) -> str:
+    """ "(int, str)" for one row of parameters, "12 x (int, str)" for the rows of execute_many """
+    if not values:
+        return "()"
+    if isinstance(values[0], (list, tuple)):
+        return f"{len(values)} x {params_shape(values[0])}"
+    return f"({', '.join(type(value).__name__ for value in values)})"
+
+
+@dataclass
+class TracedQuery:
+    sql: str
+    params: str
+    seconds: float
+
+
+class QueryTrace:
+    """ The queries of one request """
+
+    def __init__(self, scope: Scope, slow_ms: float = 100.0):
+        # the router adds the matched route to the scope, looked up when needed as queries run after routing
+        self.scope = scope
+        self.slow_seconds = slow_ms / 1000
+        self.queries: List[TracedQuery] = []
+        self.statements: Counter = Counter()
+        self.in_query = False
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        return f"{self.scope['method']} {getattr(route, 'path', self.scope['path'])}"
+
+    def add(self, sql: str, values, seconds: float) -> TracedQuery:
+        query = TracedQuery(sql, params_shape(values), seconds)
+        self.queries.append(query)
+        self.statements[normalize(sql)] += 1
+        return query
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """ Statements sent more than threshold times """
+        return [(statement, count) for statement, count in self.statements.most_common() if count > threshold]
+
+
+query_trace: ContextVar[Optional[QueryTrace]] = ContextVar("query_trace", default=None)
+
+
+def _traced_query(method: Callable) -> Callable:
+    @wraps(method)
+    async def wrapper(self, query, *args, **kwargs):
+        trace = query_trace.get()
+        if trace is None or trace.in_query:
+            return await method(self, query, *args, **kwargs)
+        trace.in_query = True
+        started = time.perf_counter()
+        try:
+            return await method(self, query, *args, **kwargs)
+        finally:
+            # execute_script takes no values
+            traced = trace.add(query, args[0] if args else kwargs.get("values"), time.perf_counter() - started)
+            trace.in_query = False
+            if traced.seconds >= trace.slow_seconds:
+                log.warning("Slow query %.1fms in %s, params %s: %s", traced.seconds * 1000, trace.route, traced.params, traced.sql)
+    wrapper.traced = True
+    return wrapper
+
+
+def instrument_queries() -> None:
+    """ Trace the query methods of every Tortoise client class, safe to call more than once """
+    for cls in client_classes():
+        for name in DB_METHODS:
+            method = cls.__dict__.get(name)
+            if method is not None and not getattr(method, "traced", False):
+                setattr(cls, name, _traced_query(method))
+
+
+class QueryTraceMiddleware:
+    """ Traces the queries of every request and logs the statements it repeated more than n_plus_one_threshold times """
+
+    def __init__(self, app: ASGIApp, slow_ms: float = 100.0, n_plus_one_threshold: int = 10):
+        self.app = app
+        self.slow_ms = slow_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = QueryTrace(scope, self.slow_ms)
+        token = query_trace.set(trace)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            query_trace.reset(token)
+            for statement, count in trace.repeated(self.n_plus_one_threshold):
+                log.warning("Possible N+1 in %s: statement sent %s times in one request: %s", trace.route, count, statement)
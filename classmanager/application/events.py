@@ -0,0 +1,150 @@
+"""
+Publish/subscribe of course notices for the server-sent event streams.
+
+Every worker keeps the open streams of its own clients, subscribed by course id. On postgres a notice is published
+with NOTIFY on the "notices" channel and every worker LISTENs on one dedicated connection, so a notice created on
+any worker reaches the clients of all of them. Other backends (sqlite in the tests) deliver in process only.
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set
+
+import asyncpg
+from tortoise import connections
+
+from application.db.app_models import Notice
+from application.db.routing import PRIMARY
+from application.pydantic import NoticeRead
+
+log = logging.getLogger("uvicorn")
+
+CHANNEL = "notices"
+# events buffered per open stream, a client that falls further behind is disconnected and reconnects
+QUEUE_SIZE = int(os.environ.get("NOTICE_QUEUE_SIZE", 100))
+# NOTIFY payloads are limited to 8000 bytes, bigger notices are sent by id and read back once per worker
+MAX_PAYLOAD = 7000
+
+
+class Subscription:
+    """ Queue of the events for one open stream, None is put on it when the stream is dropped """
+
+    def __init__(self, broker: "NoticeBroker", course_ids: Iterable[int]):
+        self.broker = broker
+        self.course_ids = frozenset(course_ids)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    async def get(self) -> Optional[dict]:
+        return await self.queue.get()
+
+    def close(self) -> None:
+        self.broker.unsubscribe(self)
+
+
+class NoticeBroker:
+    def __init__(self):
+        self._subscribers: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._listener: Optional[asyncpg.Connection] = None
+        self._listener_lock = asyncio.Lock()
+        # reads of notices sent by id, referenced until done so they aren't garbage collected while running
+        self._reads: Set[asyncio.Task] = set()
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    async def subscribe(self, course_ids: Iterable[int]) -> Subscription:
+        await self._listen()
+        subscription = Subscription(self, course_ids)
+        for course_id in subscription.course_ids:
+            self._subscribers[course_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for course_id in subscription.course_ids:
+            subscribers = self._subscribers.get(course_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[course_id]
+
+    async def publish(self, event: str, notice: NoticeRead) -> None:
+        """ Send a created, updated or deleted notice to the streams of its course, on every worker """
+        self.published += 1
+        message = {"event": event, "id": notice.id, "course_id": notice.course_id, "data": notice.model_dump_json()}
+        connection = connections.get(PRIMARY)
+        if connection.capabilities.dialect != "postgres":
+            self.deliver(message)
+            return
+        payload = json.dumps(message)
+        if len(payload.encode()) > MAX_PAYLOAD:
+            payload = json.dumps({**message, "data": None})
+        await connection.execute_query("SELECT pg_notify($1, $2)", [CHANNEL, payload])
+
+    def deliver(self, message: dict) -> None:
+        for subscription in list(self._subscribers.get(message["course_id"], ())):
+            try:
+                subscription.queue.put_nowait(message)
+                self.delivered += 1
+            except asyncio.QueueFull:
+                # a stuck client must not hold events in memory for everyone, drop it and let it reconnect
+                self.dropped += 1
+                self.unsubscribe(subscription)
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.queue.put_nowait(None)
+
+    async def _listen(self) -> None:
+        if self._listener is not None:
+            return
+        client = connections.get(PRIMARY)
+        if client.capabilities.dialect != "postgres":
+            return
+        async with self._listener_lock:
+            if self._listener is None:
+                listener = await asyncpg.connect(host=client.host, port=client.port, user=client.user,
+                                                 password=client.password, database=client.database)
+                await listener.add_listener(CHANNEL, self._on_notify)
+                listener.add_termination_listener(self._on_listener_closed)
+                self._listener = listener
+                log.info("Listening for notices on worker %s", os.getpid())
+
+    def _on_notify(self, connection: asyncpg.Connection, pid: int, channel: str, payload: str) -> None:
+        message = json.loads(payload)
+        if message["data"] is not None:
+            self.deliver(message)
+        elif message["event"] == "deleted":
+            self.deliver({**message, "data": json.dumps({"id": message["id"], "course_id": message["course_id"]})})
+        else:
+            read = asyncio.create_task(self._deliver_from_database(message))
+            self._reads.add(read)
+            read.add_done_callback(self._reads.discard)
+
+    async def _deliver_from_database(self, message: dict) -> None:
+        notice = await Notice.get_or_none(id=message["id"])
+        if notice:
+            self.deliver({**message, "data": NoticeRead.model_validate(notice).model_dump_json()})
+
+    def _on_listener_closed(self, connection: asyncpg.Connection) -> None:
+        # the next subscriber opens a new one
+        self._listener = None
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            await self._listener.close()
+            self._listener = None
+        await asyncio.gather(*self._reads, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "streams": len({subscription for subscribers in self._subscribers.values() for subscription in subscribers}),
+            "courses": len(self._subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "listening": self._listener is not None,
+        }
+
+
+notice_broker = NoticeBroker()
@@ -0,0 +1,209 @@
+"""
+Durable background jobs for side effects that don't have to finish before the response is sent.
+
+A job is a row of the jobs table. Enqueue it with the connection of the transaction making the change it follows
+up on, and the job exists exactly when that change was committed. Workers claim due jobs with
+SELECT ... FOR UPDATE SKIP LOCKED on postgres, so any number of them share the queue without two taking the same
+job. A claimed job is hidden from other workers until its visibility timeout passes, the job of a worker that died
+is claimed again then. Failures are retried with exponential backoff up to max_attempts, after which the job is
+kept as failed. Delivery is at least once, tasks should be safe to run twice.
+
+Every web worker runs a Worker in process unless JOBS_IN_PROCESS is off, dedicated workers are started with
+python -m application.worker
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, TypeVar
+
+from tortoise import BaseDBAsyncClient
+from tortoise.expressions import F, Q
+from tortoise.functions import Count
+from tortoise.transactions import in_transaction
+
+from application.config import Settings
+from application.db.app_models import Job, JobStatus
+from application.db.routing import PRIMARY
+
+log = logging.getLogger("uvicorn")
+
+Task = TypeVar("Task", bound=Callable[..., Awaitable[None]])
+
+# name -> coroutine function, filled by the @task decorator
+TASKS: Dict[str, Callable[..., Awaitable[None]]] = {}
+
+# seconds before the first retry, doubled for every further attempt
+RETRY_BASE_SECONDS = 10
+
+
+def task(name: str) -> Callable[[Task], Task]:
+    """ Register a coroutine function as a job task, its keyword arguments are the job's JSON payload """
+    def register(function: Task) -> Task:
+        TASKS[name] = function
+        function.task_name = name
+        return function
+    return register
+
+
+def now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def enqueue(function: Callable[..., Awaitable[None]], payload: dict, connection: Optional[BaseDBAsyncClient] = None,
+                  delay: float = 0, max_attempts: int = 5) -> Job:
+    return await Job.create(task=function.task_name, payload=payload, run_at=now() + timedelta(seconds=delay),
+                            max_attempts=max_attempts, using_db=connection)
+
+
+async def enqueue_many(function: Callable[..., Awaitable[None]], payloads: Iterable[dict],
+                       connection: Optional[BaseDBAsyncClient] = None) -> None:
+    """ One INSERT for all the jobs """
+    run_at = now()
+    await Job.bulk_create([Job(task=function.task_name, payload=payload, run_at=run_at) for payload in payloads], using_db=connection)
+
+
+async def claim(limit: int, visibility_timeout: float) -> List[Job]:
+    """ Due jobs, and jobs whose worker let the visibility timeout pass, marked as running for this worker """
+    claimed_at = now()
+    async with in_transaction(PRIMARY) as connection:
+        jobs = await Job.filter(Q(status=JobStatus.QUEUED, run_at__lte=claimed_at) | Q(status=JobStatus.RUNNING, locked_until__lt=claimed_at)) \
+            .order_by("run_at", "id").limit(limit).select_for_update(skip_locked=True).using_db(connection)
+        if not jobs:
+            return []
+        locked_until = claimed_at + timedelta(seconds=visibility_timeout)
+        await Job.filter(id__in=[job.id for job in jobs]).using_db(connection).update(
+            status=JobStatus.RUNNING, locked_until=locked_until, attempts=F("attempts") + 1)
+    for job in jobs:
+        job.status, job.locked_until, job.attempts = JobStatus.RUNNING, locked_until, job.attempts + 1
+    return jobs
+
+
+def _claimed(job: Job):
+    # a job claimed again after its timeout has more attempts, the late worker must not overwrite the new claim
+    return Job.filter(id=job.id, status=JobStatus.RUNNING, attempts=job.attempts)
+
+
+async def queue_stats() -> dict:
+    """ Jobs per status, and how long the oldest due job has waited to be claimed """
+    counts = dict(await Job.annotate(count=Count("id")).group_by("status").values_list("status", "count"))
+    oldest = await Job.filter(status=JobStatus.QUEUED, run_at__lte=now()).order_by("run_at").first().values_list("run_at", flat=True)
+    return {
+        **{job_status.value: counts.get(job_status.value, 0) for job_status in JobStatus},
+        "lag_seconds": round((now() - oldest).total_seconds(), 3) if oldest else 0.0,
+    }
+
+
+class Worker:
+    """ Claims due jobs and runs up to concurrency of them at a time """
+
+    def __init__(self, concurrency: int = 10, poll_interval: float = 1.0, visibility_timeout: float = 300,
+                 retention_hours: float = 24):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.retention = timedelta(hours=retention_hours)
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        self._running: set = set()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._wakeup: Optional[asyncio.Event] = None
+        self._next_prune = 0.0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "Worker":
+        return cls(settings.jobs_concurrency, settings.jobs_poll_interval, settings.jobs_visibility_timeout, settings.jobs_retention_hours)
+
+    async def execute(self, job: Job) -> None:
+        function = TASKS.get(job.task)
+        started = time.perf_counter()
+        try:
+            if function is None:
+                raise LookupError(f"No task named {job.task}")
+            # stop before another worker may claim the job again
+            await asyncio.wait_for(function(**job.payload), self.visibility_timeout)
+        except Exception as error:
+            await self._failed(job, error)
+        else:
+            self.processed += 1
+            await _claimed(job).update(status=JobStatus.DONE, locked_until=None, finished_at=now())
+            log.debug("Job %s %s done in %.3fs", job.id, job.task, time.perf_counter() - started)
+
+    async def _failed(self, job: Job, error: Exception) -> None:
+        last_error = f"{type(error).__name__}: {error}"[:2000]
+        if job.attempts >= job.max_attempts:
+            self.failed += 1
+            log.exception("Job %s %s failed for good after %s attempts", job.id, job.task, job.attempts, exc_info=error)
+            await _claimed(job).update(status=JobStatus.FAILED, locked_until=None, finished_at=now(), last_error=last_error)
+            return
+        self.retried += 1
+        delay = RETRY_BASE_SECONDS * 2 ** (job.attempts - 1)
+        log.warning("Job %s %s failed, retrying in %ss: %s", job.id, job.task, delay, last_error)
+        await _claimed(job).update(status=JobStatus.QUEUED, locked_until=None, run_at=now() + timedelta(seconds=delay), last_error=last_error)
+
+    async def run_once(self) -> int:
+        """ Claim one batch and run it to completion, returns the number of jobs run """
+        jobs = await claim(self.concurrency, self.visibility_timeout)
+        await asyncio.gather(*(self.execute(job) for job in jobs))
+        return len(jobs)
+
+    async def prune(self) -> int:
+        return await Job.filter(status=JobStatus.DONE, finished_at__lt=now() - self.retention).delete()
+
+    def _done(self, running: asyncio.Task) -> None:
+        self._running.discard(running)
+        # a slot is free, claim again without waiting for the poll interval
+        self._wakeup.set()
+
+    async def _fill(self) -> int:
+        free = self.concurrency - len(self._running)
+        jobs = await claim(free, self.visibility_timeout) if free > 0 else []
+        for job in jobs:
+            running = asyncio.create_task(self.execute(job))
+            self._running.add(running)
+            running.add_done_callback(self._done)
+        if time.monotonic() >= self._next_prune:
+            self._next_prune = time.monotonic() + 3600
+            await self.prune()
+        return len(jobs)
+
+    async def run(self) -> None:
+        """ Run jobs until stop() is called, then wait for the running ones """
+        self._wakeup = asyncio.Event()
+        log.info("Job worker started, concurrency %s", self.concurrency)
+        while not self._stopping:
+            self._wakeup.clear()
+            try:
+                claimed = await self._fill()
+            except Exception:
+                log.exception("Claiming jobs failed")
+                claimed = 0
+            if not claimed:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        await asyncio.gather(*self._running)
+
+    def start(self) -> None:
+        self._stopping = False
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self._running),
+            "concurrency": self.concurrency,
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
@@ -1,34 +1,126 @@
+import copy
 import logging
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import AsyncIterator, Optional, Tuple
 
-from fastapi import FastAPI
+from fastapi import APIRouter, FastAPI
+from fastapi.routing import APIRoute, request_response
+from starlette.routing import BaseRoute
+from starlette.types import Lifespan
+from tortoise import Tortoise, connections
 
-from application.api import assignment, auth, courses, marks, ping, users
-from application.db.database_config import init_db
+from application.api import (assignment, auth, courses, exports, files, marks,
+                             messages, notices, ping, users)
+from application.config import get_settings
+from application.db.database_config import (add_exception_handlers,
+                                            tortoise_config)
+from application.db.routing import ReadYourWritesMiddleware
+from application.db.tracing import QueryTraceMiddleware, instrument_queries
+from application.events import notice_broker
+from application.jobs import Worker
+from application.metrics import (MetricsMiddleware, instrument_database,
+                                 metrics_endpoint)
+from application.ratelimit import RateLimitMiddleware, rate_limiter
+from application.responses import FastJSONResponse, preload_list_adapters
+from application.storage import get_storage
+from application.utils import hashing_pool
 
 log = logging.getLogger("uvicorn")
 
 
-def create_application() -> FastAPI:
-    application = FastAPI()
-    application.include_router(ping.router, prefix="/env", tags=["env"])
-    application.include_router(auth.router, prefix="/auth", tags=["Auth"])
-    application.include_router(courses.router, prefix="/courses", tags=["courses"])
-    application.include_router(assignment.router, prefix="/assignment", tags=["assignment"])
-    application.include_router(users.router, prefix="/users", tags=["Users"])
-    application.include_router(marks.router, prefix="/marks", tags=["Marks"])
+@lru_cache()
+def api_routes() -> Tuple[BaseRoute, ...]:
+    """ The routes of every router, built once per process as building them is most of create_application's time """
+    api = APIRouter(default_response_class=FastJSONResponse)
+    api.include_router(ping.router, prefix="/env", tags=["env"])
+    api.include_router(auth.router, prefix="/auth", tags=["Auth"])
+    api.include_router(courses.router, prefix="/courses", tags=["courses"])
+    api.include_router(assignment.router, prefix="/assignment", tags=["assignment"])
+    api.include_router(users.router, prefix="/users", tags=["Users"])
+    api.include_router(marks.router, prefix="/marks", tags=["Marks"])
+    api.include_router(exports.router, prefix="/exports", tags=["Exports"])
+    api.include_router(notices.router, prefix="/notices", tags=["Notices"])
+    api.include_router(messages.router, prefix="/messages", tags=["Messages"])
+    api.include_router(files.router, prefix="/files", tags=["Files"])
+    return tuple(api.routes)
+
+
+def bind_route(route: BaseRoute, application: FastAPI) -> BaseRoute:
+    """ Copy of a cached route that resolves dependencies with the overrides of application """
+    route = copy.copy(route)
+    if isinstance(route, APIRoute):
+        # the request handler is a closure over the overrides provider, the parsed dependencies and fields are shared
+        route.dependency_overrides_provider = application
+        route.app = request_response(route.get_route_handler())
+    return route
+
+
+def create_application(lifespan: Optional[Lifespan[FastAPI]] = None) -> FastAPI:
+    """ The tests start Tortoise with register_tortoise on apps without a lifespan, the served app uses lifespan below """
+    application = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
+    add_exception_handlers(application)
+    application.add_middleware(ReadYourWritesMiddleware)
+    application.router.routes.extend(bind_route(route, application) for route in api_routes())
+
+    settings = get_settings()
+    if settings.rate_limit_enabled:
+        application.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+    if settings.query_trace:
+        instrument_queries()
+        application.add_middleware(QueryTraceMiddleware, slow_ms=settings.slow_query_ms, n_plus_one_threshold=settings.n_plus_one_threshold)
+    if settings.metrics_enabled:
+        instrument_database()
+        # added last so it is the outermost middleware and times the others too
+        application.add_middleware(MetricsMiddleware, server_timing=settings.server_timing)
+        application.add_route("/metrics", metrics_endpoint, include_in_schema=False)
 
     return application
 
 
-app = create_application()
+async def warm_up_connections() -> None:
+    """ Connect to every database before the first request instead of during it, a postgres pool opens its minimum size """
+    for name in connections.db_config:
+        try:
+            await connections.get(name).execute_query("SELECT 1")
+        except Exception:
+            log.exception("Could not connect to the %s database at startup", name)
 
 
-@app.on_event("startup")
-async def startup_event():
+async def preload_caches() -> None:
+    """ Build what the first requests of a worker would otherwise build while they wait """
+    preload_list_adapters(getattr(route, "response_model", None) for route in api_routes())
+    await hashing_pool.warm_up()
+
+
+@asynccontextmanager
+async def lifespan(application: FastAPI) -> AsyncIterator[None]:
+    """
+    Startup and graceful shutdown of a served worker. On shutdown the server stops accepting connections and waits
+    for the requests in flight before the code after yield runs, which then lets the running jobs finish and closes
+    the executors and every database connection.
+    """
+    # tests set their settings as an override
+    settings = application.dependency_overrides.get(get_settings, get_settings)()
     log.info("Starting up....................")
-    init_db(app)
+    await Tortoise.init(config=tortoise_config(settings))
+    await warm_up_connections()
+    await preload_caches()
+    if settings.jobs_in_process:
+        application.state.job_worker = Worker.from_settings(settings)
+        application.state.job_worker.start()
 
+    yield
 
-@app.on_event("shutdown")
-async def shutdown_event():
     log.info("Shutting down..................")
+    if getattr(application.state, "job_worker", None):
+        await application.state.job_worker.stop()
+        application.state.job_worker = None
+    hashing_pool.shutdown()
+    await notice_broker.close()
+    await get_storage().close()
+    # last, the steps above may still write to the database
+    await connections.close_all()
+
+
+app = create_application(lifespan=lifespan)
@@ -0,0 +1,212 @@
+"""
+Per request timings, exposed in the Prometheus text format on /metrics and per response in a Server-Timing header.
+
+MetricsMiddleware opens a RequestTimings for every request. The database clients, the password hashing pool and
+the JSON renderers add to the one of the request they run in. Nothing is recorded outside a request, and with
+METRICS_ENABLED off neither the middleware nor the database hooks are installed.
+
+Metrics are kept per process, Prometheus should scrape every worker.
+"""
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, Optional, Set, Tuple, Type
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from tortoise import BaseDBAsyncClient
+
+# upper bounds of the request latency histogram, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# timed phases besides the database, in the order of the Server-Timing header
+PHASES = ("hash", "render")
+
+DB_METHODS = ("execute_query", "execute_query_dict", "execute_insert", "execute_many", "execute_script")
+
+
+class RequestTimings:
+    __slots__ = ("db_queries", "db_seconds", "phases", "in_db")
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.phases: Dict[str, float] = defaultdict(float)
+        # set while a query is timed, a client method calling another one is counted once
+        self.in_db = False
+
+
+request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def record(phase: str, seconds: float) -> None:
+    timings = request_timings.get()
+    if timings is not None:
+        timings.phases[phase] += seconds
+
+
+class timed:
+    """ Context manager adding the time spent in its block to a phase of the current request """
+    __slots__ = ("phase", "started")
+
+    def __init__(self, phase: str):
+        self.phase = phase
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        record(self.phase, time.perf_counter() - self.started)
+
+
+def _timed_query(method: Callable) -> Callable:
+    @wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        timings = request_timings.get()
+        if timings is None or timings.in_db:
+            return await method(self, *args, **kwargs)
+        timings.in_db = True
+        started = time.perf_counter()
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            timings.db_seconds += time.perf_counter() - started
+            timings.db_queries += 1
+            timings.in_db = False
+    wrapper.timed = True
+    return wrapper
+
+
+def _subclasses(cls):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _subclasses(subclass)
+
+
+def client_classes() -> Set[Type[BaseDBAsyncClient]]:
+    """ Every Tortoise client class, the backends register theirs when imported """
+    for backend in ("tortoise.backends.sqlite.client", "tortoise.backends.asyncpg.client", "application.db.pool"):
+        try:
+            __import__(backend)
+        except ImportError:  # pragma: no cover
+            pass
+    return set(_subclasses(BaseDBAsyncClient))
+
+
+def instrument_database() -> None:
+    """ Time the query methods of every Tortoise client class, safe to call more than once """
+    for cls in client_classes():
+        for name in DB_METHODS:
+            method = cls.__dict__.get(name)
+            if method is not None and not getattr(method, "timed", False):
+                setattr(cls, name, _timed_query(method))
+
+
+class RouteMetrics:
+    __slots__ = ("buckets", "count", "seconds", "db_queries", "db_seconds", "phases")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.phases: Dict[str, float] = defaultdict(float)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        # (method, route, status) -> metrics
+        self.routes: Dict[Tuple[str, str, int], RouteMetrics] = defaultdict(RouteMetrics)
+
+    def observe(self, method: str, route: str, status: int, seconds: float, timings: RequestTimings) -> None:
+        metrics = self.routes[(method, route, status)]
+        metrics.buckets[bisect_left(BUCKETS, seconds)] += 1
+        metrics.count += 1
+        metrics.seconds += seconds
+        metrics.db_queries += timings.db_queries
+        metrics.db_seconds += timings.db_seconds
+        for phase, phase_seconds in timings.phases.items():
+            metrics.phases[phase] += phase_seconds
+
+    def clear(self) -> None:
+        self.routes.clear()
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_request_duration_seconds Request latency by route",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route, status), metrics in sorted(self.routes.items()):
+            labels = f'method="{method}",route="{route}",status="{status}"'
+            cumulative = 0
+            for bound, count in zip((*BUCKETS, "+Inf"), metrics.buckets):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {metrics.seconds}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {metrics.count}")
+
+        counters = [
+            ("http_request_db_queries_total", "Database queries sent by requests", lambda metrics: metrics.db_queries),
+            ("http_request_db_seconds_total", "Time requests spent waiting on the database", lambda metrics: metrics.db_seconds),
+            *[(f"http_request_{phase}_seconds_total", f"Time requests spent in {phase}", lambda metrics, phase=phase: metrics.phases[phase])
+              for phase in PHASES],
+        ]
+        for name, description, value in counters:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+            lines += [f'{name}{{method="{method}",route="{route}",status="{status}"}} {value(metrics)}'
+                      for (method, route, status), metrics in sorted(self.routes.items())]
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def server_timing(timings: RequestTimings, total: float) -> str:
+    entries = [f'db;dur={timings.db_seconds * 1000:.2f};desc="{timings.db_queries} queries"']
+    entries += [f"{phase};dur={timings.phases[phase] * 1000:.2f}" for phase in PHASES if phase in timings.phases]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+class MetricsMiddleware:
+    """ Times every request, adds it to the registry and, with server_timing, reports it in a Server-Timing header """
+
+    def __init__(self, app: ASGIApp, server_timing: bool = True):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = request_timings.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    MutableHeaders(scope=message).append("server-timing", server_timing(timings, time.perf_counter() - started))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_timings.reset(token)
+            # the route template, so /users/1 and /users/2 are one series. Unrouted paths are grouped so scans of
+            # random urls don't add a series each
+            route = scope.get("route")
+            registry.observe(scope["method"], getattr(route, "path", "unmatched"), status, time.perf_counter() - started, timings)
+
+
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,5 +1,6 @@
 from datetime import datetime
-from typing import Optional
+from enum import Enum
+from typing import List, Optional
 
 from pydantic import BaseModel, EmailStr, Field, field_validator
 from typing_extensions import Literal
@@ -56,6 +57,12 @@ class Login(BaseModel):
     password: str
 
 
+class TokenUser(BaseModel):
+    id: int
+    username: str
+    role: UserRole
+
+
 class PasswordChange(BaseModel):
     username: str
     password: str
@@ -127,6 +134,11 @@ class UserProfile(BaseModel):
         from_attributes = True
 
 
+class UserSearchPage(BaseModel):
+    results: List[UserProfile]
+    next_cursor: Optional[str] = None
+
+
 class UserProfileUpdate(BaseModel):
     first_name: Optional[str] = Field(...)
     last_name: Optional[str] = Field(...)
@@ -151,6 +163,48 @@ class MarkCreateResponse(BaseModel):
     mark: Marks_Pydantic
 
 
+class BulkMarkEntry(CreateMark):
+    student_id: int
+
+
+class BulkMarkResult(BaseModel):
+    student_id: int
+    created: bool
+    detail: Optional[str] = None
+
+
+class BulkMarkResponse(BaseModel):
+    message: str
+    results: List[BulkMarkResult]
+
+
+class AssignmentStatistics(BaseModel):
+    assignment_id: int
+    title: str
+    marks_count: int = 0
+    mean: Optional[float] = None
+    median: Optional[float] = None
+    min_score: Optional[int] = None
+    max_score: Optional[int] = None
+    stddev: Optional[float] = None
+
+
+class StudentTotal(BaseModel):
+    student_id: int
+    username: str
+    first_name: str
+    last_name: str
+    marks_count: int
+    total: int
+    mean: float
+
+
+class Gradebook(BaseModel):
+    course_id: int
+    assignments: List[AssignmentStatistics]
+    students: List[StudentTotal]
+
+
 class EnrollCourse(BaseModel):
     course_id: int
 
@@ -162,3 +216,101 @@ class EnrollCourseResponse(BaseModel):
 class SubmissionCreate(BaseModel):
     assignment_id: int
     file_path: Optional[str] = None
+
+
+class StoredFileRead(BaseModel):
+    key: str
+    filename: str
+    content_type: str
+    size: int
+    sha256: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class SubmissionFileRead(StoredFileRead):
+    submission_id: int
+
+
+class RosterRowResult(BaseModel):
+    line: int
+    username: str
+    status: Literal["created", "existing", "error"]
+    detail: Optional[str] = None
+    course_ids: List[int] = []
+
+
+class RosterImportResponse(BaseModel):
+    created: int
+    existing: int
+    failed: int
+    results: List[RosterRowResult]
+
+
+class ExportDataset(str, Enum):
+    ROSTER = "roster"
+    SUBMISSIONS = "submissions"
+    MARKS = "marks"
+
+
+class ExportFormat(str, Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+
+class NoticeCreate(BaseModel):
+    course_id: int
+    title: str = Field(..., min_length=5, max_length=100)
+    content: str = Field(..., min_length=1)
+
+
+class NoticeUpdate(BaseModel):
+    title: Optional[str] = Field(None, min_length=5, max_length=100)
+    content: Optional[str] = Field(None, min_length=1)
+
+
+class NoticeRead(BaseModel):
+    id: int
+    course_id: int
+    title: str
+    content: str
+    date_posted: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class MessageCreate(BaseModel):
+    receiver_id: int
+    content: str = Field(..., min_length=1, max_length=5000)
+
+
+class MessageRead(BaseModel):
+    id: int
+    sender_id: int
+    receiver_id: int
+    content: str
+    date_sent: datetime
+    is_read: bool
+
+    class Config:
+        from_attributes = True
+
+
+class MessagePage(BaseModel):
+    results: List[MessageRead]
+    next_cursor: Optional[str] = None
+    unread: int
+
+
+class MarkMessagesRead(BaseModel):
+    message_ids: List[int] = Field(None, max_length=1000)
+    up_to_id: Optional[int] = Field(None, description="mark every message up to and including this id")
+
+
+class MarkMessagesReadResponse(BaseModel):
+    marked: int
+    unread: int
@@ -0,0 +1,226 @@
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import orjson
+from starlette import status
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from application.api.auth import decode_token
+from application.responses import FastJSONResponse
+
+# login and registration bodies are read before the route to key their bucket on the username, bigger ones aren't
+MAX_PEEKED_BODY = 4096
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    """
+    Token bucket per identity: burst requests at once, refilled at rate requests per second.
+    The first policy whose methods and path prefixes match a request applies to it, empty ones match everything.
+    """
+    name: str
+    rate: float
+    burst: int
+    methods: Tuple[str, ...] = ()
+    paths: Tuple[str, ...] = ()
+    # "user" counts logged in clients by user id and the others by address, "ip" always by address and "username" by
+    # address and the username in the JSON body
+    by: str = "user"
+    # when set, a second bucket per address alone, taken first
+    address_rate: float = 0.0
+    address_burst: int = 0
+
+    def matches(self, method: str, path: str) -> bool:
+        return (not self.methods or method in self.methods) and (not self.paths or path.startswith(self.paths))
+
+
+POLICIES = (
+    # bcrypt verifications. The caller has no token yet: guessing one account's password is limited per address and
+    # username, and the address budget is large enough for a school logging in behind one NAT address
+    RateLimitPolicy("login", rate=0.1, burst=10, methods=("POST",), paths=("/auth/login/", "/auth/register-user/"), by="username",
+                    address_rate=5.0, address_burst=300),
+    RateLimitPolicy("change_password", rate=0.1, burst=5, methods=("POST",), paths=("/auth/change-password/",)),
+    # ranked scans of the users table
+    RateLimitPolicy("user_search", rate=2.0, burst=20, methods=("GET",), paths=("/users/search/",)),
+    # everything else, only stops runaway clients
+    RateLimitPolicy("default", rate=50.0, burst=200),
+)
+
+
+class RateLimitBackend:
+    """
+    Storage of the token buckets. Async so a backend shared between workers (redis, with the refill and take in one
+    script so it stays atomic) can be plugged in by implementing these two methods. The in-memory backend is per
+    worker, so with N workers a client gets up to N times the limits.
+    """
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """ Take a token from the bucket, returns 0 when there was one and otherwise the seconds until there is """
+        raise NotImplementedError
+
+    async def clear(self) -> None:
+        raise NotImplementedError
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        # key -> (tokens, monotonic time they were counted at)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        # no await in here, concurrent requests of one worker can't interleave between the read and the write
+        now = time.monotonic()
+        tokens, counted_at = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - counted_at) * rate)
+        wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+        self._buckets[key] = (tokens - 1 if not wait else tokens, now)
+        self._buckets.move_to_end(key)
+        # least recently used buckets are dropped first, they have mostly refilled anyway
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return wait
+
+    async def clear(self) -> None:
+        self._buckets.clear()
+
+
+class RateLimiter:
+    def __init__(self, backend: RateLimitBackend, policies: Sequence[RateLimitPolicy] = POLICIES,
+                 trusted_proxies: Iterable[str] = ("127.0.0.1",)):
+        self.backend = backend
+        self.policies = policies
+        # peers whose X-Forwarded-For is believed, "*" for any
+        self.trusted_proxies = frozenset(address.strip() for address in trusted_proxies)
+        self.allowed: Dict[str, int] = {policy.name: 0 for policy in policies}
+        self.limited: Dict[str, int] = {policy.name: 0 for policy in policies}
+
+    def policy(self, method: str, path: str) -> Optional[RateLimitPolicy]:
+        return next((policy for policy in self.policies if policy.matches(method, path)), None)
+
+    def address(self, connection: HTTPConnection) -> str:
+        """ The client's address, read from X-Forwarded-For through the trusted proxies in front of the server """
+        host = connection.client.host if connection.client else "unknown"
+        forwarded = [address.strip() for address in connection.headers.get("x-forwarded-for", "").split(",") if address.strip()]
+        # each trusted proxy appended the address it was called from, anything further left the client may have made up
+        while forwarded and host in self.trusted_proxies:
+            host = forwarded.pop()
+        if forwarded and "*" in self.trusted_proxies:
+            # every peer is trusted, but only for the address it appended, as uvicorn does
+            host = forwarded.pop()
+        return host
+
+    def identity(self, connection: HTTPConnection, policy: RateLimitPolicy, username: str = "") -> str:
+        if policy.by == "user":
+            token = connection.cookies.get("access_token")
+            # only a valid token picks the bucket, a forged one can't spend another user's requests
+            payload = decode_token(token) if token else None
+            if payload and "user_id" in payload:
+                return f"user:{payload['user_id']}"
+        if policy.by == "username":
+            return f"ip:{self.address(connection)}:username:{username}"
+        return f"ip:{self.address(connection)}"
+
+    async def check(self, scope: Scope, username: str = "") -> Tuple[Optional[RateLimitPolicy], float]:
+        """ The policy of the request and the seconds its client has to wait, 0 when it may go ahead """
+        policy = self.policy(scope["method"], scope["path"])
+        if policy is None:
+            return None, 0.0
+        connection = HTTPConnection(scope)
+        buckets = [(f"{policy.name}:{self.identity(connection, policy, username)}", policy.rate, policy.burst)]
+        if policy.address_burst:
+            # first, so a client over the address budget doesn't spend the tokens of the usernames it tries
+            buckets.insert(0, (f"{policy.name}:ip:{self.address(connection)}", policy.address_rate, policy.address_burst))
+        for key, rate, burst in buckets:
+            wait = await self.backend.take(key, rate, burst)
+            if wait:
+                break
+        if wait:
+            self.limited[policy.name] += 1
+        else:
+            self.allowed[policy.name] += 1
+        return policy, wait
+
+    async def clear(self) -> None:
+        await self.backend.clear()
+        self.allowed = dict.fromkeys(self.allowed, 0)
+        self.limited = dict.fromkeys(self.limited, 0)
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "policies": {
+                policy.name: {"rate": policy.rate, "burst": policy.burst, "allowed": self.allowed[policy.name],
+                              "limited": self.limited[policy.name]}
+                for policy in self.policies
+            },
+        }
+
+
+async def peek_body(receive: Receive, limit: int) -> Tuple[bytes, Receive]:
+    """
+    The request body when it is at most limit bytes, otherwise b"", and a receive that hands the app the messages
+    read here before the rest
+    """
+    messages, size, complete = [], 0, False
+    while not complete and size <= limit:
+        message = await receive()
+        messages.append(message)
+        size += len(message.get("body", b""))
+        complete = message["type"] != "http.request" or not message.get("more_body", False)
+
+    async def replay() -> dict:
+        return messages.pop(0) if messages else await receive()
+
+    body = b"".join(message.get("body", b"") for message in messages)
+    return body if complete and size <= limit else b"", replay
+
+
+def body_username(body: bytes) -> str:
+    try:
+        username = orjson.loads(body).get("username")
+    except (orjson.JSONDecodeError, AttributeError):
+        return ""
+    # the longest username a user can have
+    return username[:50] if isinstance(username, str) else ""
+
+
+class RateLimitMiddleware:
+    """ Answers 429 with Retry-After to clients over their policy, before the request reaches the routes """
+
+    def __init__(self, app: ASGIApp, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        policy = self.limiter.policy(scope["method"], scope["path"])
+        username = ""
+        if policy is not None and policy.by == "username":
+            body, receive = await peek_body(receive, MAX_PEEKED_BODY)
+            username = body_username(body)
+        policy, wait = await self.limiter.check(scope, username)
+        if not wait:
+            await self.app(scope, receive, send)
+            return
+
+        response = FastJSONResponse(
+            {"detail": "Too many requests, try again shortly"},
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            # whole seconds, rounded up so a client retrying right on time finds a token
+            headers={"Retry-After": str(math.ceil(wait)), "X-RateLimit-Policy": policy.name},
+        )
+        await response(scope, receive, send)
+
+
+rate_limiter = RateLimiter(InMemoryRateLimitBackend(maxsize=int(os.environ.get("RATE_LIMIT_KEYS", 100_000))),
+                           # the variable uvicorn and gunicorn read for the same purpose
+                           trusted_proxies=os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1").split(","))
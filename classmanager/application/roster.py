@@ -0,0 +1,193 @@
+"""
+Bulk roster import: register users and enroll them in courses from a CSV.
+
+    python -m application.roster students.csv --teacher TeacherUsername
+
+The CSV needs the columns first_name, last_name, username, email, password and optionally role (defaults to
+student) and course_codes (several codes separated by ';'). Only courses taught by the importing teacher can be
+enrolled into. A row whose username and email both match an existing user is enrolled without registering again.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+from typing import Dict, Iterable, List, Tuple
+
+from pydantic import ValidationError
+from tortoise import BaseDBAsyncClient, Tortoise
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import Q
+from tortoise.transactions import in_transaction
+
+from application.db.app_models import Course, Enrollment, User, UserRole
+from application.db.database_config import TORTOISE_ORM
+from application.db.routing import PRIMARY
+from application.pydantic import (RosterImportResponse, RosterRowResult,
+                                  UserCreate)
+from application.utils import HashingPool, hash_password
+
+# rows written per transaction
+BATCH_SIZE = 1000
+
+# (row result, validated user, course codes) and the same with the codes resolved to course ids
+ParsedRow = Tuple[RosterRowResult, UserCreate, List[str]]
+PendingRow = Tuple[RosterRowResult, UserCreate, List[int]]
+
+
+def _validation_detail(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors())
+
+
+def read_roster_csv(content: str) -> List[Dict[str, str]]:
+    return [{key.strip(): (value or "").strip() for key, value in row.items() if key} for row in csv.DictReader(io.StringIO(content))]
+
+
+def _parse_rows(rows: Iterable[Dict[str, str]]) -> Tuple[List[RosterRowResult], List[ParsedRow]]:
+    results, parsed = [], []
+    seen_usernames, seen_emails = set(), set()
+    for line, row in enumerate(rows, start=2):
+        result = RosterRowResult(line=line, username=row.get("username", ""), status="error")
+        results.append(result)
+        codes = [code.strip() for code in row.get("course_codes", "").split(";") if code.strip()]
+        try:
+            user = UserCreate(**{**row, "role": row.get("role") or UserRole.STUDENT.value})
+        except ValidationError as error:
+            result.detail = _validation_detail(error)
+            continue
+        if user.username in seen_usernames or user.email in seen_emails:
+            result.detail = "Username or email appears more than once in the file"
+            continue
+        seen_usernames.add(user.username)
+        seen_emails.add(user.email)
+        parsed.append((result, user, codes))
+    return results, parsed
+
+
+async def _match_rows(parsed: List[ParsedRow], teacher_id: int) -> Tuple[List[PendingRow], Dict[int, PendingRow]]:
+    """ Resolve course codes and clashes with registered users, one query each for the whole file """
+    codes = {code for _, _, row_codes in parsed for code in row_codes}
+    courses = dict(await Course.filter(course_code__in=codes, teacher_id=teacher_id).values_list("course_code", "id"))
+    existing = await User.filter(
+        Q(username__in=[user.username for _, user, _ in parsed]) | Q(email__in=[user.email for _, user, _ in parsed])
+    ).values("id", "username", "email")
+    existing_by_username = {user["username"]: user for user in existing}
+    existing_emails = {user["email"] for user in existing}
+
+    pending, existing_students = [], {}
+    for result, user, row_codes in parsed:
+        unknown = [code for code in row_codes if code not in courses]
+        match = existing_by_username.get(user.username)
+        if unknown:
+            result.detail = f"Unknown course codes or not your course: {', '.join(unknown)}"
+        elif row_codes and user.role != UserRole.STUDENT:
+            result.detail = "Only students can be enrolled"
+        elif match and match["email"] == user.email:
+            result.status = "existing"
+            existing_students[match["id"]] = (result, user, [courses[code] for code in row_codes])
+        elif match or user.email in existing_emails:
+            result.detail = "Username or email already registered to another user"
+        else:
+            pending.append((result, user, [courses[code] for code in row_codes]))
+    return pending, existing_students
+
+
+async def _insert(batch: List[PendingRow], hashes: List[str], connection: BaseDBAsyncClient) -> None:
+    await User.bulk_create([
+        User(first_name=user.first_name, last_name=user.last_name, username=user.username, email=user.email,
+             password_hash=password_hash, role=UserRole(user.role))
+        for (_, user, _), password_hash in zip(batch, hashes)
+    ], using_db=connection)
+    # bulk_create does not hand back primary keys on every backend, read them back in one query
+    ids = dict(await User.filter(username__in=[user.username for _, user, _ in batch]).using_db(connection).values_list("username", "id"))
+    enrollments = [Enrollment(student_id=ids[user.username], course_id=course_id) for _, user, course_ids in batch for course_id in course_ids]
+    if enrollments:
+        await Enrollment.bulk_create(enrollments, using_db=connection)
+
+
+async def _register(pending: List[PendingRow], hashes: List[str]) -> None:
+    for start in range(0, len(pending), BATCH_SIZE):
+        batch, batch_hashes = pending[start:start + BATCH_SIZE], hashes[start:start + BATCH_SIZE]
+        try:
+            async with in_transaction(PRIMARY) as connection:
+                await _insert(batch, batch_hashes, connection)
+            inserted = batch
+        except IntegrityError:
+            # a username or email was registered by someone else since _match_rows, find the row(s) one at a time
+            inserted = []
+            for row, password_hash in zip(batch, batch_hashes):
+                try:
+                    async with in_transaction(PRIMARY) as connection:
+                        await _insert([row], [password_hash], connection)
+                    inserted.append(row)
+                except IntegrityError:
+                    row[0].detail = "Username or email already registered to another user"
+        for result, _, course_ids in inserted:
+            result.status = "created"
+            result.course_ids = course_ids
+
+
+async def _hash_passwords(pool: HashingPool, pending: List[PendingRow]) -> List[str]:
+    hashes: List[str] = []
+    # no more passwords in flight than the pool has workers, so an import waits its turn instead of filling the
+    # queue logins share. The pool still answers 503 when other requests have filled it, before anything is written
+    for start in range(0, len(pending), pool.workers):
+        hashes += await asyncio.gather(*(pool.run(hash_password, user.password) for _, user, _ in pending[start:start + pool.workers]))
+    return hashes
+
+
+async def _enroll_existing(existing_students: Dict[int, PendingRow]) -> None:
+    """ Students already registered only get the enrollments they don't have yet """
+    already_enrolled = set(await Enrollment.filter(student_id__in=list(existing_students)).values_list("student_id", "course_id"))
+    enrollments = [
+        Enrollment(student_id=student_id, course_id=course_id)
+        for student_id, (_, _, course_ids) in existing_students.items()
+        for course_id in course_ids if (student_id, course_id) not in already_enrolled
+    ]
+    if enrollments:
+        async with in_transaction(PRIMARY) as connection:
+            await Enrollment.bulk_create(enrollments, batch_size=BATCH_SIZE, using_db=connection)
+    for result, _, course_ids in existing_students.values():
+        result.course_ids = course_ids
+
+
+async def import_roster(rows: Iterable[Dict[str, str]], teacher_id: int, hashing_pool: HashingPool) -> RosterImportResponse:
+    """ Validate every row, then register and enroll the valid ones with a fixed number of queries per batch """
+    results, parsed = _parse_rows(rows)
+    pending, existing_students = await _match_rows(parsed, teacher_id)
+
+    hashes = await _hash_passwords(hashing_pool, pending)
+    await _register(pending, hashes)
+    if existing_students:
+        await _enroll_existing(existing_students)
+
+    return RosterImportResponse(
+        created=sum(result.status == "created" for result in results),
+        existing=sum(result.status == "existing" for result in results),
+        failed=sum(result.status == "error" for result in results),
+        results=results,
+    )
+
+
+async def main(path: str, teacher_username: str) -> None:
+    await Tortoise.init(config=TORTOISE_ORM)
+    # bcrypt dominates an import, the command line has every core to itself
+    pool = HashingPool(kind="process")
+    try:
+        teacher = await User.get_or_none(username=teacher_username, role=UserRole.TEACHER)
+        if not teacher:
+            raise SystemExit(f"No teacher with username {teacher_username}")
+        with open(path, newline="") as roster_file:
+            report = await import_roster(read_roster_csv(roster_file.read()), teacher.id, pool)
+    finally:
+        pool.shutdown()
+        await Tortoise.close_connections()
+    print(json.dumps(report.model_dump(), indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--teacher", required=True, help="username of the teacher whose courses are enrolled into")
+    args = parser.parse_args()
+    asyncio.run(main(args.path, args.teacher))
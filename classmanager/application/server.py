@@ -0,0 +1,44 @@
+"""
+Gunicorn settings of the production server, one uvicorn worker process per core:
+
+    gunicorn -c python:application.server application.main:app
+
+WEB_CONCURRENCY overrides the worker count. Every worker has its own connection pool, so workers times
+DB_POOL_MAX_SIZE has to stay below the database's max_connections.
+"""
+import os
+
+from uvicorn.workers import UvicornWorker
+
+
+def cores() -> int:
+    """ Cores this process may run on, which is fewer than the machine has in a container limited to some of them """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover
+        return os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+# the workers are asynchronous, one per core keeps every core busy without them competing for it
+workers = int(os.environ.get("WEB_CONCURRENCY", 0)) or cores()
+worker_class = "application.server.ProductionWorker"
+# seconds a worker has after SIGTERM before it is killed, and a silent worker is killed after
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+timeout = int(os.environ.get("WORKER_TIMEOUT", 60))
+# idle keep-alive connections of a load balancer in front of the workers
+keepalive = int(os.environ.get("KEEPALIVE", 5))
+# the application is imported in each worker, nothing created at import time is shared across a fork
+preload_app = False
+accesslog = "-"
+
+
+class ProductionWorker(UvicornWorker):
+    CONFIG_KWARGS = {
+        **UvicornWorker.CONFIG_KWARGS,
+        # a worker whose startup fails exits instead of serving without a database
+        "lifespan": "on",
+        # requests still running this long after SIGTERM are cancelled, notice streams never finish on their own.
+        # A few seconds before gunicorn kills the worker, so the lifespan shutdown still closes the connections
+        "timeout_graceful_shutdown": max(graceful_timeout - 5, 1),
+    }
@@ -0,0 +1,250 @@
+"""
+Storage of uploaded assignment and submission files.
+
+Files are written and read as streams of chunks, so memory use does not grow with the file size. The local
+filesystem backend is the default; S3Storage speaks the S3 REST API to any S3-compatible service (AWS, MinIO, Ceph).
+"""
+import hashlib
+import hmac
+import os
+import uuid
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import (TYPE_CHECKING, AsyncIterable, AsyncIterator, Dict, List,
+                    Optional, Tuple)
+from urllib.parse import quote
+from xml.etree import ElementTree
+
+import anyio
+from fastapi import HTTPException
+from starlette import status
+
+from application.config import get_settings
+
+if TYPE_CHECKING:
+    import httpx
+
+# bytes read from disk or the network per chunk
+CHUNK_SIZE = 64 * 1024
+
+
+def new_key(prefix: str) -> str:
+    """ Storage keys are generated, never taken from the uploaded filename """
+    return f"{prefix}/{uuid.uuid4().hex}"
+
+
+class StorageBackend:
+    """ Implement these methods to plug in another store """
+
+    async def save(self, key: str, chunks: AsyncIterable[bytes]) -> None:
+        """ Store the chunks under key. Nothing is left behind when the iterator raises """
+        raise NotImplementedError
+
+    def open(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """ Bytes start to end of a stored file, both inclusive """
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def path(self, key: str) -> Optional[str]:
+        """ Local path of a stored file, lets the server send it with sendfile """
+        return None
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid storage key {key!r}")
+        return path
+
+    async def save(self, key: str, chunks: AsyncIterable[bytes]) -> None:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written next to the final path and renamed when complete, readers never see a partial file
+        partial = f"{path}.part"
+        try:
+            async with await anyio.open_file(partial, "wb") as file:
+                async for chunk in chunks:
+                    await file.write(chunk)
+            os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+
+    async def open(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        remaining = end - start + 1
+        async with await anyio.open_file(self.path(key), "rb") as file:
+            await file.seek(start)
+            while remaining > 0:
+                chunk = await file.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+
+    async def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+
+def sign_v4(method: str, path: str, query: Dict[str, str], headers: Dict[str, str], now: datetime,
+            region: str, access_key: str, secret_key: str, payload_hash: str = "UNSIGNED-PAYLOAD") -> Dict[str, str]:
+    """ Headers of a request signed with AWS signature version 4, every header passed in is signed """
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    scope = f"{now:%Y%m%d}/{region}/s3/aws4_request"
+    headers = {name.lower(): str(value).strip() for name, value in headers.items()}
+    headers.update({"x-amz-date": amz_date, "x-amz-content-sha256": payload_hash})
+
+    signed_headers = ";".join(sorted(headers))
+    canonical_request = "\n".join([
+        method,
+        path,
+        "&".join(f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}" for name, value in sorted(query.items())),
+        "".join(f"{name}:{headers[name]}\n" for name in sorted(headers)),
+        signed_headers,
+        payload_hash,
+    ])
+    string_to_sign = "\n".join(["AWS4-HMAC-SHA256", amz_date, scope, _sha256(canonical_request.encode())])
+
+    signing_key = _hmac(_hmac(_hmac(_hmac(f"AWS4{secret_key}".encode(), f"{now:%Y%m%d}"), region), "s3"), "aws4_request")
+    signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+    headers["authorization"] = f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, SignedHeaders={signed_headers}, Signature={signature}"
+    return headers
+
+
+class S3Storage(StorageBackend):
+    """
+    Objects in one bucket of an S3-compatible service, addressed path style. Uploads bigger than one part go through
+    a multipart upload, so at most PART_SIZE bytes of a file are held in memory.
+    """
+    # S3 requires at least 5 MiB for every part but the last
+    PART_SIZE = 8 * 1024 * 1024
+
+    def __init__(self, endpoint: str, bucket: str, access_key: str, secret_key: str, region: str = "us-east-1",
+                 client: Optional["httpx.AsyncClient"] = None):
+        # imported here rather than with the module, httpx is a large part of the app's import time and only S3 needs it
+        import httpx
+        self.httpx = httpx
+        self.endpoint = endpoint.rstrip("/")
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self._client = client
+
+    @property
+    def client(self) -> "httpx.AsyncClient":
+        if self._client is None:
+            self._client = self.httpx.AsyncClient(timeout=self.httpx.Timeout(30.0, connect=10.0))
+        return self._client
+
+    def _request(self, method: str, key: str, query: Optional[Dict[str, str]] = None, headers: Optional[Dict[str, str]] = None,
+                 content: bytes = b"") -> "httpx.Request":
+        query = query or {}
+        path = f"/{self.bucket}/{quote(key, safe='/~')}"
+        url = self.httpx.URL(self.endpoint + path)
+        headers = sign_v4(method, path, query, {"host": url.netloc.decode(), **(headers or {})}, datetime.now(timezone.utc),
+                          self.region, self.access_key, self.secret_key, payload_hash=_sha256(content))
+        return self.client.build_request(method, url, params=query, headers=headers, content=content)
+
+    async def _send(self, method: str, key: str, **kwargs) -> "httpx.Response":
+        response = await self.client.send(self._request(method, key, **kwargs))
+        response.raise_for_status()
+        return response
+
+    async def save(self, key: str, chunks: AsyncIterable[bytes]) -> None:
+        buffer = bytearray()
+        upload_id = None
+        parts: List[Tuple[int, str]] = []
+        try:
+            async for chunk in chunks:
+                buffer += chunk
+                while len(buffer) >= self.PART_SIZE:
+                    if upload_id is None:
+                        created = await self._send("POST", key, query={"uploads": ""})
+                        upload_id = ElementTree.fromstring(created.content).findtext("{*}UploadId")
+                    part = bytes(buffer[:self.PART_SIZE])
+                    del buffer[:self.PART_SIZE]
+                    parts.append((len(parts) + 1, await self._upload_part(key, upload_id, len(parts) + 1, part)))
+
+            if upload_id is None:
+                # smaller than one part, a single PUT
+                await self._send("PUT", key, content=bytes(buffer))
+                return
+            if buffer:
+                parts.append((len(parts) + 1, await self._upload_part(key, upload_id, len(parts) + 1, bytes(buffer))))
+            body = "".join(f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>" for number, etag in parts)
+            await self._send("POST", key, query={"uploadId": upload_id},
+                             content=f"<CompleteMultipartUpload>{body}</CompleteMultipartUpload>".encode())
+        except BaseException:
+            if upload_id is not None:
+                await self._send("DELETE", key, query={"uploadId": upload_id})
+            raise
+
+    async def _upload_part(self, key: str, upload_id: str, number: int, content: bytes) -> str:
+        response = await self._send("PUT", key, query={"partNumber": str(number), "uploadId": upload_id}, content=content)
+        return response.headers["etag"]
+
+    async def open(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        request = self._request("GET", key, headers={"range": f"bytes={start}-{end}"})
+        response = await self.client.send(request, stream=True)
+        try:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                yield chunk
+        finally:
+            await response.aclose()
+
+    async def delete(self, key: str) -> None:
+        await self._send("DELETE", key)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+async def store(storage: StorageBackend, key: str, chunks: AsyncIterable[bytes], max_bytes: int) -> Tuple[int, str]:
+    """ Save a stream, returning its size and SHA-256 computed as it passes through """
+    digest = hashlib.sha256()
+    size = 0
+
+    async def measured() -> AsyncIterator[bytes]:
+        nonlocal size
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Files are limited to {max_bytes} bytes")
+            digest.update(chunk)
+            yield chunk
+
+    await storage.save(key, measured())
+    return size, digest.hexdigest()
+
+
+@lru_cache()
+def get_storage() -> StorageBackend:
+    settings = get_settings()
+    if settings.storage_backend == "s3":
+        return S3Storage(settings.storage_s3_endpoint, settings.storage_s3_bucket, settings.storage_s3_access_key,
+                         settings.storage_s3_secret_key, settings.storage_s3_region)
+    return LocalStorage(settings.storage_root)
@@ -0,0 +1,46 @@
+"""
+Job tasks, run by the workers of application.jobs.
+"""
+from typing import List
+
+from tortoise.transactions import in_transaction
+
+from application.api.messages import add_unread
+from application.db.app_models import Marks, Message, Submission
+from application.db.gradebook import refresh_assignment_stats
+from application.db.routing import PRIMARY
+from application.jobs import task
+
+
+async def send_notification(sender_id: int, receiver_id: int, content: str) -> None:
+    async with in_transaction(PRIMARY) as connection:
+        await Message.create(sender_id=sender_id, receiver_id=receiver_id, content=content, using_db=connection)
+        await add_unread(receiver_id, 1, connection)
+
+
+@task("gradebook.refresh")
+async def refresh_gradebook(assignment_ids: List[int]) -> None:
+    await refresh_assignment_stats(assignment_ids)
+
+
+@task("notify.mark_posted")
+async def notify_mark_posted(assignment_id: int, student_id: int) -> None:
+    """ Message the student from the course teacher """
+    # by assignment and student, bulk created marks don't hand back their ids on every backend
+    mark = await Marks.filter(assignment_id=assignment_id, student_id=student_id).order_by("-id").first().values(
+        "score", "student_id", "assignment__title", "assignment__course__teacher_id")
+    if not mark:
+        return
+    await send_notification(mark["assignment__course__teacher_id"], mark["student_id"],
+                            f"Your submission for {mark['assignment__title']} was marked {mark['score']}.")
+
+
+@task("notify.submission_received")
+async def notify_submission_received(submission_id: int) -> None:
+    """ Message the course teacher from the student """
+    submission = await Submission.filter(id=submission_id).first().values(
+        "student_id", "assignment__title", "assignment__course__teacher_id")
+    if not submission:
+        return
+    await send_notification(submission["student_id"], submission["assignment__course__teacher_id"],
+                            f"Submitted {submission['assignment__title']}.")
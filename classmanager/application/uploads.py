@@ -0,0 +1,87 @@
+from collections import deque
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette import status
+
+
+class MultipartFile:
+    """
+    One file field of a multipart/form-data request, parsed from the request stream as it arrives. Unlike UploadFile,
+    which spools the whole body to a temporary file before the endpoint runs, only the chunk being parsed is in memory.
+    """
+
+    def __init__(self, request: Request, field: str = "file"):
+        content_type, options = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a multipart/form-data body")
+
+        self.field = field.encode()
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self._stream = request.stream()
+        # (kind, value) parser events not consumed yet, at most the events of one request chunk
+        self._events: deque = deque()
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: dict = {}
+        self._parser = MultipartParser(options[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": lambda: self._events.append(("headers", self._headers)),
+            "on_part_data": lambda data, start, end: self._events.append(("data", bytes(data[start:end]))),
+            "on_part_end": lambda: self._events.append(("end", None)),
+        })
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    async def _read(self) -> bool:
+        try:
+            chunk = await self._stream.__anext__()
+        except StopAsyncIteration:
+            return False
+        self._parser.write(chunk)
+        return True
+
+    async def open(self) -> "MultipartFile":
+        """ Read up to the start of the file's content, skipping the parts before it """
+        while True:
+            while self._events:
+                kind, value = self._events.popleft()
+                if kind != "headers":
+                    continue
+                _, disposition = parse_options_header(value.get(b"content-disposition", b""))
+                if disposition.get(b"name") == self.field and b"filename" in disposition:
+                    # browsers send the bare name, strip any directories other clients include
+                    filename = disposition[b"filename"].decode("utf-8", "replace").replace("\\", "/").rsplit("/", 1)[-1]
+                    self.filename = filename[-255:] or "upload"
+                    self.content_type = value.get(b"content-type", b"application/octet-stream").decode("latin-1")[:100]
+                    return self
+            if not await self._read():
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"No {self.field.decode()} file in the form")
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """ The file's content, call open() first """
+        while True:
+            while self._events:
+                kind, value = self._events.popleft()
+                if kind == "end":
+                    return
+                if kind == "data" and value:
+                    yield value
+            if not await self._read():
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Incomplete multipart body")
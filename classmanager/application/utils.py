@@ -1,11 +1,50 @@
 import asyncio
-from typing import Awaitable
+import base64
+import binascii
+import json
+import os
+import time
+from concurrent.futures import (Executor, ProcessPoolExecutor,
+                                ThreadPoolExecutor)
+from typing import Any, Callable, Optional
 
-from fastapi.concurrency import run_in_threadpool
+from fastapi import HTTPException, Query
 from passlib.context import CryptContext
+from starlette import status
+
+from application.metrics import timed
+
+
+# pagination parameters shared by the list endpoints
+def get_skip(skip: int = Query(0, alias="skip")) -> int:
+    return skip
+
+
+def get_limit(limit: int = Query(10, alias="limit")) -> int:
+    return min(limit, 500)
+
+
+# opaque keyset pagination cursors, the sort key values of the last row of a page
+def encode_cursor(*values: Any) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str, *types: Callable[[Any], Any]) -> tuple:
+    """ Decode a cursor and convert each value with the matching type, a malformed cursor is a 400 """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(values) != len(types):
+            raise ValueError(cursor)
+        return tuple(convert(value) for convert, value in zip(types, values))
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+# bcrypt work factor of new hashes, only lowered where hashes don't need to resist brute forcing, like the test suite
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
 
 # Initialize CryptContext
-crypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+crypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=BCRYPT_ROUNDS)
 
 
 def hash_password(password: str) -> str:
@@ -15,20 +54,116 @@ def hash_password(password: str) -> str:
     return crypt_context.hash(password)
 
 
-""" Hashing is an expensive process , in this case we run it in threadpool to free up the event loop"""
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    """
+    Verify the plaintext password against a hashed one. Synchronous
+    """
+    return crypt_context.verify(plain_password, hashed_password)
+
+
+def _timed(func: Callable, *args: Any) -> tuple[Any, float]:
+    # runs inside the worker so the measured time excludes queueing
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+""" Hashing is an expensive process, in this case we run it in a dedicated pool to free up the event loop
+    without starving the default threadpool used by the rest of the app """
+
+
+class HashingPool:
+    """
+    Bounded worker pool for bcrypt. Requests beyond workers + max_queue are rejected with a 503
+    instead of piling up behind each other.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_queue: int = 64, kind: str = "thread"):
+        if kind not in ("thread", "process"):
+            raise ValueError("kind must be 'thread' or 'process'")
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.kind = kind
+        self._executor: Optional[Executor] = None
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.hash_seconds_total = 0.0
+        self.hash_seconds_max = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return max(self.in_flight - self.workers, 0)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hashing")
+        return self._executor
+
+    async def run(self, func: Callable, *args: Any) -> Any:
+        if self.in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Server is busy, try again shortly",
+                                headers={"Retry-After": "1"})
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            # the request waits for the queue too, so its hash timing is wall clock
+            with timed("hash"):
+                result, elapsed = await loop.run_in_executor(self._get_executor(), _timed, func, *args)
+        finally:
+            self.in_flight -= 1
+
+        self.completed += 1
+        self.hash_seconds_total += elapsed
+        self.hash_seconds_max = max(self.hash_seconds_max, elapsed)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "hash_seconds_total": self.hash_seconds_total,
+            "hash_seconds_max": self.hash_seconds_max,
+            "hash_seconds_avg": self.hash_seconds_total / self.completed if self.completed else 0.0,
+        }
+
+    async def warm_up(self) -> None:
+        """ Start the executor before the first login, a process pool forks its workers on the first call """
+        await asyncio.get_running_loop().run_in_executor(self._get_executor(), int)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+hashing_pool = HashingPool(
+    workers=int(os.environ.get("HASH_POOL_WORKERS", 0)) or None,
+    max_queue=int(os.environ.get("HASH_POOL_MAX_QUEUE", 64)),
+    kind=os.environ.get("HASH_POOL_KIND", "thread"),
+)
 
 
-# this is done by wrapping the synchronous function into an async function and passing it to run_in_thread_pool function
-async def async_hash_password(password: str) -> Awaitable[str]:
+async def async_hash_password(password: str) -> str:
     """
     Hashing the plaintext password asynchronously.
     """
-    return await run_in_threadpool(hash_password, password)
+    return await hashing_pool.run(hash_password, password)
 
 
 async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verify the plaintext password against a hashed one.
     """
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, crypt_context.verify, plain_password, hashed_password)
+    return await hashing_pool.run(check_password, plain_password, hashed_password)
@@ -0,0 +1,39 @@
+"""
+Dedicated background job worker, for running jobs outside the web workers.
+
+    python -m application.worker --concurrency 20
+
+Set JOBS_IN_PROCESS=0 on the web workers when every job should run here. SIGTERM and SIGINT stop claiming new jobs
+and exit once the running ones have finished.
+"""
+import argparse
+import asyncio
+import signal
+
+from tortoise import Tortoise
+
+import application.tasks  # noqa: F401 registers the tasks
+from application.config import get_settings
+from application.db.database_config import tortoise_config
+from application.jobs import Worker
+
+
+async def main(concurrency: int, poll_interval: float) -> None:
+    settings = get_settings()
+    worker = Worker(concurrency, poll_interval, settings.jobs_visibility_timeout, settings.jobs_retention_hours)
+    await Tortoise.init(config=tortoise_config(settings))
+    try:
+        loop = asyncio.get_running_loop()
+        for stop_signal in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(stop_signal, lambda: asyncio.ensure_future(worker.stop()))
+        await worker.run()
+    finally:
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=get_settings().jobs_concurrency, help="jobs run at the same time")
+    parser.add_argument("--poll-interval", type=float, default=get_settings().jobs_poll_interval, help="seconds between claims when idle")
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency, args.poll_interval))
@@ -0,0 +1,149 @@
+"""
+A synthetic school, bulk inserted into an empty database.
+
+Teachers teach courses with assignments, students are enrolled in a few courses each, submit most assignments and
+most submissions are marked. Every course has notices and every student some unread messages from a teacher.
+The same seed gives the same school, so runs against different commits measure the same data.
+"""
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+from application.db.app_models import (Assignment, Course, Enrollment, Marks,
+                                       Message, MessageCounter, Notice,
+                                       Submission, User, UserRole)
+
+BATCH_SIZE = 5000
+
+
+@dataclass
+class DatasetSize:
+    teachers: int = 20
+    courses_per_teacher: int = 3
+    students: int = 2000
+    courses_per_student: int = 4
+    assignments_per_course: int = 10
+    # share of (enrolled student, assignment) pairs with a submission, and of submissions with a mark
+    submission_rate: float = 0.8
+    marked_rate: float = 0.75
+    notices_per_course: int = 5
+    messages_per_student: int = 5
+
+
+@dataclass
+class Dataset:
+    """ Ids of the seeded rows, for building requests """
+    size: DatasetSize
+    teachers: List[int] = field(default_factory=list)
+    students: List[int] = field(default_factory=list)
+    # user id -> (username, role), for issuing tokens
+    users: Dict[int, Tuple[str, str]] = field(default_factory=dict)
+    # course id -> teacher id
+    courses: Dict[int, int] = field(default_factory=dict)
+    # course id -> assignment ids, and assignment id -> course id
+    assignments: Dict[int, List[int]] = field(default_factory=dict)
+    assignment_courses: Dict[int, int] = field(default_factory=dict)
+    # student id -> course ids
+    enrollments: Dict[int, List[int]] = field(default_factory=dict)
+    # (assignment id, student id) pairs without a submission, with an unmarked submission, and with a mark
+    unsubmitted: List[Tuple[int, int]] = field(default_factory=list)
+    unmarked: List[Tuple[int, int]] = field(default_factory=list)
+    marked: List[Tuple[int, int]] = field(default_factory=list)
+
+    def counts(self) -> dict:
+        return {
+            "teachers": len(self.teachers),
+            "students": len(self.students),
+            "courses": len(self.courses),
+            "assignments": sum(len(assignment_ids) for assignment_ids in self.assignments.values()),
+            "enrollments": sum(len(course_ids) for course_ids in self.enrollments.values()),
+            "submissions": len(self.unmarked) + len(self.marked),
+            "marks": len(self.marked),
+            "notices": len(self.courses) * self.size.notices_per_course,
+            "messages": len(self.students) * self.size.messages_per_student,
+        }
+
+
+async def bulk_insert(model, rows: list) -> None:
+    for start in range(0, len(rows), BATCH_SIZE):
+        await model.bulk_create(rows[start:start + BATCH_SIZE])
+
+
+async def user_ids(dataset: Dataset, prefix: str, role: UserRole) -> List[int]:
+    # bulk_create doesn't hand back ids on every backend, the usernames are unique
+    users = sorted(await User.filter(username__startswith=prefix).values_list("username", "id"))
+    dataset.users.update({user_id: (username, role.value) for username, user_id in users})
+    return [user_id for _, user_id in users]
+
+
+async def seed(size: DatasetSize, seed: int = 1) -> Dataset:
+    rng = random.Random(seed)
+    dataset = Dataset(size)
+
+    await bulk_insert(User, [
+        User(first_name="Teacher", last_name=f"Number{i}", username=f"teacher{i:06d}", email=f"teacher{i}@school.bench",
+             password_hash="not-a-hash", role=UserRole.TEACHER)
+        for i in range(size.teachers)
+    ])
+    await bulk_insert(User, [
+        User(first_name="Student", last_name=f"Number{i}", username=f"student{i:07d}", email=f"student{i}@school.bench",
+             password_hash="not-a-hash", role=UserRole.STUDENT)
+        for i in range(size.students)
+    ])
+    dataset.teachers = await user_ids(dataset, "teacher", UserRole.TEACHER)
+    dataset.students = await user_ids(dataset, "student", UserRole.STUDENT)
+
+    await bulk_insert(Course, [
+        Course(course_code=f"C{number:05d}", title=f"Course {number}", teacher_id=teacher_id)
+        for number, teacher_id in enumerate(teacher_id for teacher_id in dataset.teachers for _ in range(size.courses_per_teacher))
+    ])
+    dataset.courses = dict(await Course.all().order_by("id").values_list("id", "teacher_id"))
+
+    due_date = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    await bulk_insert(Assignment, [
+        Assignment(course_id=course_id, title=f"Assignment {number}", description="Synthetic assignment", due_date=due_date)
+        for course_id in dataset.courses for number in range(size.assignments_per_course)
+    ])
+    for assignment_id, course_id in await Assignment.all().order_by("id").values_list("id", "course_id"):
+        dataset.assignments.setdefault(course_id, []).append(assignment_id)
+        dataset.assignment_courses[assignment_id] = course_id
+
+    course_ids = list(dataset.courses)
+    enrollments, submissions, marks = [], [], []
+    for student_id in dataset.students:
+        dataset.enrollments[student_id] = rng.sample(course_ids, min(size.courses_per_student, len(course_ids)))
+        for course_id in dataset.enrollments[student_id]:
+            enrollments.append(Enrollment(student_id=student_id, course_id=course_id))
+            for assignment_id in dataset.assignments.get(course_id, []):
+                if rng.random() >= size.submission_rate:
+                    dataset.unsubmitted.append((assignment_id, student_id))
+                    continue
+                submissions.append(Submission(student_id=student_id, assignment_id=assignment_id))
+                if rng.random() < size.marked_rate:
+                    dataset.marked.append((assignment_id, student_id))
+                    marks.append(Marks(student_id=student_id, assignment_id=assignment_id, score=rng.randint(30, 100)))
+                else:
+                    dataset.unmarked.append((assignment_id, student_id))
+    await bulk_insert(Enrollment, enrollments)
+    await bulk_insert(Submission, submissions)
+    await bulk_insert(Marks, marks)
+
+    await bulk_insert(Notice, [
+        Notice(course_id=course_id, title=f"Notice {number}", content="Synthetic notice")
+        for course_id in course_ids for number in range(size.notices_per_course)
+    ])
+    sent_at = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    await bulk_insert(Message, [
+        Message(sender_id=dataset.courses[dataset.enrollments[student_id][0]], receiver_id=student_id, content=f"Message {number}",
+                date_sent=sent_at + timedelta(seconds=number))
+        for student_id in dataset.students if dataset.enrollments[student_id] for number in range(size.messages_per_student)
+    ])
+    await bulk_insert(MessageCounter, [
+        MessageCounter(user_id=student_id, unread=size.messages_per_student) for student_id in dataset.students if dataset.enrollments[student_id]
+    ])
+
+    # requests take them from the end, shuffled so the writes spread over courses
+    rng.shuffle(dataset.unsubmitted)
+    rng.shuffle(dataset.unmarked)
+    return dataset
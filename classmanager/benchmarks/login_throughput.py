@@ -0,0 +1,102 @@
+"""
+Login throughput under concurrent load, default executor vs the dedicated hashing pool.
+
+    python -m benchmarks.login_throughput --concurrency 32 --requests 256
+
+While the logins run, a probe keeps submitting a trivial job to the event loop's default executor and records
+how long it waits, which is what unrelated sync work sharing that executor experiences during a login burst.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-benchmark-secret-key")
+os.environ.setdefault("HASH_POOL_MAX_QUEUE", "100000")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+import httpx  # noqa: E402
+from tortoise import Tortoise  # noqa: E402
+
+from application import utils  # noqa: E402
+from application.api import auth  # noqa: E402
+from application.main import create_application  # noqa: E402
+
+USERNAME = "BenchUser01"
+PASSWORD = "StrongPass1!"
+
+
+async def default_executor_verify(plain_password: str, hashed_password: str) -> bool:
+    # the implementation before the dedicated pool
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, utils.crypt_context.verify, plain_password, hashed_password)
+
+
+async def probe(stop: asyncio.Event, waits: list) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.get_running_loop().run_in_executor(None, time.sleep, 0)
+        waits.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+
+
+async def run(concurrency: int, total: int) -> dict:
+    app = create_application()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async with httpx.AsyncClient(app=app, base_url="http://benchmark") as client:
+        async def login() -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/auth/login/", json={"username": USERNAME, "password": PASSWORD})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        stop, waits = asyncio.Event(), []
+        probe_task = asyncio.create_task(probe(stop, waits))
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await probe_task
+
+    latencies.sort()
+    waits.sort()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "logins_per_second": round(total / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+        "default_executor_probe_p95_ms": round(waits[int(len(waits) * 0.95) - 1] * 1000, 2) if waits else None,
+    }
+
+
+async def main(concurrency: int, total: int) -> None:
+    await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["application.db.app_models"]})
+    await Tortoise.generate_schemas()
+    await auth.User.create(first_name="Bench", last_name="User", username=USERNAME, email="bench@bench.com",
+                           password_hash=utils.hash_password(PASSWORD), role=auth.UserRole.STUDENT)
+
+    results = {}
+    pooled_verify = auth.verify_password
+    auth.verify_password = default_executor_verify
+    results["before_default_executor"] = await run(concurrency, total)
+    auth.verify_password = pooled_verify
+    results["after_hashing_pool"] = await run(concurrency, total)
+    results["after_hashing_pool"]["pool"] = utils.hashing_pool.stats()
+
+    utils.hashing_pool.shutdown()
+    await Tortoise.close_connections()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=256)
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency, args.requests))
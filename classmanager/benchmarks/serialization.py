@@ -0,0 +1,76 @@
+"""
+Serialization time of list responses, FastAPI's default path vs render_json.
+
+    python -m benchmarks.serialization --rows 1000 10000
+
+default:      response_model validation + serialization in serialize_response, then JSONResponse
+encoder:      jsonable_encoder + JSONResponse, what a plain dict/list return costs
+render_json:  pydantic-core dump_json of the already validated models, what ModelResponse does
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import List
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-benchmark-secret-key")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+from application.db.app_models import Marks_Pydantic  # noqa: E402
+from application.pydantic import CustomAssignment_Pydantic  # noqa: E402
+from application.responses import FastJSONResponse, render_json  # noqa: E402
+
+NOW = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+
+def assignments(rows: int) -> list:
+    return [CustomAssignment_Pydantic(id=i + 1, title=f"Assignment {i}", description="Read chapters one to three and summarise",
+                                      due_date=NOW, file_path=None, created_at=NOW, updated_at=NOW) for i in range(rows)]
+
+
+def marks(rows: int) -> list:
+    return [Marks_Pydantic(id=i + 1, score=i % 100 + 1, comments="Well argued", created_at=NOW, updated_at=NOW) for i in range(rows)]
+
+
+def best_of(function, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return round(min(timings) * 1000, 3)
+
+
+def measure(model, items: list) -> dict:
+    field = create_response_field(name="response", type_=List[model])
+
+    def default_path():
+        content = asyncio.run(serialize_response(field=field, response_content=items))
+        return FastJSONResponse(content).body
+
+    return {
+        "default_ms": best_of(default_path),
+        "encoder_ms": best_of(lambda: JSONResponse(jsonable_encoder(items)).body),
+        "render_json_ms": best_of(lambda: render_json(items)),
+    }
+
+
+def main(row_counts: List[int]) -> None:
+    results = {}
+    for rows in row_counts:
+        results[f"CustomAssignment_Pydantic x {rows}"] = measure(CustomAssignment_Pydantic, assignments(rows))
+        results[f"Marks_Pydantic x {rows}"] = measure(Marks_Pydantic, marks(rows))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    args = parser.parse_args()
+    main(args.rows)
@@ -0,0 +1,18 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS "idx_users_usernam_trgm" ON "users" USING GIN (UPPER(CAST("username" AS VARCHAR)) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS "idx_users_first_n_trgm" ON "users" USING GIN (UPPER(CAST("first_name" AS VARCHAR)) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS "idx_users_last_na_trgm" ON "users" USING GIN (UPPER(CAST("last_name" AS VARCHAR)) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS "idx_users_email_trgm" ON "users" USING GIN (UPPER(CAST("email" AS VARCHAR)) gin_trgm_ops);"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_users_usernam_trgm";
+DROP INDEX IF EXISTS "idx_users_first_n_trgm";
+DROP INDEX IF EXISTS "idx_users_last_na_trgm";
+DROP INDEX IF EXISTS "idx_users_email_trgm";"""
@@ -0,0 +1,22 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "assignment_stats" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "marks_count" INT NOT NULL  DEFAULT 0,
+    "mean" DOUBLE PRECISION,
+    "median" DOUBLE PRECISION,
+    "min_score" INT,
+    "max_score" INT,
+    "stddev" DOUBLE PRECISION,
+    "updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "assignment_id" INT NOT NULL UNIQUE REFERENCES "assignments" ("id") ON DELETE CASCADE
+);
+COMMENT ON TABLE "assignment_stats" IS 'Materialized per assignment mark statistics, maintained when gradebook_summary is enabled';"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "assignment_stats";"""
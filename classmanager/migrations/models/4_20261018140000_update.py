@@ -0,0 +1,27 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE INDEX IF NOT EXISTS "idx_courses_teacher_b4fa0a" ON "courses" ("teacher_id");
+CREATE INDEX IF NOT EXISTS "idx_assignments_course__297096" ON "assignments" ("course_id");
+CREATE INDEX IF NOT EXISTS "idx_enrollments_course__a49191" ON "enrollments" ("course_id");
+CREATE INDEX IF NOT EXISTS "idx_marks_student_28a3f0" ON "marks" ("student_id");
+CREATE INDEX IF NOT EXISTS "idx_marks_assignm_e52c0f" ON "marks" ("assignment_id", "student_id");
+CREATE INDEX IF NOT EXISTS "idx_messages_receive_683db0" ON "messages" ("receiver_id");
+CREATE INDEX IF NOT EXISTS "idx_messages_sender__0cb83e" ON "messages" ("sender_id");
+CREATE INDEX IF NOT EXISTS "idx_notices_course__6c6d04" ON "notices" ("course_id");
+CREATE INDEX IF NOT EXISTS "idx_submissions_assignm_89049a" ON "submissions" ("assignment_id");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_courses_teacher_b4fa0a";
+DROP INDEX IF EXISTS "idx_assignments_course__297096";
+DROP INDEX IF EXISTS "idx_enrollments_course__a49191";
+DROP INDEX IF EXISTS "idx_marks_student_28a3f0";
+DROP INDEX IF EXISTS "idx_marks_assignm_e52c0f";
+DROP INDEX IF EXISTS "idx_messages_receive_683db0";
+DROP INDEX IF EXISTS "idx_messages_sender__0cb83e";
+DROP INDEX IF EXISTS "idx_notices_course__6c6d04";
+DROP INDEX IF EXISTS "idx_submissions_assignm_89049a";"""
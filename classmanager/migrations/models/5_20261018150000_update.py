@@ -0,0 +1,27 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "messages" ADD "is_read" BOOL NOT NULL  DEFAULT False;
+DROP INDEX IF EXISTS "idx_messages_receive_683db0";
+DROP INDEX IF EXISTS "idx_messages_sender__0cb83e";
+CREATE INDEX IF NOT EXISTS "idx_messages_receive_d7f543" ON "messages" ("receiver_id", "date_sent", "id");
+CREATE INDEX IF NOT EXISTS "idx_messages_sender__a028c3" ON "messages" ("sender_id", "receiver_id", "date_sent", "id");
+CREATE TABLE IF NOT EXISTS "message_counters" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "unread" INT NOT NULL  DEFAULT 0,
+    "user_id" INT NOT NULL UNIQUE REFERENCES "users" ("id") ON DELETE CASCADE
+);
+COMMENT ON TABLE "message_counters" IS 'Unread messages per user, changed in the same transaction as the messages so the inbox never counts rows';
+INSERT INTO "message_counters" ("user_id", "unread") SELECT "receiver_id", COUNT(*) FROM "messages" GROUP BY "receiver_id";"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "message_counters";
+DROP INDEX IF EXISTS "idx_messages_receive_d7f543";
+DROP INDEX IF EXISTS "idx_messages_sender__a028c3";
+CREATE INDEX IF NOT EXISTS "idx_messages_receive_683db0" ON "messages" ("receiver_id");
+CREATE INDEX IF NOT EXISTS "idx_messages_sender__0cb83e" ON "messages" ("sender_id");
+ALTER TABLE "messages" DROP COLUMN "is_read";"""
@@ -0,0 +1,21 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "files" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "key" VARCHAR(255) NOT NULL UNIQUE,
+    "filename" VARCHAR(255) NOT NULL,
+    "content_type" VARCHAR(100) NOT NULL,
+    "size" BIGINT NOT NULL,
+    "sha256" VARCHAR(64) NOT NULL,
+    "created_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "uploaded_by_id" INT NOT NULL REFERENCES "users" ("id") ON DELETE CASCADE
+);
+COMMENT ON TABLE "files" IS 'An uploaded file in the storage backend, Assignment.file_path and Submission.file_path hold its key';"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "files";"""
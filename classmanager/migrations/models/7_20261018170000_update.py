@@ -0,0 +1,26 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "jobs" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "task" VARCHAR(100) NOT NULL,
+    "payload" JSONB NOT NULL,
+    "status" VARCHAR(10) NOT NULL  DEFAULT 'queued',
+    "attempts" INT NOT NULL  DEFAULT 0,
+    "max_attempts" INT NOT NULL  DEFAULT 5,
+    "run_at" TIMESTAMPTZ NOT NULL,
+    "locked_until" TIMESTAMPTZ,
+    "last_error" TEXT,
+    "created_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "finished_at" TIMESTAMPTZ
+);
+CREATE INDEX IF NOT EXISTS "idx_jobs_status_e68467" ON "jobs" ("status", "run_at");
+COMMENT ON COLUMN "jobs"."status" IS 'QUEUED: queued\nRUNNING: running\nDONE: done\nFAILED: failed';
+COMMENT ON TABLE "jobs" IS 'A background job, queued and run by application.jobs';"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "jobs";"""
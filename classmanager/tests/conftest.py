@@ -1,22 +1,151 @@
+import asyncio
+import logging
 import os
+import shutil
+from dataclasses import dataclass, field
+from functools import partial
+from typing import List, Optional
+from urllib.parse import urlsplit, urlunsplit
 
-import pytest
-from starlette.testclient import TestClient
-from tortoise.contrib.fastapi import register_tortoise
+# cheap password hashes, read when the application is imported
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
 
-from application.config import Settings, get_settings
-from application.main import create_application
+import asyncpg  # noqa: E402
+import pytest  # noqa: E402
+from anyio.from_thread import start_blocking_portal  # noqa: E402
+from starlette.testclient import TestClient  # noqa: E402
+from tortoise import Tortoise  # noqa: E402
+from tortoise.backends.base.config_generator import expand_db_url  # noqa: E402
+from tortoise.contrib.fastapi import register_tortoise  # noqa: E402
 
+from application.api.auth import create_access_token  # noqa: E402
+from application.api.auth import user_cache, user_claims  # noqa: E402
+from application.cache import response_cache  # noqa: E402
+from application.config import Settings, get_settings  # noqa: E402
+from application.db.app_models import (Assignment, Course,  # noqa: E402
+                                       Enrollment, Submission, User, UserRole)
+from application.db.database_config import tortoise_config  # noqa: E402
+from application.db.routing import PRIMARY  # noqa: E402
+from application.jobs import Worker  # noqa: E402
+from application.main import create_application  # noqa: E402
+from application.ratelimit import rate_limiter  # noqa: E402
+from benchmarks.dataset import DatasetSize, bulk_insert  # noqa: E402
+from benchmarks.dataset import seed as seed_school  # noqa: E402
 
-def get_settings_override():
-    return Settings(testing=1, database_url=os.environ.get("DATABASE_TEST_URL"))
+MEMORY_URL = "sqlite://:memory:"
+
+SMALL_SCHOOL = DatasetSize(teachers=3, courses_per_teacher=2, students=40, courses_per_student=2, assignments_per_course=3,
+                           notices_per_course=2, messages_per_student=2)
+
+
+class TestDatabase:
+    """
+    Every test starts from an empty database with the schema, so tests don't see each other's rows and pass in any order.
+
+    The schema is generated once per session into a template and each test gets a copy of it: a file copy for
+    sqlite, CREATE DATABASE ... TEMPLATE for postgres. Without DATABASE_TEST_URL the tests run on in memory sqlite,
+    a new empty database per connection, whose schema is generated per test as that takes a few milliseconds.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.in_memory = url == MEMORY_URL
+        self.connection = expand_db_url(url)
+        self.postgres = self.connection["engine"] == "tortoise.backends.asyncpg"
+        if self.postgres:
+            self.name = self.connection["credentials"]["database"]
+            self.template = f"{self.name}_template"
+        elif not self.in_memory:
+            self.path = self.connection["credentials"]["file_path"]
+            self.template = f"{self.path}.template"
+
+    def settings(self, **changes) -> Settings:
+        return Settings(testing=1, database_url=None if self.in_memory else self.url, **changes)
+
+    def config(self, settings: Settings) -> dict:
+        config = tortoise_config(settings)
+        if self.in_memory:
+            config["connections"][PRIMARY] = MEMORY_URL
+        return config
+
+    async def _admin(self) -> asyncpg.Connection:
+        credentials = self.connection["credentials"]
+        return await asyncpg.connect(host=credentials["host"], port=credentials["port"], user=credentials["user"],
+                                     password=credentials["password"], database="postgres")
+
+    async def _create_template(self) -> None:
+        if self.postgres:
+            admin = await self._admin()
+            try:
+                await admin.execute(f'DROP DATABASE IF EXISTS "{self.template}"')
+                await admin.execute(f'CREATE DATABASE "{self.template}"')
+            finally:
+                await admin.close()
+            url = urlunsplit(urlsplit(self.url)._replace(path=f"/{self.template}"))
+        else:
+            self._remove(self.template)
+            url = f"sqlite://{self.template}"
+        await Tortoise.init(db_url=url, modules={"models": ["application.db.app_models"]})
+        await Tortoise.generate_schemas()
+        await Tortoise.close_connections()
+
+    async def _clone(self) -> None:
+        admin = await self._admin()
+        try:
+            await admin.execute(f'DROP DATABASE IF EXISTS "{self.name}"')
+            await admin.execute(f'CREATE DATABASE "{self.name}" TEMPLATE "{self.template}"')
+        finally:
+            await admin.close()
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        for suffix in ("", "-journal", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    def create_template(self) -> None:
+        if not self.in_memory:
+            asyncio.run(self._create_template())
+
+    def reset(self) -> None:
+        """ Replace the test database with a copy of the template """
+        if self.postgres:
+            asyncio.run(self._clone())
+        elif not self.in_memory:
+            self._remove(self.path)
+            shutil.copyfile(self.template, self.path)
+
+    def drop_template(self) -> None:
+        if self.postgres:
+            async def drop():
+                admin = await self._admin()
+                try:
+                    await admin.execute(f'DROP DATABASE IF EXISTS "{self.template}"')
+                finally:
+                    await admin.close()
+            asyncio.run(drop())
+        elif not self.in_memory:
+            self._remove(self.template)
+
+    def init(self, app, settings: Settings) -> None:
+        """ Start the app on a fresh copy of the database """
+        self.reset()
+        register_tortoise(app, config=self.config(settings), generate_schemas=self.in_memory, add_exception_handlers=True)
+
+
+@pytest.fixture(scope="session")
+def test_database():
+    database = TestDatabase(os.environ.get("DATABASE_TEST_URL") or MEMORY_URL)
+    database.create_template()
+    yield database
+    database.drop_template()
 
 
 @pytest.fixture(scope="module")
-def test_app():
+def test_app(test_database):
     # set up
     app = create_application()
-    app.dependency_overrides[get_settings] = get_settings_override
+    app.dependency_overrides[get_settings] = lambda: test_database.settings()
     with TestClient(app) as test_client:
         # testing
         yield test_client
@@ -25,19 +154,173 @@ def test_app():
 
 
 @pytest.fixture(scope="function")
-def test_app_with_db():
+def test_app_with_db(test_database):
     # set up
     app = create_application()
-    app.dependency_overrides[get_settings] = get_settings_override
-    register_tortoise(
-        app,
-        db_url=os.environ.get("DATABASE_TEST_URL"),
-        modules={"models": ["application.db.app_models"]},
-        generate_schemas=True,
-        add_exception_handlers=True,
-    )
+    app.dependency_overrides[get_settings] = lambda: test_database.settings()
+    test_database.init(app, test_database.settings())
     with TestClient(app) as test_client:
         # testing
         yield test_client
 
     # tear down
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    yield
+    # ids start over in the next test's database, nothing cached by id may outlive the test
+    user_cache.clear()
+    asyncio.run(response_cache.clear())
+    asyncio.run(rate_limiter.clear())
+
+
+async def init_memory_db():
+    await Tortoise.init(db_url=MEMORY_URL, modules={"models": ["application.db.app_models"]})
+    await Tortoise.generate_schemas()
+
+
+@pytest.fixture(scope="function")
+def memory_db():
+    """ Portal into an event loop with Tortoise on a new in memory database, for tests that don't need the app """
+    with start_blocking_portal() as portal:
+        portal.call(init_memory_db)
+        yield portal
+        portal.call(Tortoise.close_connections)
+
+
+class QueryCounter(logging.Handler):
+    """ Counts the statements Tortoise sends to the database, it logs every one of them at debug level """
+
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.queries = []
+        # (sql, values) of the parameterized statements, for running EXPLAIN on them
+        self.statements = []
+
+    def emit(self, record):
+        if not record.msg.startswith(("Created connection", "Closed connection")):
+            self.queries.append(record.getMessage())
+            if record.msg == "%s: %s":
+                self.statements.append(record.args)
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    def reset(self):
+        self.queries.clear()
+        self.statements.clear()
+
+
+@pytest.fixture(scope="function")
+def school(test_app_with_db):
+    """ A small benchmarks.dataset school in the test database """
+    return test_app_with_db.portal.call(seed_school, SMALL_SCHOOL)
+
+
+@pytest.fixture(scope="function")
+def run_jobs(test_app_with_db):
+    """ Runs every due background job, the test apps have no in-process job worker """
+    def run():
+        worker = Worker()
+        while test_app_with_db.portal.call(worker.run_once):
+            pass
+        return worker
+    return run
+
+
+@pytest.fixture(scope="function")
+def query_counter():
+    logger = logging.getLogger("tortoise.db_client")
+    counter = QueryCounter()
+    previous_level = logger.level
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(counter)
+    yield counter
+    logger.removeHandler(counter)
+    logger.setLevel(previous_level)
+
+
+@pytest.fixture(scope="function")
+def login_as(request):
+    """ Signs a user in on a test client, test_app_with_db unless another client is given """
+    def login(user: User, client=None):
+        client = client or request.getfixturevalue("test_app_with_db")
+        client.cookies.set("access_token", create_access_token(data=user_claims(user)))
+        return client
+    return login
+
+
+@dataclass
+class SeededCourse:
+    teacher: User
+    course: Course
+    # enrolled in the course, and students who are not
+    students: List[User] = field(default_factory=list)
+    outsiders: List[User] = field(default_factory=list)
+    assignments: List[Assignment] = field(default_factory=list)
+
+
+async def create_users(usernames, role: UserRole, using_db=None) -> List[User]:
+    await User.bulk_create([
+        # no password matches the hash, tests sign users in with login_as
+        User(first_name="Test", last_name=role.value.title(), username=username, email=f"{username.lower()}@tests.com",
+             password_hash="not-a-hash", role=role)
+        for username in usernames
+    ], using_db=using_db)
+    users = {user.username: user for user in await User.filter(username__in=usernames).using_db(using_db)}
+    return [users[username] for username in usernames]
+
+
+async def create_course(code: str, students: int, outsiders: int, assignments: int, submitted: bool, teacher: Optional[User]) -> SeededCourse:
+    prefix = code.lower()
+    if teacher is None:
+        [teacher] = await create_users([f"{prefix}teacher"], UserRole.TEACHER)
+    course = await Course.create(course_code=code, title=f"Course {code}", teacher=teacher)
+    seeded = SeededCourse(teacher, course)
+    seeded.students = await create_users([f"{prefix}student{i}" for i in range(students)], UserRole.STUDENT)
+    seeded.outsiders = await create_users([f"{prefix}outsider{i}" for i in range(outsiders)], UserRole.STUDENT)
+    await Enrollment.bulk_create([Enrollment(student=student, course=course) for student in seeded.students])
+    seeded.assignments = [
+        await Assignment.create(course=course, title=f"{code} assignment {i}", description="graded", due_date="2030-01-01T00:00:00")
+        for i in range(assignments)
+    ]
+    if submitted:
+        await Submission.bulk_create([Submission(student=student, assignment=assignment) for assignment in seeded.assignments for student in seeded.students])
+    return seeded
+
+
+class Seeder:
+    """ Creates the rows a test starts from, in the database of test_app_with_db or of the given test client """
+
+    def __init__(self, request, client=None):
+        self.request = request
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client or self.request.getfixturevalue("test_app_with_db")
+
+    def into(self, client) -> "Seeder":
+        return Seeder(self.request, client)
+
+    def users(self, *usernames: str, role: UserRole = UserRole.STUDENT, using_db=None) -> List[User]:
+        return self.client.portal.call(partial(create_users, list(usernames), role, using_db))
+
+    def course(self, code: str, students: int = 0, outsiders: int = 0, assignments: int = 0, submitted: bool = False,
+               teacher: Optional[User] = None) -> SeededCourse:
+        """
+        A course with its teacher unless one is given, enrolled students, students who are not and assignments,
+        submitted by every enrolled student when submitted is set
+        """
+        return self.client.portal.call(partial(create_course, code, students, outsiders, assignments, submitted, teacher))
+
+    def rows(self, model, rows: list) -> None:
+        """ Any other rows, marks or submissions of the seeded users """
+        self.client.portal.call(bulk_insert, model, rows)
+
+
+@pytest.fixture(scope="function")
+def seed(request):
+    return Seeder(request)
@@ -0,0 +1,40 @@
+from application.cache import response_cache
+
+
+def test_teacher_assignments_cache_is_invalidated_by_create_assignment(test_app_with_db, seed, login_as):
+    seeded = seed.course("CCH1")
+    course_id = seeded.course.id
+    login_as(seeded.teacher)
+
+    def create(title):
+        assignment = {"course_id": course_id, "title": title, "description": "cached listing", "due_date": "12-31-2030"}
+        assert test_app_with_db.post("/assignment/create-assignment/", json=assignment).status_code == 201
+
+    create("First cached assignment")
+    hits = response_cache.hits
+    assert len(test_app_with_db.get("/assignment/teacher/assignments").json()) == 1
+    assert len(test_app_with_db.get("/assignment/teacher/assignments").json()) == 1
+    assert response_cache.hits == hits + 1
+
+    create("Second cached assignment")
+    assert len(test_app_with_db.get("/assignment/teacher/assignments").json()) == 2
+    assert test_app_with_db.get("/env/response-cache").json()["invalidations"] >= 2
+
+
+def test_submit_assignment_validates_in_one_query(test_app_with_db, query_counter, seed, login_as):
+    seeded = seed.course("SUB1", students=1, outsiders=1, assignments=1)
+    assignment_id = seeded.assignments[0].id
+
+    login_as(seeded.students[0])
+    query_counter.reset()
+    response = test_app_with_db.post("/assignment/student/submit-assignment/", json={"assignment_id": assignment_id})
+    assert response.status_code == 201
+    # the validation query, the insert and the queued notification
+    assert query_counter.count == 3
+
+    response = test_app_with_db.post("/assignment/student/submit-assignment/", json={"assignment_id": assignment_id + 1000})
+    assert response.status_code == 404
+
+    login_as(seeded.outsiders[0])
+    response = test_app_with_db.post("/assignment/student/submit-assignment/", json={"assignment_id": assignment_id})
+    assert response.status_code == 403
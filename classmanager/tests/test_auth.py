@@ -1,5 +1,7 @@
 import json
 
+from application.api.auth import decode_token, user_cache
+
 
 def test_register_user(test_app_with_db):
     data = {
@@ -57,3 +59,70 @@ def test_change_password(test_app_with_db):
     response = test_app_with_db.post("/auth/change-password/", json=change_password_data)
     assert response.status_code == 200
     assert response.json()["message"] == "Password changed successfully"
+
+
+def test_login_token_carries_id_and_role(test_app_with_db):
+    data = {
+        "first_name": "Tolu",
+        "last_name": "Teacher",
+        "username": "ToluTeacher1",
+        "email": "tolu@teacher.com",
+        "password": "StrongPass1!",
+        "role": "teacher",
+    }
+    test_app_with_db.post("/auth/register-user/", json=data)
+
+    response = test_app_with_db.post("/auth/login/", json={"username": "ToluTeacher1", "password": "StrongPass1!"})
+    payload = decode_token(response.cookies["access_token"])
+    assert payload["username"] == "ToluTeacher1"
+    assert payload["role"] == "teacher"
+    assert isinstance(payload["user_id"], int)
+
+
+def test_current_user_is_cached_and_invalidated(test_app_with_db):
+    data = {
+        "first_name": "Cache",
+        "last_name": "Student",
+        "username": "CacheStudent1",
+        "email": "cache@student.com",
+        "password": "StrongPass1!",
+        "role": "student",
+    }
+    test_app_with_db.post("/auth/register-user/", json=data)
+    response = test_app_with_db.post("/auth/login/", json={"username": "CacheStudent1", "password": "StrongPass1!"})
+    token = response.cookies["access_token"]
+    user_id = decode_token(token)["user_id"]
+    test_app_with_db.cookies.set("access_token", token)
+
+    user_cache.clear()
+    assert test_app_with_db.get("/users/").status_code == 200
+    assert user_id in user_cache
+
+    test_app_with_db.post("/auth/change-password/", json={
+        "username": "CacheStudent1",
+        "password": "StrongPass1!",
+        "new_password": "NewStrongPass1!"
+    })
+    assert user_id not in user_cache
+
+    # deactivated users are rejected even though their token is still valid
+    assert test_app_with_db.patch(f"/users/{user_id}/deactivate").status_code == 204
+    test_app_with_db.cookies.set("access_token", token)
+    assert test_app_with_db.get("/users/").status_code == 401
+
+
+def test_deactivated_user_cannot_log_in_or_change_password(test_app_with_db):
+    test_app_with_db.post("/auth/register-user/", json={
+        "first_name": "Gone", "last_name": "Student", "username": "GoneStudent1", "email": "gone@student.com",
+        "password": "StrongPass1!", "role": "student",
+    })
+    credentials = {"username": "GoneStudent1", "password": "StrongPass1!"}
+    token = test_app_with_db.post("/auth/login/", json=credentials).cookies["access_token"]
+    test_app_with_db.cookies.set("access_token", token)
+    assert test_app_with_db.patch(f"/users/{decode_token(token)['user_id']}/deactivate").status_code == 204
+
+    response = test_app_with_db.post("/auth/login/", json=credentials)
+    assert response.status_code == 401
+    assert "access_token" not in response.cookies
+    response = test_app_with_db.post("/auth/change-password/", json={**credentials, "new_password": "NewStrongPass1!"})
+    assert response.status_code == 401
@@ -0,0 +1,24 @@
+import random
+
+import httpx
+
+from benchmarks.load import ENDPOINTS, drive
+
+
+def test_school_dataset_is_consistent(school):
+    counts = school.counts()
+    assert (counts["teachers"], counts["students"], counts["courses"], counts["assignments"]) == (3, 40, 6, 18)
+    assert counts["enrollments"] == 80
+    assert len(school.marked) + len(school.unmarked) + len(school.unsubmitted) == 80 * 3
+
+
+def test_load_benchmark_drives_every_endpoint_without_errors(test_app_with_db, school):
+    async def run():
+        async with httpx.AsyncClient(app=test_app_with_db.app, base_url="http://benchmark") as client:
+            return await drive(client, school, 400, 20, 4, random.Random(1))
+
+    results = test_app_with_db.portal.call(run)
+    assert results["overall"]["requests"] == 400
+    assert results["overall"]["errors"] == 0, results["endpoints"]
+    assert set(results["endpoints"]) == {endpoint.name for endpoint in ENDPOINTS}
+    assert all(result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"] for result in results["endpoints"].values())
@@ -0,0 +1,100 @@
+import httpx
+
+from application import roster
+from application.db.app_models import Enrollment, User
+from application.roster import import_roster
+from application.utils import HashingPool, hashing_pool
+
+ROSTER = """first_name,last_name,username,email,password,course_codes
+Ada,Lovelace,AdaLovelace1,ada@roster.com,StrongPass1!,ROSA1;ROSA2
+Alan,Turing,AlanTuring12,alan@roster.com,StrongPass1!,ROSA1
+Bad,Password,BadPassword1,bad@roster.com,weak,ROSA1
+Dup,Licate,AdaLovelace1,dup@roster.com,StrongPass1!,ROSA1
+Other,Course,OtherCourse1,other@roster.com,StrongPass1!,NOPE
+"""
+
+
+def test_import_roster_registers_enrolls_and_reports(test_app_with_db, seed, login_as):
+    teacher = seed.course("ROSA1").teacher
+    seed.course("ROSA2", teacher=teacher)
+    login_as(teacher)
+
+    response = test_app_with_db.post("/courses/import-roster/", files={"roster": ("roster.csv", ROSTER, "text/csv")})
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["created"], report["existing"], report["failed"]) == (2, 0, 3)
+    assert [row["status"] for row in report["results"]] == ["created", "created", "error", "error", "error"]
+    assert "NOPE" in report["results"][4]["detail"]
+
+    async def enrollment_count():
+        return await Enrollment.filter(course__teacher_id=teacher.id).count()
+
+    assert test_app_with_db.portal.call(enrollment_count) == 3
+
+    # a second import enrolls already registered students without registering them again
+    second_roster = ROSTER.replace("alan@roster.com,StrongPass1!,ROSA1", "alan@roster.com,StrongPass1!,ROSA2")
+    response = test_app_with_db.post("/courses/import-roster/", files={"roster": ("roster.csv", second_roster, "text/csv")})
+    assert response.json()["existing"] == 2
+    assert test_app_with_db.portal.call(enrollment_count) == 4
+
+    # the imported password works
+    response = test_app_with_db.post("/auth/login/", json={"username": "AlanTuring12", "password": "StrongPass1!"})
+    assert response.status_code == 200
+
+
+def test_import_roster_uses_given_hashing_pool(test_app_with_db, seed):
+    teacher = seed.course("ROSB1").teacher
+    seed.course("ROSB2", teacher=teacher)
+    pool = HashingPool(workers=2, max_queue=10)
+
+    async def run_import():
+        return await import_roster([{"first_name": "Grace", "last_name": "Hopper", "username": "GraceHopper1", "email": "grace@roster.com",
+                                     "password": "StrongPass1!", "course_codes": "ROSB1"}], teacher.id, hashing_pool=pool)
+
+    report = test_app_with_db.portal.call(run_import)
+    pool.shutdown()
+    assert report.created == 1
+    assert pool.completed == 1
+
+
+def test_import_roster_reports_users_registered_meanwhile(test_app_with_db, monkeypatch, seed, login_as):
+    teacher = seed.course("ROSA1").teacher
+    seed.course("ROSA2", teacher=teacher)
+    login_as(teacher)
+    match_rows = roster._match_rows
+
+    async def match_then_register_alan(parsed, teacher_id):
+        matched = await match_rows(parsed, teacher_id)
+        # another request registers the same username after the import checked it
+        async with httpx.AsyncClient(app=test_app_with_db.app, base_url="http://testserver") as other_client:
+            response = await other_client.post("/auth/register-user/", json={
+                "first_name": "Alan", "last_name": "Other", "username": "AlanTuring12", "email": "other-alan@roster.com",
+                "password": "StrongPass1!", "role": "student"})
+        assert response.status_code == 201
+        return matched
+
+    monkeypatch.setattr(roster, "_match_rows", match_then_register_alan)
+    completed = hashing_pool.completed
+    response = test_app_with_db.post("/courses/import-roster/", files={"roster": ("roster.csv", ROSTER, "text/csv")})
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["created"], report["failed"]) == (1, 4)
+    assert report["results"][1]["detail"] == "Username or email already registered to another user"
+    # hashed on the shared pool, the two imported passwords and the other registration's
+    assert hashing_pool.completed == completed + 3
+
+
+def test_import_roster_is_turned_away_when_the_hashing_pool_is_full(test_app_with_db, monkeypatch, seed, login_as):
+    teacher = seed.course("ROSA1").teacher
+    seed.course("ROSA2", teacher=teacher)
+    login_as(teacher)
+    monkeypatch.setattr(hashing_pool, "in_flight", hashing_pool.workers + hashing_pool.max_queue)
+
+    response = test_app_with_db.post("/courses/import-roster/", files={"roster": ("roster.csv", ROSTER, "text/csv")})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+    async def imported():
+        return await User.filter(username="AdaLovelace1").exists()
+
+    assert not test_app_with_db.portal.call(imported)
@@ -0,0 +1,53 @@
+import asyncio
+
+from application.config import Settings
+from application.db.database_config import tortoise_config
+from application.db.pool import TimedPool
+
+
+def test_tortoise_config_applies_pool_settings():
+    settings = Settings(database_url="postgres://user:secret@db:5432/classes?maxsize=4", db_pool_min_size=2, db_statement_cache_size=0)
+    connection = tortoise_config(settings)["connections"]["default"]
+
+    assert connection["engine"] == "application.db.pool"
+    credentials = connection["credentials"]
+    assert credentials["minsize"] == 2
+    assert credentials["statement_cache_size"] == 0
+    assert credentials["max_inactive_connection_lifetime"] == settings.db_pool_max_inactive_lifetime
+    # query parameters on the url take precedence over the settings
+    assert int(credentials["maxsize"]) == 4
+
+
+def test_tortoise_config_sqlite_has_no_pool():
+    connection = tortoise_config(Settings(database_url="sqlite:///tmp/classes.db"))["connections"]["default"]
+    assert connection["engine"] == "tortoise.backends.sqlite"
+    assert "minsize" not in connection["credentials"]
+
+
+class FakePool:
+    async def acquire(self, timeout=None):
+        await asyncio.sleep(0.01)
+        return "connection"
+
+    def get_size(self):
+        return 3
+
+    def get_idle_size(self):
+        return 1
+
+    def get_min_size(self):
+        return 1
+
+    def get_max_size(self):
+        return 10
+
+
+def test_timed_pool_records_wait():
+    pool = TimedPool(FakePool())
+    assert asyncio.run(pool.acquire()) == "connection"
+
+    stats = pool.stats()
+    assert stats["in_use"] == 2
+    assert stats["idle"] == 1
+    assert stats["acquired"] == 1
+    assert stats["wait_seconds_max"] >= 0.01
@@ -0,0 +1,34 @@
+import csv
+import io
+import json
+
+from application.api import exports
+from application.db.app_models import Marks
+from application.pydantic import ExportDataset
+
+
+def test_export_streams_every_row_across_chunks(test_app_with_db, monkeypatch, seed, login_as):
+    monkeypatch.setattr(exports, "CHUNK_SIZE", 4)
+    seeded = seed.course("EXP1", students=10, assignments=1)
+    seed.rows(Marks, [Marks(score=60, student=student, assignment=seeded.assignments[0]) for student in seeded.students])
+    course_id = seeded.course.id
+    login_as(seeded.teacher)
+
+    response = test_app_with_db.get(f"/exports/courses/{course_id}/roster")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 10
+    assert rows[0]["username"] == "exp1student0"
+
+    response = test_app_with_db.get(f"/exports/courses/{course_id}/marks", params={"format": "ndjson"})
+    marks = [json.loads(line) for line in response.text.splitlines()]
+    assert len(marks) == 10
+    assert {mark["assignment_title"] for mark in marks} == {"EXP1 assignment 0"}
+    assert len({mark["mark_id"] for mark in marks}) == 10
+
+    # the cursor doesn't rely on the id being the first output column, or an output column at all
+    model, course_filter, _ = exports.DATASETS[ExportDataset.ROSTER]
+    monkeypatch.setitem(exports.DATASETS, ExportDataset.ROSTER, (model, course_filter, {"username": "student__username"}))
+    response = test_app_with_db.get(f"/exports/courses/{course_id}/roster")
+    assert [row["username"] for row in csv.DictReader(io.StringIO(response.text))] == [f"exp1student{i}" for i in range(10)]
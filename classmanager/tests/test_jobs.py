@@ -0,0 +1,115 @@
+import time
+from datetime import timedelta
+
+from application.db.app_models import Job, JobStatus, Message
+from application.jobs import Worker, enqueue, now, task
+
+calls = []
+
+
+@task("test.record")
+async def record(value: str) -> None:
+    calls.append(value)
+
+
+@task("test.broken")
+async def broken() -> None:
+    raise RuntimeError("always fails")
+
+
+async def inbox(user_id):
+    return await Message.filter(receiver_id=user_id).order_by("id").values_list("content", flat=True)
+
+
+def test_submit_and_mark_notify_in_the_background(test_app_with_db, run_jobs, seed, login_as):
+    seeded = seed.course("JOB1", students=1, assignments=1)
+    teacher, student, assignment_id = seeded.teacher, seeded.students[0], seeded.assignments[0].id
+
+    login_as(student)
+    assert test_app_with_db.post("/assignment/student/submit-assignment/", json={"assignment_id": assignment_id}).status_code == 201
+    login_as(teacher)
+    response = test_app_with_db.post("/marks/create-mark/", params={"assignment_id": assignment_id, "student_id": student.id}, json={"score": 88})
+    assert response.status_code == 201
+
+    # nothing is sent on the request path
+    assert test_app_with_db.portal.call(inbox, teacher.id) == []
+    assert test_app_with_db.get("/env/jobs").json()["queued"] >= 2
+
+    run_jobs()
+    assert test_app_with_db.portal.call(inbox, teacher.id) == ["Submitted JOB1 assignment 0."]
+    assert test_app_with_db.portal.call(inbox, student.id) == ["Your submission for JOB1 assignment 0 was marked 88."]
+    login_as(student)
+    assert test_app_with_db.get("/messages/unread-count").json() == {"unread": 1}
+
+
+async def make_due(job_id):
+    await Job.filter(id=job_id).update(run_at=now() - timedelta(seconds=1))
+
+
+async def fetch(job_id):
+    return await Job.get(id=job_id)
+
+
+def test_failed_jobs_are_retried_with_backoff_then_kept_as_failed(memory_db):
+    job = memory_db.call(enqueue, broken, {}, None, 0, 2)
+    worker = Worker()
+
+    memory_db.call(worker.run_once)
+    retried = memory_db.call(fetch, job.id)
+    assert (retried.status, retried.attempts) == (JobStatus.QUEUED, 1)
+    assert retried.run_at > now() + timedelta(seconds=5)
+    assert retried.last_error == "RuntimeError: always fails"
+
+    memory_db.call(make_due, job.id)
+    memory_db.call(worker.run_once)
+    failed = memory_db.call(fetch, job.id)
+    assert (failed.status, failed.attempts) == (JobStatus.FAILED, 2)
+    assert worker.retried >= 1 and worker.failed >= 1
+
+
+async def abandon(job_id):
+    # claimed by a worker that died
+    await Job.filter(id=job_id).update(status=JobStatus.RUNNING, attempts=1, locked_until=now() - timedelta(seconds=1))
+
+
+def test_jobs_of_a_dead_worker_are_claimed_after_the_visibility_timeout(memory_db):
+    job = memory_db.call(enqueue, record, {"value": "reclaimed"})
+    memory_db.call(abandon, job.id)
+
+    late = memory_db.call(fetch, job.id)
+    memory_db.call(Worker().run_once)
+    finished = memory_db.call(fetch, job.id)
+    assert (finished.status, finished.attempts) == (JobStatus.DONE, 2)
+    assert "reclaimed" in calls
+
+    # the worker that lost the claim can't change the job anymore
+    memory_db.call(Worker()._failed, late, RuntimeError("late"))
+    assert memory_db.call(fetch, job.id).status == JobStatus.DONE
+
+
+def test_in_process_worker_picks_up_new_jobs(memory_db):
+    worker = Worker(poll_interval=0.05)
+    memory_db.call(worker_start, worker)
+    job = memory_db.call(enqueue, record, {"value": "polled"})
+
+    deadline = time.monotonic() + 5
+    while memory_db.call(fetch, job.id).status != JobStatus.DONE and time.monotonic() < deadline:
+        time.sleep(0.05)
+    memory_db.call(worker.stop)
+    assert "polled" in calls
+    assert worker.stats()["processed"] >= 1
+
+
+async def worker_start(worker):
+    worker.start()
+
+
+async def overdue_job():
+    await Job.create(task="test.record", payload={"value": "late"}, run_at=now() - timedelta(seconds=30))
+
+
+def test_queue_stats_report_lag(test_app_with_db):
+    test_app_with_db.portal.call(overdue_job)
+    stats = test_app_with_db.get("/env/jobs").json()
+    assert stats["lag_seconds"] >= 30
+    assert stats["worker"] is None
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+import aiosqlite
+import pytest
+from starlette.testclient import TestClient
+from tortoise import Tortoise, connections
+
+from application.config import Settings, get_settings
+from application.main import create_application, lifespan
+
+
+async def create_schema(url):
+    await Tortoise.init(db_url=url, modules={"models": ["application.db.app_models"]})
+    await Tortoise.generate_schemas()
+    await Tortoise.close_connections()
+
+
+@pytest.fixture(scope="function")
+def lifespan_settings(test_database, tmp_path):
+    if test_database.in_memory:
+        # an in memory database doesn't outlive the restart
+        url = f"sqlite://{tmp_path}/lifespan.db"
+        asyncio.run(create_schema(url))
+        return Settings(testing=1, database_url=url)
+    test_database.reset()
+    return test_database.settings()
+
+
+def leftover_threads():
+    """ Threads of sqlite connections and of the hashing pool still running after a moment to finish """
+    threads = [thread for thread in threading.enumerate() if isinstance(thread, aiosqlite.Connection) or thread.name.startswith("hashing")]
+    for thread in threads:
+        # a closed aiosqlite connection's thread notices within 0.1 seconds
+        thread.join(timeout=1)
+    return [thread for thread in threads if thread.is_alive()]
+
+
+def test_restarts_close_every_connection(lifespan_settings):
+    for _ in range(3):
+        app = create_application(lifespan=lifespan)
+        app.dependency_overrides[get_settings] = lambda: lifespan_settings
+        with TestClient(app) as client:
+            assert client.get("/env/jobs").status_code == 200
+            assert app.state.job_worker is not None
+            clients = client.portal.call(connections.all)
+            assert clients
+
+        assert app.state.job_worker is None
+        assert all(getattr(db_client, "_connection", None) is None and getattr(db_client, "_pool", None) is None for db_client in clients)
+        assert leftover_threads() == []
+
+
+def test_orm_errors_have_responses_without_register_tortoise(lifespan_settings):
+    app = create_application(lifespan=lifespan)
+    app.dependency_overrides[get_settings] = lambda: lifespan_settings
+
+    @app.get("/missing")
+    async def missing():
+        from application.db.app_models import User
+        return await User.get(id=0)
+
+    with TestClient(app) as client:
+        assert client.get("/missing").status_code == 404
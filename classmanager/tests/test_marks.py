@@ -0,0 +1,161 @@
+import statistics
+
+from application.config import get_settings
+from application.db.app_models import Marks
+
+
+def test_marks_listing_query_count_is_constant(test_app_with_db, query_counter, seed, login_as):
+    counts = {}
+    for rows in (2, 40):
+        seeded = seed.course(f"MK{rows}", students=1, assignments=rows)
+        teacher, student = seeded.teacher, seeded.students[0]
+        seed.rows(Marks, [Marks(score=50 + i, student=student, assignment=assignment) for i, assignment in enumerate(seeded.assignments)])
+
+        login_as(student)
+        query_counter.reset()
+        response = test_app_with_db.get("/marks/view-student-marks/", params={"limit": 100})
+        assert response.status_code == 200
+        assert len(response.json()) == rows
+        student_queries = query_counter.count
+
+        login_as(teacher)
+        query_counter.reset()
+        response = test_app_with_db.get(f"/marks/teacher/marks/{student.id}/", params={"limit": 100})
+        assert response.status_code == 200
+        assert len(response.json()) == rows
+        counts[rows] = (student_queries, query_counter.count)
+
+    assert counts[2] == counts[40] == (1, 1)
+
+
+def test_marks_listing_is_paginated(test_app_with_db, seed, login_as):
+    seeded = seed.course("MK5", students=1, assignments=5)
+    student = seeded.students[0]
+    seed.rows(Marks, [Marks(score=50 + i, student=student, assignment=assignment) for i, assignment in enumerate(seeded.assignments)])
+    login_as(student)
+
+    response = test_app_with_db.get("/marks/view-student-marks/", params={"skip": 3, "limit": 10})
+    assert [mark["score"] for mark in response.json()] == [53, 54]
+
+
+def test_bulk_create_marks_query_count_is_constant(test_app_with_db, query_counter, seed, login_as):
+    counts = {}
+    for code, students in (("BK1", 3), ("BK2", 60)):
+        seeded = seed.course(code, students=students, assignments=1, submitted=True)
+        teacher, assignment_id, student_ids = seeded.teacher, seeded.assignments[0].id, [student.id for student in seeded.students]
+        login_as(teacher)
+
+        query_counter.reset()
+        payload = [{"student_id": student_id, "score": 70, "comments": "good"} for student_id in student_ids]
+        response = test_app_with_db.post("/marks/bulk-create-marks/", params={"assignment_id": assignment_id}, json=payload)
+        assert response.status_code == 201
+        assert all(result["created"] for result in response.json()["results"])
+        counts[students] = query_counter.count
+
+    assert counts[3] == counts[60]
+
+
+def test_bulk_create_marks_reports_invalid_rows(test_app_with_db, seed, login_as):
+    seeded = seed.course("BK3", students=2, assignments=1, submitted=True)
+    teacher, assignment_id, student_ids = seeded.teacher, seeded.assignments[0].id, [student.id for student in seeded.students]
+    login_as(teacher)
+
+    payload = [
+        {"student_id": student_ids[0], "score": 80},
+        {"student_id": student_ids[0], "score": 90},
+        {"student_id": teacher.id, "score": 90},
+    ]
+    response = test_app_with_db.post("/marks/bulk-create-marks/", params={"assignment_id": assignment_id}, json=payload)
+    results = response.json()["results"]
+    assert [result["created"] for result in results] == [True, False, False]
+    assert results[2]["detail"] == "Student not found or not a student role"
+
+    # a retried batch only adds the students it didn't mark before
+    retried = [{"student_id": student_id, "score": 80} for student_id in student_ids]
+    results = test_app_with_db.post("/marks/bulk-create-marks/", params={"assignment_id": assignment_id}, json=retried).json()["results"]
+    assert [result["created"] for result in results] == [False, True]
+    assert results[0]["detail"] == "Student already has a mark for this assignment"
+
+    # another teacher's assignment
+    login_as(seed.course("BK4").teacher)
+    response = test_app_with_db.post("/marks/bulk-create-marks/", params={"assignment_id": assignment_id}, json=retried)
+    assert response.status_code == 404
+
+    async def count_marks():
+        return await Marks.filter(assignment_id=assignment_id).count()
+
+    assert test_app_with_db.portal.call(count_marks) == 2
+
+
+def test_create_mark_validates_in_one_query(test_app_with_db, query_counter, seed, login_as):
+    seeded = seed.course("CM1", students=1, assignments=1, submitted=True)
+    teacher, assignment_id, student_ids = seeded.teacher, seeded.assignments[0].id, [student.id for student in seeded.students]
+    login_as(teacher)
+
+    query_counter.reset()
+    response = test_app_with_db.post("/marks/create-mark/", params={"assignment_id": assignment_id, "student_id": student_ids[0]}, json={"score": 70})
+    assert response.status_code == 201
+    # the validation query, the insert and the queued notification
+    assert query_counter.count == 3
+
+    response = test_app_with_db.post("/marks/create-mark/", params={"assignment_id": assignment_id + 1000, "student_id": student_ids[0]}, json={"score": 70})
+    assert response.json()["detail"] == "Assignment not found"
+    response = test_app_with_db.post("/marks/create-mark/", params={"assignment_id": assignment_id, "student_id": teacher.id}, json={"score": 70})
+    assert response.json()["detail"] == "Student not found or not a student role"
+    response = test_app_with_db.post("/marks/create-mark/", params={"assignment_id": assignment_id, "student_id": student_ids[0]}, json={"score": 70})
+    assert response.json()["detail"] == "Student already has a mark for this assignment"
+
+    # another teacher's assignment
+    login_as(seed.course("CM2").teacher)
+    response = test_app_with_db.post("/marks/create-mark/", params={"assignment_id": assignment_id, "student_id": student_ids[0]}, json={"score": 70})
+    assert response.status_code == 404
+
+
+def test_course_gradebook_statistics(test_app_with_db, test_database, run_jobs, seed, login_as):
+    seeded = seed.course("GB1", students=4, assignments=1, submitted=True)
+    teacher, assignment_id, student_ids = seeded.teacher, seeded.assignments[0].id, [student.id for student in seeded.students]
+    login_as(teacher)
+    scores = [40, 55, 70, 95]
+    payload = [{"student_id": student_id, "score": score} for student_id, score in zip(student_ids, scores)]
+    test_app_with_db.post("/marks/bulk-create-marks/", params={"assignment_id": assignment_id}, json=payload)
+
+    async def mark_of_first_student():
+        return (await Marks.get(student_id=student_ids[0], assignment_id=assignment_id)).id
+
+    course_id = seeded.course.id
+    live = test_app_with_db.get(f"/marks/gradebook/{course_id}/").json()
+
+    stats = live["assignments"][0]
+    assert stats["marks_count"] == 4
+    assert stats["mean"] == statistics.mean(scores)
+    assert stats["median"] == statistics.median(scores)
+    assert (stats["min_score"], stats["max_score"]) == (40, 95)
+    assert round(stats["stddev"], 6) == round(statistics.stdev(scores), 6)
+    assert [(student["student_id"], student["total"]) for student in live["students"]] == list(zip(student_ids, scores))
+
+    # the summary table serves the same numbers and follows mark edits
+    test_app_with_db.app.dependency_overrides[get_settings] = lambda: test_database.settings(gradebook_summary=True)
+    assert test_app_with_db.get(f"/marks/gradebook/{course_id}/").json() == live
+
+    test_app_with_db.patch(f"/marks/edit-mark/{test_app_with_db.portal.call(mark_of_first_student)}/", json={"score": 100})
+    # refreshed by a background job
+    run_jobs()
+    summary = test_app_with_db.get(f"/marks/gradebook/{course_id}/").json()["assignments"][0]
+    assert summary["max_score"] == 100
+    assert summary["median"] == statistics.median([100, 55, 70, 95])
+
+
+def test_gradebook_summary_remembers_unmarked_assignments(test_app_with_db, test_database, query_counter, run_jobs, seed, login_as):
+    seeded = seed.course("GB2", students=2, assignments=1, submitted=True)
+    login_as(seeded.teacher)
+    test_app_with_db.app.dependency_overrides[get_settings] = lambda: test_database.settings(gradebook_summary=True)
+
+    course_id = seeded.course.id
+    first = test_app_with_db.get(f"/marks/gradebook/{course_id}/").json()
+    assert first["assignments"][0]["marks_count"] == 0
+
+    # the empty summary row queued by the first read stops later reads from recomputing it
+    run_jobs()
+    query_counter.reset()
+    assert test_app_with_db.get(f"/marks/gradebook/{course_id}/").json() == first
+    assert not any("ROW_NUMBER()" in query for query in query_counter.queries)
@@ -0,0 +1,49 @@
+def send(login_as, sender, receiver, content):
+    response = login_as(sender).post("/messages/", json={"receiver_id": receiver.id, "content": content})
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+def test_inbox_is_keyset_paginated_with_unread_counter(test_app_with_db, seed, login_as):
+    alice, bob, carol = seed.users("alice", "bob", "carol")
+    sent = [send(login_as, sender, alice, f"message {i}") for i, sender in enumerate([bob, carol, bob, carol, bob])]
+
+    login_as(alice)
+    pages, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = test_app_with_db.get("/messages/inbox", params=params).json()
+        pages.append([message["id"] for message in page["results"]])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert pages == [sent[:2:-1], sent[2:0:-1], sent[:1]]
+    assert page["unread"] == 5
+
+    response = test_app_with_db.post("/messages/mark-read", json={"message_ids": sent[:2]})
+    assert response.json() == {"marked": 2, "unread": 3}
+    # already read messages are not counted twice
+    response = test_app_with_db.post("/messages/mark-read", json={"up_to_id": sent[3]})
+    assert response.json() == {"marked": 2, "unread": 1}
+    assert test_app_with_db.get("/messages/unread-count").json() == {"unread": 1}
+    assert [message["id"] for message in test_app_with_db.get("/messages/inbox", params={"unread_only": True}).json()["results"]] == [sent[4]]
+
+
+def test_thread_has_both_directions(test_app_with_db, seed, login_as):
+    alice, bob, carol = seed.users("alice", "bob", "carol")
+    first = send(login_as, alice, bob, "hello bob")
+    send(login_as, carol, bob, "not in the thread")
+    reply = send(login_as, bob, alice, "hello alice")
+
+    response = test_app_with_db.get(f"/messages/thread/{alice.id}")
+    assert [message["id"] for message in response.json()["results"]] == [reply, first]
+
+
+def test_send_message_validation(test_app_with_db, seed, login_as):
+    [alice] = seed.users("alice")
+    login_as(alice)
+
+    assert test_app_with_db.post("/messages/", json={"receiver_id": alice.id, "content": "me"}).status_code == 400
+    assert test_app_with_db.post("/messages/", json={"receiver_id": alice.id + 1000, "content": "nobody"}).status_code == 404
+    assert test_app_with_db.get("/messages/inbox", params={"cursor": "not-a-cursor"}).status_code == 400
+    assert test_app_with_db.post("/messages/mark-read", json={}).status_code == 400
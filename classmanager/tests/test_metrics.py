@@ -0,0 +1,46 @@
+import application.main
+from application.config import Settings
+from application.main import create_application
+from application.metrics import MetricsMiddleware, registry
+
+
+def test_server_timing_reports_database_and_hashing_time(test_app_with_db):
+    data = {
+        "first_name": "Tim",
+        "last_name": "Ing",
+        "username": "timedRegister",
+        "email": "timed@metrics.com",
+        "password": "StrongPass1!",
+        "role": "student",
+    }
+    response = test_app_with_db.post("/auth/register-user/", json=data)
+    assert response.status_code == 201
+
+    timing = response.headers["server-timing"]
+    entries = {entry.split(";")[0]: entry for entry in timing.split(", ")}
+    assert set(entries) == {"db", "hash", "render", "total"}
+    assert 'desc="0 queries"' not in entries["db"]
+
+
+def test_metrics_are_labelled_by_route_template(test_app_with_db):
+    registry.clear()
+    test_app_with_db.get("/env/ping")
+    test_app_with_db.get("/files/assignment/123456")
+    test_app_with_db.get("/files/assignment/654321")
+    test_app_with_db.get("/no/such/page")
+
+    body = test_app_with_db.get("/metrics").text
+    assert 'http_request_duration_seconds_count{method="GET",route="/env/ping",status="200"} 1' in body
+    # both assignment ids are one series
+    assert 'route="/files/assignment/{assignment_id}",status="401"} 2' in body
+    assert "/files/assignment/123456" not in body
+    assert 'http_request_duration_seconds_count{method="GET",route="unmatched",status="404"} 1' in body
+    assert 'le="+Inf"' in body
+    assert "# TYPE http_request_db_queries_total counter" in body
+
+
+def test_disabled_metrics_install_nothing(monkeypatch):
+    monkeypatch.setattr(application.main, "get_settings", lambda: Settings(metrics_enabled=False))
+    app = create_application()
+    assert all(middleware.cls is not MetricsMiddleware for middleware in app.user_middleware)
+    assert "/metrics" not in {route.path for route in app.routes}
@@ -0,0 +1,94 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+from application.api.notices import event_stream
+from application.db.app_models import Notice
+from application.events import (CHANNEL, NoticeBroker, Subscription,
+                                notice_broker)
+from application.pydantic import NoticeRead
+
+
+def test_notice_crud_is_pushed_to_course_subscribers(test_app_with_db, seed, login_as):
+    seeded = seed.course("NOT1", students=1, outsiders=1)
+    teacher, student, outsider, course_id = seeded.teacher, seeded.students[0], seeded.outsiders[0], seeded.course.id
+    subscription = test_app_with_db.portal.call(notice_broker.subscribe, [course_id])
+
+    login_as(teacher)
+    response = test_app_with_db.post("/notices/", json={"course_id": course_id, "title": "Exam moved", "content": "Now on Friday"})
+    assert response.status_code == 201
+    notice_id = response.json()["id"]
+    assert test_app_with_db.patch(f"/notices/{notice_id}", json={"title": "Exam moved again"}).status_code == 200
+
+    login_as(student)
+    listing = test_app_with_db.get(f"/notices/course/{course_id}")
+    assert [notice["title"] for notice in listing.json()] == ["Exam moved again"]
+    login_as(outsider)
+    assert test_app_with_db.get(f"/notices/course/{course_id}").status_code == 403
+
+    login_as(teacher)
+    assert test_app_with_db.delete(f"/notices/{notice_id}").status_code == 204
+    assert test_app_with_db.delete(f"/notices/{notice_id}").status_code == 404
+
+    events = [subscription.queue.get_nowait()["event"] for _ in range(subscription.queue.qsize())]
+    assert events == ["created", "updated", "deleted"]
+    subscription.close()
+
+
+def test_event_stream_replays_missed_notices_then_streams_live_ones():
+    broker = NoticeBroker()
+    now = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    missed = NoticeRead(id=4, course_id=1, title="Missed notice", content="sent while offline", date_posted=now, updated_at=now)
+    live = NoticeRead(id=5, course_id=1, title="Live notice", content="sent while online", date_posted=now, updated_at=now)
+
+    async def read_stream():
+        subscription = Subscription(broker, [1])
+        broker._subscribers[1].add(subscription)
+        stream = event_stream(subscription, [missed])
+        chunks = [await stream.__anext__(), await stream.__anext__()]
+        broker.deliver({"event": "created", "id": live.id, "course_id": 1, "data": live.model_dump_json()})
+        chunks.append(await stream.__anext__())
+        await stream.aclose()
+        return chunks
+
+    chunks = asyncio.run(read_stream())
+    assert chunks[0].startswith("retry:")
+    assert chunks[1].startswith("event: notice.created\nid: 4\n")
+    assert chunks[2].startswith("event: notice.created\nid: 5\n")
+    # closing the stream unsubscribes it
+    assert broker.stats()["streams"] == 0
+
+
+def test_slow_subscriber_is_dropped():
+    broker = NoticeBroker()
+
+    async def flood():
+        subscription = Subscription(broker, [1])
+        broker._subscribers[1].add(subscription)
+        for notice_id in range(subscription.queue.maxsize + 1):
+            broker.deliver({"event": "created", "id": notice_id, "course_id": 1, "data": "{}"})
+        return subscription
+
+    subscription = asyncio.run(flood())
+    assert subscription.queue.get_nowait() is None
+    assert broker.stats()["dropped"] == 1
+    assert broker.stats()["streams"] == 0
+
+
+def test_notices_sent_by_id_are_read_back_and_released(test_app_with_db, seed):
+    course_id = seed.course("NOT1").course.id
+    broker = NoticeBroker()
+
+    async def notify_by_id():
+        notice = await Notice.create(course_id=course_id, title="Long notice", content="x" * 8000)
+        subscription = await broker.subscribe([course_id])
+        broker._on_notify(None, 0, CHANNEL, json.dumps({"event": "created", "id": notice.id, "course_id": course_id, "data": None}))
+        # the read is referenced until it is done
+        assert len(broker._reads) == 1
+        await broker.close()
+        subscription.close()
+        return notice.id, subscription.queue.get_nowait()
+
+    notice_id, event = test_app_with_db.portal.call(notify_by_id)
+    assert json.loads(event["data"])["id"] == notice_id
+    assert broker._reads == set()
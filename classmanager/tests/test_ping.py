@@ -2,3 +2,16 @@ def test_ping(test_app):
     response = test_app.get("/env/ping")
     assert response.status_code == 200
     assert response.json() == {"environment": "dev", "ping": "pong!", "testing": True}
+
+
+def test_hashing_pool_stats(test_app):
+    response = test_app.get("/env/hashing-pool")
+    assert response.status_code == 200
+    assert {"workers", "queue_depth", "rejected", "hash_seconds_avg"} <= response.json().keys()
+
+
+def test_db_pool_stats(test_app_with_db):
+    response = test_app_with_db.get("/env/db-pool")
+    assert response.status_code == 200
+    assert response.json()["client"] == "SqliteClient"
+    assert response.json()["pool"] is None
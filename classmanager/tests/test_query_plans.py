@@ -0,0 +1,150 @@
+import importlib
+import re
+
+from tortoise import connections
+from tortoise.transactions import in_transaction
+
+from application.db.app_models import Marks, User
+
+# tables that grow with usage, a query reading one of them must go through an index
+LARGE_TABLES = {"users", "courses", "assignments", "enrollments", "submissions", "marks", "messages", "message_counters", "notices", "assignment_stats"}
+
+
+async def users_by_id(*user_ids):
+    users = {user.id: user for user in await User.filter(id__in=user_ids)}
+    return [users[user_id] for user_id in user_ids]
+
+
+async def mark_id(assignment_id, student_id):
+    return (await Marks.get(assignment_id=assignment_id, student_id=student_id)).id
+
+
+async def explain(sql, values):
+    connection = connections.get("default")
+    if connection.capabilities.dialect == "postgres":
+        # tiny test tables are cheaper to scan, so make the planner show whether an index could be used at all
+        async with in_transaction() as transaction:
+            await transaction.execute_script("SET LOCAL enable_seqscan = off")
+            rows = await transaction.execute_query_dict(f"EXPLAIN {sql}", values)
+        return [row["QUERY PLAN"] for row in rows]
+    return [row["detail"] for row in await connection.execute_query_dict(f"EXPLAIN QUERY PLAN {sql}", values)]
+
+
+async def create_search_indexes():
+    """ The trigram indexes of the search migration, generate_schemas doesn't know about them """
+    connection = connections.get("default")
+    if connection.capabilities.dialect != "postgres":
+        return False
+    migration = importlib.import_module("migrations.models.2_20261018120000_update")
+    await connection.execute_script(await migration.upgrade(connection))
+    return True
+
+
+def sequential_scans(plan):
+    tables = set()
+    for line in plan:
+        match = re.search(r"Seq Scan on (\w+)", line) or re.match(r"SCAN (?:TABLE )?(\w+)", line)
+        if match and match.group(1) in LARGE_TABLES:
+            tables.add(match.group(1))
+    return tables
+
+
+def assert_indexed(client, query_counter):
+    scans = {}
+    # EXPLAIN is logged too, look only at what the endpoint ran
+    for sql, values in list(query_counter.statements):
+        if sql.lstrip().upper().startswith(("SELECT", "WITH", "UPDATE", "DELETE")):
+            tables = sequential_scans(client.portal.call(explain, sql, values))
+            if tables:
+                scans[sql] = tables
+    query_counter.reset()
+    assert not scans, f"sequential scans on large tables: {scans}"
+
+
+def test_teacher_endpoints_use_indexes(test_app_with_db, query_counter, school, login_as):
+    # a submission to mark, and a mark to edit in the same course
+    assignment_id, student_id = school.unmarked[-1]
+    course_id = school.assignment_courses[assignment_id]
+    marked = next(pair for pair in school.marked if school.assignment_courses[pair[0]] == course_id)
+    edited_mark_id = test_app_with_db.portal.call(mark_id, *marked)
+    login_as(*test_app_with_db.portal.call(users_by_id, school.courses[course_id]))
+    query_counter.reset()
+
+    requests = [
+        ("get", "/assignment/teacher/assignments", {}),
+        ("get", f"/marks/teacher/marks/{student_id}/", {}),
+        ("get", f"/marks/gradebook/{course_id}/", {}),
+        ("post", "/marks/create-mark/", {"params": {"assignment_id": assignment_id, "student_id": student_id}, "json": {"score": 80}}),
+        ("post", "/marks/bulk-create-marks/", {"params": {"assignment_id": assignment_id}, "json": [{"student_id": student_id, "score": 75}]}),
+        ("patch", f"/marks/edit-mark/{edited_mark_id}/", {"json": {"score": 90}}),
+        ("get", f"/exports/courses/{course_id}/roster", {}),
+        ("get", f"/exports/courses/{course_id}/submissions", {}),
+        ("get", f"/exports/courses/{course_id}/marks", {}),
+    ]
+    for method, url, kwargs in requests:
+        response = getattr(test_app_with_db, method)(url, **kwargs)
+        assert response.status_code < 300, (url, response.text)
+        assert_indexed(test_app_with_db, query_counter)
+
+
+def test_student_endpoints_use_indexes(test_app_with_db, query_counter, school, login_as):
+    assignment_id, student_id = school.unsubmitted[-1]
+    course_id = school.assignment_courses[assignment_id]
+    login_as(*test_app_with_db.portal.call(users_by_id, student_id))
+    query_counter.reset()
+
+    requests = [
+        ("get", f"/assignment/student/assignments/{course_id}", {}),
+        ("get", "/marks/view-student-marks/", {}),
+        ("post", "/assignment/student/submit-assignment/", {"json": {"assignment_id": assignment_id}}),
+    ]
+    for method, url, kwargs in requests:
+        response = getattr(test_app_with_db, method)(url, **kwargs)
+        assert response.status_code < 300, (url, response.text)
+        assert_indexed(test_app_with_db, query_counter)
+
+    other_course_id = next(course_id for course_id in school.courses if course_id not in school.enrollments[student_id])
+    response = test_app_with_db.post("/courses/enroll-course/", json={"course_id": other_course_id})
+    assert response.status_code == 201
+    assert_indexed(test_app_with_db, query_counter)
+
+
+def test_messaging_endpoints_use_indexes(test_app_with_db, query_counter, school, login_as):
+    reader, writer = test_app_with_db.portal.call(users_by_id, *school.students[:2])
+    login_as(writer)
+    for number in range(3):
+        test_app_with_db.post("/messages/", json={"receiver_id": reader.id, "content": f"planned message {number}"})
+    login_as(reader)
+    cursor = test_app_with_db.get("/messages/inbox", params={"limit": 1}).json()["next_cursor"]
+    query_counter.reset()
+
+    requests = [
+        ("get", "/messages/inbox", {"params": {"limit": 1, "cursor": cursor}}),
+        ("get", f"/messages/thread/{writer.id}", {"params": {"limit": 1, "cursor": cursor}}),
+        ("post", "/messages/mark-read", {"json": {"up_to_id": 10 ** 6}}),
+        ("post", "/messages/", {"json": {"receiver_id": writer.id, "content": "planned reply"}}),
+    ]
+    for method, url, kwargs in requests:
+        response = getattr(test_app_with_db, method)(url, **kwargs)
+        assert response.status_code < 300, (url, response.text)
+        assert_indexed(test_app_with_db, query_counter)
+
+
+def test_user_search_uses_indexes(test_app_with_db, query_counter, school, login_as):
+    trigram_indexes = test_app_with_db.portal.call(create_search_indexes)
+    login_as(*test_app_with_db.portal.call(users_by_id, school.teachers[0]))
+
+    # listing without a query pages through the primary key
+    cursor = test_app_with_db.get("/users/search/page/", params={"q": "", "role": "student", "limit": 5}).json()["next_cursor"]
+    query_counter.reset()
+    response = test_app_with_db.get("/users/search/page/", params={"q": "", "role": "student", "limit": 5, "cursor": cursor})
+    assert response.status_code == 200
+    assert_indexed(test_app_with_db, query_counter)
+
+    # substring matches need the postgres trigram indexes, sqlite has no index for them
+    if trigram_indexes:
+        cursor = test_app_with_db.get("/users/search/page/", params={"q": "student00", "limit": 5}).json()["next_cursor"]
+        query_counter.reset()
+        response = test_app_with_db.get("/users/search/page/", params={"q": "student00", "limit": 5, "cursor": cursor})
+        assert response.status_code == 200
+        assert_indexed(test_app_with_db, query_counter)
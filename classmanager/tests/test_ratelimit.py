@@ -0,0 +1,125 @@
+import asyncio
+import time
+from functools import partial
+
+import httpx
+import pytest
+from starlette.requests import HTTPConnection
+from starlette.testclient import TestClient
+
+import application.main
+from application.config import get_settings
+from application.db.app_models import UserRole
+from application.main import create_application
+from application.ratelimit import (InMemoryRateLimitBackend, RateLimiter,
+                                   RateLimitPolicy, body_username, peek_body,
+                                   rate_limiter)
+
+
+@pytest.fixture(scope="function")
+def limited_app(test_database, monkeypatch):
+    settings = test_database.settings(rate_limit_enabled=True)
+    monkeypatch.setattr(application.main, "get_settings", lambda: settings)
+    app = create_application()
+    app.dependency_overrides[get_settings] = lambda: settings
+    test_database.init(app, settings)
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+async def concurrent_gets(app, url, login, count):
+    async with httpx.AsyncClient(app=app, base_url="http://limited") as client:
+        login(client)
+        return await asyncio.gather(*(client.get(url) for _ in range(count)))
+
+
+def test_concurrent_searches_past_the_burst_get_429(limited_app, seed, login_as):
+    first, second = seed.into(limited_app).users("limited0", "limited1", role=UserRole.TEACHER)
+    burst = next(policy.burst for policy in rate_limiter.policies if policy.name == "user_search")
+
+    responses = limited_app.portal.call(concurrent_gets, limited_app.app, "/users/search/page/?q=lim", partial(login_as, first), burst + 30)
+    statuses = [response.status_code for response in responses]
+    assert statuses.count(200) == burst
+    assert statuses.count(429) == 30
+    limited = next(response for response in responses if response.status_code == 429)
+    assert int(limited.headers["retry-after"]) >= 1
+    assert limited.headers["x-ratelimit-policy"] == "user_search"
+
+    # the bucket is per user and per policy
+    [other_user] = limited_app.portal.call(concurrent_gets, limited_app.app, "/users/search/page/?q=lim", partial(login_as, second), 1)
+    assert other_user.status_code == 200
+    [other_route] = limited_app.portal.call(concurrent_gets, limited_app.app, "/users/", partial(login_as, first), 1)
+    assert other_route.status_code == 200
+
+    stats = limited_app.get("/env/rate-limits").json()["policies"]["user_search"]
+    assert (stats["allowed"], stats["limited"]) == (burst + 1, 30)
+
+
+def test_logins_are_limited_per_username_and_per_address(limited_app, monkeypatch):
+    login = RateLimitPolicy("login", rate=0.001, burst=3, methods=("POST",), paths=("/auth/login/",), by="username",
+                            address_rate=0.001, address_burst=6)
+    monkeypatch.setattr(rate_limiter, "policies", (login,))
+
+    def log_in(username, **headers):
+        return limited_app.post("/auth/login/", json={"username": username, "password": "wrong"}, headers=headers).status_code
+
+    # guessing one account's password
+    assert [log_in("guessed") for _ in range(4)] == [401] * 3 + [429]
+    # other accounts from the same address, until the address budget runs out
+    assert [log_in(f"other{number}") for number in range(3)] == [401, 401, 429]
+
+    # the forwarded address is only believed from a trusted proxy
+    assert log_in("guessed", **{"X-Forwarded-For": "203.0.113.9"}) == 429
+    monkeypatch.setattr(rate_limiter, "trusted_proxies", frozenset({"testclient"}))
+    assert log_in("guessed", **{"X-Forwarded-For": "203.0.113.9"}) == 401
+
+
+def test_client_address_is_read_through_trusted_proxies():
+    def address(trusted_proxies, peer, forwarded=None):
+        headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+        limiter = RateLimiter(InMemoryRateLimitBackend(), trusted_proxies=trusted_proxies)
+        return limiter.address(HTTPConnection({"type": "http", "client": (peer, 1234), "headers": headers}))
+
+    assert address(["127.0.0.1"], "198.51.100.1", "203.0.113.9") == "198.51.100.1"
+    assert address(["127.0.0.1"], "127.0.0.1", "203.0.113.9") == "203.0.113.9"
+    # a spoofed entry left of the one the proxies appended is ignored
+    assert address(["127.0.0.1", "10.0.0.2"], "127.0.0.1", "1.1.1.1, 203.0.113.9, 10.0.0.2") == "203.0.113.9"
+    assert address(["*"], "10.0.0.3", "1.1.1.1, 203.0.113.9") == "203.0.113.9"
+    assert address(["127.0.0.1"], "127.0.0.1") == "127.0.0.1"
+
+
+async def replayed_body(body, limit):
+    messages = [{"type": "http.request", "body": body[:3], "more_body": True}, {"type": "http.request", "body": body[3:], "more_body": False}]
+
+    async def receive():
+        return messages.pop(0)
+
+    peeked, replay = await peek_body(receive, limit)
+    return peeked, [await replay(), await replay()]
+
+
+def test_peeked_body_is_replayed_to_the_app():
+    body = b'{"username": "Ada"}'
+    peeked, replayed = asyncio.run(replayed_body(body, 100))
+    assert body_username(peeked) == "Ada"
+    assert b"".join(message["body"] for message in replayed) == body
+    # a body over the limit isn't read to the end, the app still gets all of it
+    peeked, replayed = asyncio.run(replayed_body(body, 2))
+    assert peeked == b""
+    assert b"".join(message["body"] for message in replayed) == body
+    assert body_username(b"not json") == body_username(b'["Ada"]') == body_username(b'{"username": 1}') == ""
+
+
+def test_token_bucket_refills_at_the_rate():
+    backend = InMemoryRateLimitBackend(maxsize=1)
+
+    async def take(key):
+        return await backend.take(key, rate=50, burst=2)
+
+    assert [asyncio.run(take("a")) for _ in range(2)] == [0, 0]
+    assert 0 < asyncio.run(take("a")) <= 0.02
+    time.sleep(0.025)
+    assert asyncio.run(take("a")) == 0
+    # the least recently used bucket is dropped past maxsize and starts full again
+    assert asyncio.run(take("b")) == 0
+    assert [asyncio.run(take("a")) for _ in range(2)] == [0, 0]
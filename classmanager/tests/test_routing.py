@@ -0,0 +1,106 @@
+import pytest
+from starlette.testclient import TestClient
+from tortoise import connections
+from tortoise.utils import get_schema_sql
+
+from application.config import Settings, get_settings
+from application.db.app_models import AssignmentStats, Marks, User
+from application.db.database_config import init_db
+from application.db.routing import REPLICA_PREFIX
+from application.jobs import Worker
+from application.main import create_application
+
+
+async def create_replica_schema():
+    await connections.get("replica_0").execute_script(get_schema_sql(connections.get("default"), safe=True))
+
+
+@pytest.fixture(scope="function")
+def replica_app(tmp_path):
+    # two local databases, the "replica" is not replicated to so the tests can see where each query went
+    settings = Settings(testing=1, database_url=f"sqlite://{tmp_path}/primary.db", database_replica_urls=[f"sqlite://{tmp_path}/replica.db"])
+    app = create_application()
+    app.dependency_overrides[get_settings] = lambda: settings
+    init_db(app, settings=settings, generate_schemas=True)
+    with TestClient(app) as test_client:
+        test_client.portal.call(create_replica_schema)
+        yield test_client
+
+    # Tortoise merges the connection config of every init, keep the replica out of the other tests
+    for name in [name for name in connections.db_config if name.startswith(REPLICA_PREFIX)]:
+        del connections.db_config[name]
+
+
+async def replica_usernames():
+    return await User.all().using_db(connections.get("replica_0")).values_list("username", flat=True)
+
+
+def searched_usernames(client, **headers):
+    response = client.get("/users/search/", params={"q": "route"}, headers=headers)
+    assert response.status_code == 200
+    return {user["username"] for user in response.json()}
+
+
+def test_reads_go_to_replica_and_writes_to_primary(replica_app, seed, login_as):
+    seed = seed.into(replica_app)
+    reader, _ = seed.users("RouteReader", "RoutePrimaryOnly")
+    seed.users("RouteReader", "RouteReplicaOnly", using_db=replica_app.portal.call(connections.get, "replica_0"))
+    login_as(reader, replica_app)
+
+    assert searched_usernames(replica_app) == {"RouteReader", "RouteReplicaOnly"}
+    # per request override
+    assert searched_usernames(replica_app, **{"X-Read-Consistency": "primary"}) == {"RouteReader", "RoutePrimaryOnly"}
+
+    response = replica_app.post("/auth/register-user/", json={
+        "first_name": "Route", "last_name": "Writer", "username": "RouteWriter", "email": "routewriter@routing.com",
+        "password": "StrongPass1!", "role": "student",
+    })
+    assert response.status_code == 201
+    assert "RouteWriter" not in replica_app.portal.call(replica_usernames)
+
+    # the client that just wrote reads its own write from the primary
+    assert "read_primary" in response.cookies
+    assert searched_usernames(replica_app) == {"RouteReader", "RoutePrimaryOnly", "RouteWriter"}
+
+
+def test_transactions_run_on_the_primary(replica_app, seed, login_as):
+    seeded = seed.into(replica_app).course("RT101", students=1, assignments=1, submitted=True)
+    teacher, student, assignment = seeded.teacher, seeded.students[0], seeded.assignments[0]
+    login_as(teacher, replica_app)
+
+    # bulk grading opens a transaction, which has to name a connection once replicas are configured
+    response = replica_app.post("/marks/bulk-create-marks/", params={"assignment_id": assignment.id},
+                                json=[{"student_id": student.id, "score": 90}])
+    assert response.status_code == 201
+    assert response.json()["results"][0]["created"]
+
+
+async def replicate(*tables):
+    """ Copies tables of the primary to the replica, as replication would have """
+    replica = connections.get("replica_0")
+    await replica.execute_script(f"ATTACH DATABASE '{connections.get('default').filename}' AS source")
+    for table in tables:
+        await replica.execute_script(f'INSERT INTO "{table}" SELECT * FROM source."{table}"')
+    await replica.execute_script("DETACH DATABASE source")
+
+
+async def summary_rows(connection_name):
+    return await AssignmentStats.all().using_db(connections.get(connection_name)).count()
+
+
+def test_gradebook_summary_read_from_a_replica_writes_nothing(replica_app, seed, login_as):
+    seeded = seed.into(replica_app).course("RT102", students=2, assignments=1, submitted=True)
+    seed.into(replica_app).rows(Marks, [Marks(score=score, student=student, assignment=seeded.assignments[0])
+                                        for score, student in zip((60, 80), seeded.students)])
+    # marked before the summary was enabled, so there are no summary rows yet
+    replica_app.portal.call(replicate, "users", "courses", "enrollments", "assignments", "submissions", "marks")
+    settings = replica_app.app.dependency_overrides[get_settings]()
+    replica_app.app.dependency_overrides[get_settings] = lambda: settings.model_copy(update={"gradebook_summary": True})
+    login_as(seeded.teacher, replica_app)
+
+    stats = replica_app.get(f"/marks/gradebook/{seeded.course.id}/").json()["assignments"][0]
+    assert (stats["marks_count"], stats["mean"]) == (2, 70)
+    # the read only queued the job that builds the rows
+    assert replica_app.portal.call(summary_rows, "default") == 0
+    assert replica_app.portal.call(Worker().run_once) == 1
+    assert replica_app.portal.call(summary_rows, "default") == 1
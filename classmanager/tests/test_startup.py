@@ -0,0 +1,26 @@
+from starlette.testclient import TestClient
+
+from application.config import Settings, get_settings
+from application.db import app_models
+from application.main import create_application
+
+
+def test_apps_share_the_built_routes_but_not_their_overrides():
+    first, second = create_application(), create_application()
+    first.dependency_overrides[get_settings] = lambda: Settings(environment="first")
+    second.dependency_overrides[get_settings] = lambda: Settings(environment="second")
+
+    assert TestClient(first).get("/env/ping").json()["environment"] == "first"
+    assert TestClient(second).get("/env/ping").json()["environment"] == "second"
+
+    [first_ping] = [route for route in first.routes if getattr(route, "path", None) == "/env/ping"]
+    [second_ping] = [route for route in second.routes if getattr(route, "path", None) == "/env/ping"]
+    assert first_ping is not second_ping
+    assert first_ping.dependant is second_ping.dependant
+
+
+def test_pydantic_models_are_created_on_first_use():
+    assert "Notice_Pydantic" not in vars(app_models)
+    notice_model = app_models.Notice_Pydantic
+    assert vars(app_models)["Notice_Pydantic"] is notice_model
+    assert "title" in notice_model.model_fields
@@ -0,0 +1,71 @@
+import logging
+
+import pytest
+from starlette.testclient import TestClient
+
+import application.main
+from application.config import get_settings
+from application.db.app_models import User, UserRole
+from application.db.tracing import (QueryTraceMiddleware, normalize,
+                                    params_shape)
+from application.main import create_application
+from application.metrics import MetricsMiddleware
+
+
+@pytest.fixture(scope="function")
+def traced_app(test_database, monkeypatch, caplog):
+    settings = test_database.settings(query_trace=True, slow_query_ms=0, n_plus_one_threshold=3)
+    monkeypatch.setattr(application.main, "get_settings", lambda: settings)
+    app = create_application()
+    app.dependency_overrides[get_settings] = lambda: settings
+
+    @app.get("/loop/{count}")
+    async def loop(count: int):
+        # one query per user, the pattern the tracer looks for
+        return [(await User.get(username=f"tracer{number}")).id for number in range(count)]
+
+    test_database.init(app, settings)
+    caplog.set_level(logging.WARNING, logger="uvicorn")
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def n_plus_one_warnings(caplog):
+    return [record.getMessage() for record in caplog.records if record.getMessage().startswith("Possible N+1")]
+
+
+def test_repeated_statements_are_reported_with_the_route(traced_app, caplog, seed):
+    seed.into(traced_app).users(*(f"tracer{number}" for number in range(5)), role=UserRole.TEACHER)
+
+    assert traced_app.get("/loop/3").status_code == 200
+    assert n_plus_one_warnings(caplog) == []
+
+    assert traced_app.get("/loop/5").status_code == 200
+    [warning] = n_plus_one_warnings(caplog)
+    assert warning.startswith("Possible N+1 in GET /loop/{count}: statement sent 5 times")
+    assert warning.endswith('FROM "users" WHERE "username"=? LIMIT ?')
+
+
+def test_slow_queries_are_logged_without_their_values(traced_app, caplog, seed, login_as):
+    [teacher] = seed.into(traced_app).users("tracer0", role=UserRole.TEACHER)
+    login_as(teacher, traced_app)
+
+    traced_app.get("/assignment/teacher/assignments")
+    slow = [record.getMessage() for record in caplog.records if record.getMessage().startswith("Slow query")]
+    assert slow and all(" in GET /assignment/teacher/assignments, params " in message for message in slow)
+    assert "tracer0" not in "".join(slow)
+
+
+def test_metrics_stay_the_outermost_middleware(test_database, monkeypatch):
+    settings = test_database.settings(query_trace=True, metrics_enabled=True)
+    monkeypatch.setattr(application.main, "get_settings", lambda: settings)
+    app = create_application()
+    # the last one added is first in the list and runs outermost
+    assert [middleware.cls for middleware in app.user_middleware[:2]] == [MetricsMiddleware, QueryTraceMiddleware]
+
+
+def test_normalize_and_params_shape():
+    assert normalize("SELECT * FROM t WHERE id=12 AND name='o''neil'  LIMIT 1") == "SELECT * FROM t WHERE id=? AND name=? LIMIT ?"
+    assert params_shape(["a", 1, None]) == "(str, int, NoneType)"
+    assert params_shape([[1, "a"], [2, "b"]]) == "2 x (int, str)"
+    assert params_shape(None) == "()"
@@ -0,0 +1,55 @@
+from application.api.auth import decode_token
+
+
+def register_and_login(client, username, first_name, role="student"):
+    data = {
+        "first_name": first_name,
+        "last_name": "Searchable",
+        "username": username,
+        "email": f"{username.lower()}@search.com",
+        "password": "StrongPass1!",
+        "role": role,
+    }
+    client.post("/auth/register-user/", json=data)
+    response = client.post("/auth/login/", json={"username": username, "password": "StrongPass1!"})
+    client.cookies.set("access_token", response.cookies["access_token"])
+    return response.cookies["access_token"]
+
+
+def test_search_users_page_follows_cursor(test_app_with_db):
+    register_and_login(test_app_with_db, "PagerOne01", "Zed")
+    register_and_login(test_app_with_db, "xPagerTwo02", "Pager")
+    register_and_login(test_app_with_db, "zPagerThree03", "Ann")
+
+    first = test_app_with_db.get("/users/search/page/", params={"q": "pager", "limit": 2}).json()
+    # username prefix matches rank above first name prefix matches, which rank above plain substrings
+    assert [user["username"] for user in first["results"]] == ["PagerOne01", "xPagerTwo02"]
+    assert first["next_cursor"]
+
+    second = test_app_with_db.get("/users/search/page/", params={"q": "pager", "limit": 2, "cursor": first["next_cursor"]}).json()
+    assert [user["username"] for user in second["results"]] == ["zPagerThree03"]
+    assert second["next_cursor"] is None
+
+
+def test_search_users_page_rejects_bad_cursor(test_app_with_db):
+    register_and_login(test_app_with_db, "CursorUser01", "Cursor")
+    response = test_app_with_db.get("/users/search/page/", params={"q": "x", "cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_profile_is_served_with_etag_and_invalidated_on_update(test_app_with_db):
+    token = register_and_login(test_app_with_db, "EtagUser01", "Etag")
+
+    first = test_app_with_db.get("/users/")
+    etag = first.headers["etag"]
+    assert test_app_with_db.get("/users/", headers={"If-None-Match": etag}).status_code == 304
+
+    user_id = decode_token(token)["user_id"]
+    update = {"first_name": "Changed", "last_name": "Searchable", "username": "EtagUser01", "email": "etaguser01@search.com",
+              "profile_picture": None, "role": "student"}
+    assert test_app_with_db.patch(f"/users/{user_id}/profile", json=update).status_code == 200
+
+    response = test_app_with_db.get("/users/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["first_name"] == "Changed"
+    assert response.headers["etag"] != etag
@@ -0,0 +1,36 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from application.utils import HashingPool, check_password, hash_password
+
+
+def test_hashing_pool_rejects_when_saturated():
+    pool = HashingPool(workers=1, max_queue=1)
+
+    async def burst():
+        return await asyncio.gather(*(pool.run(time.sleep, 0.05) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(burst())
+    pool.shutdown()
+
+    rejected = [result for result in results if isinstance(result, HTTPException)]
+    assert len(rejected) == 1
+    assert rejected[0].status_code == 503
+    assert rejected[0].headers["Retry-After"] == "1"
+    assert pool.stats()["completed"] == 2
+    assert pool.stats()["rejected"] == 1
+
+
+def test_hashing_pool_process_kind():
+    pool = HashingPool(workers=1, kind="process")
+    hashed = asyncio.run(pool.run(hash_password, "StrongPass1!"))
+    assert asyncio.run(pool.run(check_password, "StrongPass1!", hashed))
+    pool.shutdown()
+
+
+def test_hashing_pool_rejects_unknown_kind():
+    with pytest.raises(ValueError):
+        HashingPool(kind="fiber")